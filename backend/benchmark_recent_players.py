@@ -0,0 +1,164 @@
+"""
+Benchmark for GET /api/network/recent-players.
+
+Seeds a scratch database with one court and N public players checked in at it,
+then compares the legacy per-player lookup loop with the batched handler:
+MongoDB commands issued and wall time per full listing.
+
+Usage (from backend/, with MONGO_URL pointing at a MongoDB server):
+    python benchmark_recent_players.py
+
+Everything is written to "<DB_NAME>_bench", which is dropped afterwards.
+"""
+import asyncio
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+
+from dotenv import load_dotenv
+from pymongo import monitoring
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts database commands, ignoring connection handshakes"""
+    IGNORED = {"hello", "isMaster", "ismaster", "ping", "endSessions", "saslStart", "saslContinue"}
+
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        if event.command_name not in self.IGNORED:
+            self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+counter = CommandCounter()
+monitoring.register(counter)  # must be registered before server creates its client
+load_dotenv(Path(__file__).parent / '.env')
+os.environ["DB_NAME"] = os.environ.get("DB_NAME", "basketball_app") + "_bench"
+
+import server  # noqa: E402
+from bson import ObjectId  # noqa: E402
+from fastapi import Response  # noqa: E402
+
+PLAYER_COUNTS = [10, 100, 1000]
+RUNS = 5
+
+
+async def legacy_recent_players(user_id: str) -> list:
+    """The pre-batching handler body: one user and one friendship lookup per player"""
+    db = server.db
+    current_user = await db.users.find_one({"_id": ObjectId(user_id)})
+    court = await db.courts.find_one({"_id": ObjectId(current_user["currentCourtId"])})
+    players = []
+    for player_id in court.get("publicUsersAtCourt", []):
+        if player_id == user_id:
+            continue
+        player = await db.users.find_one({"_id": ObjectId(player_id)})
+        if player:
+            friendship = await db.friend_requests.find_one({
+                "$or": [
+                    {"fromUserId": ObjectId(user_id), "toUserId": player["_id"]},
+                    {"fromUserId": player["_id"], "toUserId": ObjectId(user_id)}
+                ],
+                "status": "accepted"
+            })
+            players.append({
+                "id": str(player["_id"]),
+                "username": player["username"],
+                "profilePic": player.get("profilePic"),
+                "isConnected": friendship is not None
+            })
+    return players
+
+
+async def batched_recent_players(authorization: str) -> list:
+    """Walks every page of the current handler"""
+    players = []
+    cursor = None
+    while True:
+        response = Response()
+        players += await server.get_recent_players(response, cursor, server.MAX_PAGE_SIZE, authorization)
+        cursor = response.headers.get(server.NEXT_CURSOR_HEADER)
+        if not cursor:
+            return players
+
+
+async def seed(player_count: int) -> str:
+    db = server.db
+    for collection in ("users", "courts", "friend_requests", "connections", "checkins"):
+        await db[collection].delete_many({})
+
+    court_id = (await db.courts.insert_one({
+        "name": "Benchmark Court",
+        "currentPlayers": 0,
+        "publicUsersAtCourt": []
+    })).inserted_id
+    viewer_id = (await db.users.insert_one({
+        "username": "viewer",
+        "isPublic": True,
+        "currentCourtId": str(court_id)
+    })).inserted_id
+
+    players = [{
+        "username": f"player{i}",
+        "isPublic": True,
+        "currentCourtId": str(court_id)
+    } for i in range(player_count)]
+    player_ids = (await db.users.insert_many(players)).inserted_ids
+
+    # Every third player is already connected to the viewer
+    await db.friend_requests.insert_many([{
+        "fromUserId": viewer_id,
+        "toUserId": player_id,
+        "status": "accepted",
+        "timestamp": datetime.utcnow()
+    } for player_id in player_ids[::3]])
+    for player_id in player_ids[::3]:
+        await server.add_connection(viewer_id, player_id)
+
+    at_court = [str(viewer_id)] + [str(player_id) for player_id in player_ids]
+    await db.courts.update_one(
+        {"_id": court_id},
+        {"$set": {"publicUsersAtCourt": at_court, "currentPlayers": len(at_court)}}
+    )
+    return str(viewer_id)
+
+
+async def measure(call) -> tuple:
+    result = await call()  # warm-up (fills the user cache for the batched handler)
+    counter.count = 0
+    started = time.perf_counter()
+    for _ in range(RUNS):
+        await call()
+    elapsed = time.perf_counter() - started
+    return len(result), counter.count / RUNS, elapsed / RUNS * 1000
+
+
+async def main():
+    print(f"{'players':>8} {'handler':>8} {'rows':>6} {'queries':>8} {'ms':>9}")
+    try:
+        for player_count in PLAYER_COUNTS:
+            viewer_id = await seed(player_count)
+            server.user_cache.clear()
+            authorization = "Bearer " + server.create_access_token({"user_id": viewer_id})
+
+            for name, call in (
+                ("legacy", lambda: legacy_recent_players(viewer_id)),
+                ("batched", lambda: batched_recent_players(authorization)),
+            ):
+                rows, queries, ms = await measure(call)
+                print(f"{player_count:>8} {name:>8} {rows:>6} {queries:>8.1f} {ms:>9.1f}")
+    finally:
+        await server.client.drop_database(os.environ["DB_NAME"])
+        server.client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
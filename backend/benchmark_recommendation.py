@@ -0,0 +1,114 @@
+"""
+Benchmark for GET /api/courts/predict/recommended candidate generation.
+
+Builds the nationwide court catalog from initialize_nationwide_courts (optionally
+replicated with jitter to simulate a larger catalog) and, for callers in a few
+cities, compares scoring the whole catalog with scoring only the geohash-bucket
+candidates near the caller. Reports the courts scored, the LLM prompt size (the
+"full" rows show the original prompt, which embedded every court) and the
+end-to-end handler latency with the catalog cached, both computing every
+recommendation and served from the recommendation cache. No database or API
+keys are needed.
+
+Usage (from backend/):
+    python benchmark_recommendation.py [--scale 10]
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+
+from bson import ObjectId
+
+import server
+from initialize_nationwide_courts import generate_courts
+
+RUNS = 200
+CALLERS = {
+    "Houston, TX": (29.7604, -95.3698),
+    "Los Angeles, CA": (34.0522, -118.2437),
+    "Billings, MT": (45.7833, -108.5007),
+    "Rural Nevada": (39.5, -116.5),
+}
+
+
+def load_courts(scale: int) -> list:
+    courts = asyncio.run(generate_courts())
+    rng = random.Random(0)
+    catalog = []
+    for copy in range(scale):
+        for court in courts:
+            jitter = 0 if copy == 0 else 0.05
+            catalog.append({
+                **court,
+                "_id": ObjectId(),
+                "latitude": court["latitude"] + rng.uniform(-jitter, jitter),
+                "longitude": court["longitude"] + rng.uniform(-jitter, jitter),
+            })
+    return catalog
+
+
+def legacy_prompt_size(courts: list) -> int:
+    """Size of the per-court data the original endpoint embedded in its prompt"""
+    return len(str([{
+        "name": court["name"],
+        "address": court["address"],
+        "currentPlayers": court.get("currentPlayers", 0),
+        "averagePlayers": court.get("averagePlayers", 12),
+        "rating": court["rating"],
+        "socialMediaScore": 50,
+        "lastPostMinutesAgo": 60
+    } for court in courts]))
+
+
+async def time_handler(latitude: float, longitude: float) -> tuple:
+    """(response, ms per request computing it, ms per request served from the recommendation cache)"""
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        server.recommendation_cache.results.clear()
+        response = await server.get_recommended_court(latitude, longitude)
+    computed_ms = (time.perf_counter() - start) / RUNS * 1000
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        await server.get_recommended_court(latitude, longitude)
+    return response, computed_ms, (time.perf_counter() - start) / RUNS * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=int, default=1, help="replicate the nationwide catalog this many times")
+    args = parser.parse_args()
+
+    # Local ranking only: no weather lookups or LLM calls
+    os.environ.pop("OPENWEATHER_API_KEY", None)
+    server.RECOMMENDATION_LLM_RERANK = False
+
+    courts = load_courts(args.scale)
+    catalog = server.CourtCatalog(sorted(courts, key=lambda court: court["_id"]))
+    server.court_catalog_cache.set("catalog", catalog, ttl=3600)
+    server.court_catalog_checked_at = float("inf")  # skip version checks
+    server.court_profile_cache.set("profiles", {}, ttl=3600)  # no occupancy history: priors only
+    print(f"{len(courts)} courts, radius {server.RECOMMENDATION_RADIUS_KM:g} km, "
+          f"at most {server.RECOMMENDATION_MAX_COURTS} candidates")
+    print(f"{'caller':<16} {'mode':<10} {'scored':>7} {'prompt bytes':>13} {'handler ms':>11} {'cached ms':>10}")
+
+    prefilter = (server.RECOMMENDATION_RADIUS_KM, server.RECOMMENDATION_MAX_COURTS)
+    for caller, (latitude, longitude) in CALLERS.items():
+        for mode, (radius_km, max_courts) in (("full", (float("inf"), len(courts))), ("prefilter", prefilter)):
+            server.RECOMMENDATION_RADIUS_KM, server.RECOMMENDATION_MAX_COURTS = radius_km, max_courts
+            # Occupancy is re-read every few seconds in production; keep one snapshot here
+            occupancy = {court["_id"]: random.randint(0, 10) for court in courts}
+            server.court_occupancy_cache.set("occupancy", occupancy, ttl=3600)
+            response, handler_ms, cached_ms = asyncio.run(time_handler(latitude, longitude))
+            scored = len(catalog.scoring.candidates(latitude, longitude, radius_km, max_courts))
+            if mode == "full":
+                prompt_bytes = legacy_prompt_size(courts)
+            else:
+                prompt_bytes = len(server.recommendation_prompt(response["candidates"], None, response["timeContext"]))
+            print(f"{caller:<16} {mode:<10} {scored:>7} {prompt_bytes:>13} {handler_ms:>11.3f} {cached_ms:>10.3f}")
+    server.RECOMMENDATION_RADIUS_KM, server.RECOMMENDATION_MAX_COURTS = prefilter
+
+
+if __name__ == "__main__":
+    main()
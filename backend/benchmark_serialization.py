@@ -0,0 +1,129 @@
+"""
+Microbenchmark for response serialization on the hot list endpoints.
+
+For synthetic payloads shaped like each endpoint's output, compares the default
+FastAPI path (jsonable_encoder + stdlib json, as JSONResponse renders it) with
+the fast path (dumps_json, orjson when installed) and, for GET /api/courts, the
+cached per-court fragments. No database is needed.
+
+Usage (from backend/):
+    python benchmark_serialization.py
+"""
+import json
+import timeit
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+
+import server
+
+RUNS = 50
+
+
+def fastapi_default(content) -> bytes:
+    """What FastAPI does for a handler returning plain dicts"""
+    return json.dumps(
+        jsonable_encoder(content),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":")
+    ).encode()
+
+
+def sample_courts(count: int) -> list:
+    return [{
+        "_id": ObjectId(),
+        "name": f"Court {i}",
+        "address": f"{i} Main St, Houston, TX 77002",
+        "latitude": 29.76 + i * 0.001,
+        "longitude": -95.36 - i * 0.001,
+        "hours": "6:00 am - 10:00 pm",
+        "phoneNumber": "713-555-0100",
+        "rating": 4.5,
+        "currentPlayers": i % 12,
+        "averagePlayers": 12,
+        "image": None
+    } for i in range(count)]
+
+
+def sample_messages(count: int) -> list:
+    now = datetime.utcnow()
+    sender, recipient = ObjectId(), ObjectId()
+    return [{
+        "id": str(ObjectId()),
+        "fromUserId": str(sender),
+        "toUserId": str(recipient),
+        "message": f"See you at the court at {i % 12 + 1}pm?",
+        "timestamp": now - timedelta(seconds=i),
+        "read": i % 3 == 0
+    } for i in range(count)]
+
+
+def sample_conversations(count: int) -> list:
+    now = datetime.utcnow()
+    return [{
+        "userId": str(ObjectId()),
+        "username": f"player{i}",
+        "profilePic": None,
+        "lastMessage": "Running it back tomorrow",
+        "timestamp": now - timedelta(minutes=i),
+        "unreadCount": i % 4
+    } for i in range(count)]
+
+
+def sample_players(count: int) -> list:
+    return [{
+        "id": str(ObjectId()),
+        "username": f"player{i}",
+        "profilePic": None,
+        "isConnected": i % 3 == 0
+    } for i in range(count)]
+
+
+def time_ms(fn) -> float:
+    return timeit.timeit(fn, number=RUNS) / RUNS * 1000
+
+
+def main():
+    print(f"JSON encoder for fast path: {'orjson' if server.orjson else 'stdlib json'}")
+    print(f"{'endpoint':<34} {'items':>6} {'default ms':>11} {'fast ms':>9} {'speedup':>8}")
+
+    courts = sample_courts(1000)
+    catalog = server.CourtCatalog(courts)
+    occupancy = {court["_id"]: court["currentPlayers"] for court in courts}
+
+    def courts_default():
+        return fastapi_default([server.court_to_dict(court) for court in courts])
+
+    def courts_cached():
+        return b"[" + b",".join(
+            server.court_json(catalog.fragments[court_id], occupancy[court_id]) for court_id in catalog.ids
+        ) + b"]"
+
+    cases = [
+        ("GET /api/courts (cached catalog)", len(courts), courts_default, courts_cached),
+    ]
+    for name, payload in (
+        ("GET /api/courts/nearby", [server.court_to_dict(court) for court in courts[:200]]),
+        ("GET /api/messages/{id}", sample_messages(200)),
+        ("GET /api/messages/conversations", sample_conversations(50)),
+        ("GET /api/network/recent-players", sample_players(200)),
+    ):
+        cases.append((
+            name,
+            len(payload),
+            lambda payload=payload: fastapi_default(payload),
+            lambda payload=payload: server.dumps_json(payload)
+        ))
+
+    for name, items, default, fast in cases:
+        assert json.loads(default()) == json.loads(fast()), name
+        default_ms = time_ms(default)
+        fast_ms = time_ms(fast)
+        print(f"{name:<34} {items:>6} {default_ms:>11.3f} {fast_ms:>9.3f} {default_ms / fast_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+"""
+Court catalog versioning shared by the API server and the court maintenance scripts.
+
+API workers cache the static court catalog in memory and compare the version
+stored here every few seconds; any process that inserts, edits or deletes
+courts bumps it so every worker reloads.
+"""
+
+COURT_CATALOG_VERSION_ID = "courtCatalog"
+
+
+async def read_court_catalog_version(db) -> int:
+    doc = await db.meta.find_one({"_id": COURT_CATALOG_VERSION_ID})
+    return doc.get("version", 0) if doc else 0
+
+
+async def bump_court_catalog_version(db):
+    await db.meta.update_one(
+        {"_id": COURT_CATALOG_VERSION_ID},
+        {"$inc": {"version": 1}},
+        upsert=True
+    )
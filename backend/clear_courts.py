@@ -1,6 +1,7 @@
 import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+from catalog import bump_court_catalog_version
 
 async def clear_courts():
     mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
@@ -10,6 +11,7 @@ async def clear_courts():
     db = client[db_name]
     result = await db.courts.delete_many({})
     print(f"Deleted {result.deleted_count} courts from database")
+    await bump_court_catalog_version(db)
     client.close()
 
 asyncio.run(clear_courts())
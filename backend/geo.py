@@ -0,0 +1,124 @@
+"""
+Geospatial helpers shared by the API server and the court seeding scripts.
+"""
+
+GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Precision stored on court documents (~5m cells); coarser cells are prefixes
+GEOHASH_PRECISION = 9
+
+# Center of each major city seeded by initialize_nationwide_courts (its first court
+# location), for per-city work in the API such as weather prefetching
+MAJOR_CITY_CENTERS = {
+    "Houston, TX": (29.7604, -95.3698),
+    "Los Angeles, CA": (33.985, -118.4695),
+    "New York, NY": (40.8303, -73.9389),
+    "Chicago, IL": (41.7753, -87.5842),
+    "Phoenix, AZ": (33.4777, -112.0921),
+    "Philadelphia, PA": (39.9063, -75.1764),
+    "San Antonio, TX": (29.4241, -98.4936),
+    "San Diego, CA": (32.7157, -117.1611),
+    "Dallas, TX": (32.7767, -96.797),
+    "San Jose, CA": (37.3382, -121.8863),
+    "Austin, TX": (30.2672, -97.7431),
+    "Jacksonville, FL": (30.3322, -81.6557),
+    "Fort Worth, TX": (32.7555, -97.3308),
+    "Columbus, OH": (39.9771, -83.0027),
+    "Charlotte, NC": (35.1944, -80.8306),
+    "San Francisco, CA": (37.7694, -122.4542),
+    "Indianapolis, IN": (39.7348, -86.148),
+    "Seattle, WA": (47.6803, -122.3295),
+    "Denver, CO": (39.747, -104.9506),
+    "Boston, MA": (42.3551, -71.0656),
+    "El Paso, TX": (31.7619, -106.485),
+    "Nashville, TN": (36.1494, -86.8131),
+    "Detroit, MI": (42.3407, -82.9858),
+    "Portland, OR": (45.5696, -122.6758),
+    "Las Vegas, NV": (36.0688, -115.1197),
+    "Oklahoma City, OK": (35.4676, -97.5164),
+    "Memphis, TN": (35.1495, -90.049),
+    "Louisville, KY": (38.2619, -85.7407),
+    "Milwaukee, WI": (43.0614, -87.8768),
+    "Albuquerque, NM": (35.0745, -106.6274),
+    "Tucson, AZ": (32.2226, -110.9747),
+    "Fresno, CA": (36.7378, -119.7871),
+    "Mesa, AZ": (33.4152, -111.8315),
+    "Sacramento, CA": (38.5816, -121.4944),
+    "Atlanta, GA": (33.7865, -84.3733),
+    "Kansas City, MO": (38.9967, -94.5283),
+    "Miami, FL": (25.7742, -80.1867),
+    "Raleigh, NC": (35.7796, -78.6382),
+    "Omaha, NE": (41.2565, -95.9345),
+    "Long Beach, CA": (33.7701, -118.1937),
+    "Virginia Beach, VA": (36.8529, -75.978),
+}
+
+
+def court_location(latitude: float, longitude: float) -> dict:
+    """GeoJSON point for a court (GeoJSON orders coordinates lon, lat)"""
+    return {"type": "Point", "coordinates": [longitude, latitude]}
+
+
+def encode_geohash(latitude: float, longitude: float, precision: int = GEOHASH_PRECISION) -> str:
+    """Standard base32 geohash of a coordinate"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # geohash interleaves bits starting with longitude
+
+    while len(chars) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if longitude >= mid:
+                bits = (bits << 1) | 1
+                lon_range[0] = mid
+            else:
+                bits = bits << 1
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits = bits << 1
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+
+        if bit_count == 5:
+            chars.append(GEOHASH_BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return "".join(chars)
+
+
+def decode_geohash(geohash: str) -> tuple:
+    """(latitude, longitude) of the center of a geohash cell"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+
+    for char in geohash:
+        bits = GEOHASH_BASE32.index(char)
+        for shift in range(4, -1, -1):
+            value_range = lon_range if even else lat_range
+            mid = (value_range[0] + value_range[1]) / 2
+            if (bits >> shift) & 1:
+                value_range[0] = mid
+            else:
+                value_range[1] = mid
+            even = not even
+
+    return (lat_range[0] + lat_range[1]) / 2, (lon_range[0] + lon_range[1]) / 2
+
+
+def court_geo_fields(latitude: float, longitude: float) -> dict:
+    """Precomputed geo fields stored on every court document"""
+    return {
+        "location": court_location(latitude, longitude),
+        "geohash": encode_geohash(latitude, longitude),
+    }
@@ -0,0 +1,130 @@
+"""
+Profile image storage: pluggable blob stores and thumbnail generation.
+
+Images are immutable - a new upload gets a new id - so every object is stored
+under "<image id>/<variant>" and thumbnails can be cached by clients forever.
+"""
+import asyncio
+import io
+import re
+import shutil
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Optional
+
+from gridfs.errors import NoFile
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Square thumbnails generated once at upload, keyed by the size name used in URLs
+THUMBNAIL_SIZES = {"small": 64, "medium": 256, "large": 512}
+THUMBNAIL_CONTENT_TYPE = "image/jpeg"
+THUMBNAIL_QUALITY = 85
+
+# Reject decompression bombs before decoding pixel data
+MAX_IMAGE_PIXELS = 40_000_000
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def make_thumbnails(data: bytes) -> dict:
+    """Center-cropped JPEG thumbnails for every size in THUMBNAIL_SIZES (CPU bound - run off the event loop)"""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if image.width * image.height > MAX_IMAGE_PIXELS:
+                raise InvalidImage("Image dimensions are too large")
+            image = ImageOps.exif_transpose(image)
+            if image.mode in ("RGBA", "LA", "P"):
+                # JPEG has no alpha channel - flatten transparent areas onto white
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel("A"))
+                image = background
+            else:
+                image = image.convert("RGB")
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise InvalidImage(f"Unsupported or corrupt image: {str(e)}")
+
+    thumbnails = {}
+    for name, size in THUMBNAIL_SIZES.items():
+        thumbnail = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        output = io.BytesIO()
+        thumbnail.save(output, format="JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+        thumbnails[name] = output.getvalue()
+    return thumbnails
+
+
+class ImageStore(ABC):
+    """Blob store for image variants; implementations must be safe to share across requests"""
+    @abstractmethod
+    async def put(self, name: str, data: bytes):
+        ...
+
+    @abstractmethod
+    async def get(self, name: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    async def delete(self, image_id: str):
+        """Remove every variant stored for image_id"""
+
+
+class GridFSImageStore(ImageStore):
+    """Stores images in a GridFS bucket of the application database"""
+    def __init__(self, db, bucket_name: str = "images"):
+        self.bucket = AsyncIOMotorGridFSBucket(db, bucket_name=bucket_name)
+
+    async def put(self, name: str, data: bytes):
+        await self.bucket.upload_from_stream(name, data)
+
+    async def get(self, name: str) -> Optional[bytes]:
+        try:
+            stream = await self.bucket.open_download_stream_by_name(name)
+        except NoFile:
+            return None
+        return await stream.read()
+
+    async def delete(self, image_id: str):
+        cursor = self.bucket.find({"filename": {"$regex": f"^{re.escape(image_id)}/"}})
+        async for grid_out in cursor:
+            await self.bucket.delete(grid_out._id)
+
+
+class FileSystemImageStore(ImageStore):
+    """Stores images as files under root/<image id>/<variant>"""
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def path(self, name: str) -> Path:
+        path = (self.root / name).resolve()
+        if self.root.resolve() not in path.parents:
+            raise ValueError(f"Invalid image name: {name}")
+        return path
+
+    async def put(self, name: str, data: bytes):
+        path = self.path(name)
+
+        def write():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+
+        await asyncio.to_thread(write)
+
+    async def get(self, name: str) -> Optional[bytes]:
+        try:
+            return await asyncio.to_thread(self.path(name).read_bytes)
+        except FileNotFoundError:
+            return None
+
+    async def delete(self, image_id: str):
+        await asyncio.to_thread(shutil.rmtree, self.path(image_id), True)
+
+
+def create_image_store(backend: str, db, path: str) -> ImageStore:
+    if backend == "gridfs":
+        return GridFSImageStore(db)
+    if backend == "filesystem":
+        return FileSystemImageStore(path)
+    raise RuntimeError(f"Unknown IMAGE_STORE_BACKEND: {backend}")
@@ -11,6 +11,8 @@ import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 from dotenv import load_dotenv
+from geo import court_geo_fields
+from catalog import bump_court_catalog_version
 
 load_dotenv()
 
@@ -503,9 +505,12 @@ async def main():
     courts = await generate_courts()
     
     print(f"Generated {len(courts)} courts")
+    for court in courts:
+        court.update(court_geo_fields(court["latitude"], court["longitude"]))
     print("Inserting into MongoDB...")
     
     await db.courts.insert_many(courts)
+    await bump_court_catalog_version(db)
     
     print(f"✅ Successfully initialized {len(courts)} basketball courts nationwide!")
     
@@ -0,0 +1,222 @@
+"""
+Vectorized court scoring for recommendations.
+
+Every factor is normalized to 0..1 and computed as a NumPy array over the
+candidate courts; the score is their weighted sum. Candidates near the caller
+are found through geohash buckets, so only a few cells are scanned no matter
+how large the catalog grows.
+"""
+import math
+import re
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+
+from geo import encode_geohash
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE_LATITUDE = 111.32
+
+# Courts are bucketed by geohash prefix; precision 4 cells are ~39 x 20 km
+CANDIDATE_CELL_PRECISION = 4
+
+# Weights of the normalized factors (sum to 1)
+SCORE_WEIGHTS = {
+    "distance": 0.30,
+    "currentPlayers": 0.25,
+    "expectedPlayers": 0.20,
+    "rating": 0.10,
+    "weather": 0.15,
+}
+
+# Distance score decays by 1/e every DISTANCE_SCALE_KM
+DISTANCE_SCALE_KM = 10.0
+# Player counts at which the player factors reach 0.5 (they saturate towards 1)
+CURRENT_PLAYERS_HALF = 5.0
+EXPECTED_PLAYERS_HALF = 8.0
+
+# Learned occupancy profiles have one slot per hour of the week (Monday 00:00 first)
+HOURS_PER_WEEK = 7 * 24
+# Weeks of history after which a learned profile fully replaces the prior
+PROFILE_FULL_WEIGHT_WEEKS = 4.0
+
+# Share of a court's average crowd present at each hour of the day, used as the
+# prior for courts without enough occupancy history
+WEEKDAY_HOUR_ACTIVITY = np.array([
+    0.05, 0.03, 0.02, 0.02, 0.02, 0.05, 0.15, 0.25, 0.30, 0.30, 0.35, 0.40,
+    0.45, 0.45, 0.45, 0.55, 0.70, 0.85, 0.95, 1.00, 0.90, 0.70, 0.40, 0.15
+])
+WEEKEND_HOUR_ACTIVITY = np.array([
+    0.08, 0.05, 0.03, 0.02, 0.02, 0.04, 0.10, 0.25, 0.45, 0.60, 0.75, 0.85,
+    0.90, 0.90, 0.90, 0.90, 0.90, 0.90, 0.85, 0.80, 0.70, 0.55, 0.35, 0.15
+])
+
+# OpenWeather "main" conditions that keep players off outdoor courts
+BAD_WEATHER_CONDITIONS = {"Rain", "Drizzle", "Thunderstorm", "Snow", "Squall", "Tornado"}
+INDOOR_WEATHER_SCORE = 0.8
+
+# Court names that indicate an indoor facility
+INDOOR_NAME_PATTERN = re.compile(
+    r"\b(gym|gymnasium|ymca|ywca|rec(reation)? center|community center|sports center|"
+    r"fieldhouse|arena|indoor|athletic club|fitness)\b",
+    re.IGNORECASE
+)
+
+
+def activity_prior(now: datetime) -> float:
+    """Expected share of a court's average crowd at this hour"""
+    hours = WEEKEND_HOUR_ACTIVITY if now.weekday() >= 5 else WEEKDAY_HOUR_ACTIVITY
+    return float(hours[now.hour])
+
+
+def weekly_slot(moment: datetime) -> int:
+    """Index of moment's hour in a HOURS_PER_WEEK profile"""
+    return moment.weekday() * 24 + moment.hour
+
+
+def blend_expected_players(prior: np.ndarray, learned: np.ndarray, weeks_observed: np.ndarray) -> np.ndarray:
+    """Move from the prior to the learned expectation as a court accumulates weeks of history"""
+    weight = np.clip(weeks_observed / PROFILE_FULL_WEIGHT_WEEKS, 0.0, 1.0)
+    return weight * learned + (1 - weight) * prior
+
+
+def outdoor_weather_score(condition: Optional[str], temperature: Optional[float]) -> float:
+    if condition is None:
+        return INDOOR_WEATHER_SCORE  # unknown weather: no preference
+    score = 0.15 if condition in BAD_WEATHER_CONDITIONS else 1.0
+    if temperature is not None:
+        if temperature < 45 or temperature > 95:
+            score *= 0.4
+        elif temperature < 55 or temperature > 88:
+            score *= 0.75
+    return score
+
+
+def geohash_cell_size(precision: int) -> tuple:
+    """(latitude, longitude) extent in degrees of a geohash cell"""
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def geohash_cells_around(latitude: float, longitude: float, radius_km: float, precision: int) -> Optional[list]:
+    """
+    Geohash cells covering the bounding box of a circle, or None when the circle
+    spans more than a hemisphere of longitude (callers should scan everything)
+    """
+    cell_lat, cell_lon = geohash_cell_size(precision)
+    delta_lat = radius_km / KM_PER_DEGREE_LATITUDE
+    delta_lon = radius_km / (KM_PER_DEGREE_LATITUDE * max(math.cos(math.radians(latitude)), 0.01))
+    if delta_lon >= 180:
+        return None
+
+    rows = 180.0 / cell_lat
+    columns = 360.0 / cell_lon
+    first_row = max(int((latitude - delta_lat + 90) // cell_lat), 0)
+    last_row = min(int((latitude + delta_lat + 90) // cell_lat), int(rows) - 1)
+    first_column = int((longitude - delta_lon + 180) // cell_lon)
+    last_column = int((longitude + delta_lon + 180) // cell_lon)
+    cells = []
+    for row in range(first_row, last_row + 1):
+        for column in range(first_column, last_column + 1):
+            # Encode each cell's center; columns wrap around the antimeridian
+            cells.append(encode_geohash(
+                (row + 0.5) * cell_lat - 90,
+                ((column % columns) + 0.5) * cell_lon - 180,
+                precision
+            ))
+    return cells
+
+
+def haversine_km(latitudes: np.ndarray, longitudes: np.ndarray, latitude: float, longitude: float) -> np.ndarray:
+    """Great-circle distances (km) from one point to arrays of coordinates in radians"""
+    lat, lon = np.radians(latitude), np.radians(longitude)
+    a = (
+        np.sin((latitudes - lat) / 2) ** 2
+        + np.cos(lat) * np.cos(latitudes) * np.sin((longitudes - lon) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class CourtScoringIndex:
+    """Column arrays over the court catalog, built once per catalog load"""
+    def __init__(self, courts: list):
+        self.ids = [court["_id"] for court in courts]
+        self.positions = {court_id: i for i, court_id in enumerate(self.ids)}
+        self.names = [court["name"] for court in courts]
+        self.latitudes = np.radians(np.array([court["latitude"] for court in courts], dtype=float))
+        self.longitudes = np.radians(np.array([court["longitude"] for court in courts], dtype=float))
+        self.ratings = np.array([court.get("rating") or 0 for court in courts], dtype=float)
+        self.average_players = np.array([court.get("averagePlayers", 12) for court in courts], dtype=float)
+        self.indoor = np.array([bool(INDOOR_NAME_PATTERN.search(court["name"])) for court in courts], dtype=bool)
+        cells = {}
+        for i, court in enumerate(courts):
+            cell = encode_geohash(court["latitude"], court["longitude"], CANDIDATE_CELL_PRECISION)
+            cells.setdefault(cell, []).append(i)
+        self.cells = {cell: np.array(indices) for cell, indices in cells.items()}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def candidates(self, latitude: float, longitude: float, radius_km: float, max_courts: int) -> np.ndarray:
+        """
+        Indices of the nearest max_courts courts within radius_km, nearest first.
+        When nothing is in range the nearest courts anywhere are returned instead.
+        """
+        cells = geohash_cells_around(latitude, longitude, radius_km, CANDIDATE_CELL_PRECISION)
+        if cells is None or len(cells) >= len(self.cells):
+            indices = np.arange(len(self))
+        else:
+            buckets = [self.cells[cell] for cell in cells if cell in self.cells]
+            indices = np.concatenate(buckets) if buckets else np.array([], dtype=int)
+        distances = haversine_km(self.latitudes[indices], self.longitudes[indices], latitude, longitude)
+        in_range = distances <= radius_km
+        if not in_range.any():
+            indices = np.arange(len(self))
+            distances = haversine_km(self.latitudes, self.longitudes, latitude, longitude)
+        else:
+            indices, distances = indices[in_range], distances[in_range]
+        return indices[top_k(-distances, max_courts)]
+
+    def score(
+        self,
+        current_players: np.ndarray,
+        expected_players: np.ndarray,
+        latitude: Optional[float],
+        longitude: Optional[float],
+        weather_condition: Optional[str],
+        temperature: Optional[float],
+        indices: Optional[np.ndarray] = None
+    ) -> dict:
+        """
+        Factor arrays and the combined "score" array for the courts at indices (all
+        courts when None); the player arrays must be aligned with the same indices
+        """
+        subset = slice(None) if indices is None else indices
+        if latitude is None or longitude is None:
+            distance_km = None
+            distance = np.ones(len(current_players))  # no location: distance doesn't discriminate
+        else:
+            distance_km = haversine_km(self.latitudes[subset], self.longitudes[subset], latitude, longitude)
+            distance = np.exp(-distance_km / DISTANCE_SCALE_KM)
+
+        factors = {
+            "distance": distance,
+            "currentPlayers": current_players / (current_players + CURRENT_PLAYERS_HALF),
+            "expectedPlayers": expected_players / (expected_players + EXPECTED_PLAYERS_HALF),
+            "rating": np.clip((self.ratings[subset] - 1) / 4, 0.0, 1.0),
+            "weather": np.where(
+                self.indoor[subset], INDOOR_WEATHER_SCORE, outdoor_weather_score(weather_condition, temperature)
+            ),
+        }
+        score = sum(SCORE_WEIGHTS[name] * values for name, values in factors.items())
+        return {**factors, "score": score, "distanceKm": distance_km}
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.array([], dtype=int)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
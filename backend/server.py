@@ -1,18 +1,46 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Header, status
+from fastapi import FastAPI, APIRouter, File, HTTPException, Header, Query, Request, Response, UploadFile, WebSocket, WebSocketDisconnect, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
+import asyncio
+import json
+import time
+import bisect
+import importlib.util
+import random
+import hashlib
+import tempfile
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr
 from typing import List, Optional
 import uuid
+import base64
+import binascii
+import re
 from datetime import datetime, timedelta
 from passlib.context import CryptContext
 import jwt
 from bson import ObjectId
+from bson.errors import InvalidId
 import httpx
+import numpy as np
+from pymongo import IndexModel, ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from geo import MAJOR_CITY_CENTERS, court_location, court_geo_fields, decode_geohash, encode_geohash
+from catalog import read_court_catalog_version, bump_court_catalog_version
+from scoring import (
+    BAD_WEATHER_CONDITIONS, HOURS_PER_WEEK, CourtScoringIndex, activity_prior, blend_expected_players,
+    top_k, weekly_slot
+)
+from images import THUMBNAIL_CONTENT_TYPE, THUMBNAIL_SIZES, InvalidImage, create_image_store, make_thumbnails
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -41,7 +69,15 @@ app = FastAPI()
 api_router = APIRouter(prefix="/api")
 
 # Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+# bcrypt is CPU-bound, so it runs on a bounded thread pool instead of the event loop.
+# Beyond workers + queue limit outstanding calls, requests are shed with a 503.
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '4'))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.environ.get('PASSWORD_HASH_QUEUE_LIMIT', '32'))
+PASSWORD_HASH_RETRY_AFTER_SECONDS = 2
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
 
 # JWT settings
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key')
@@ -58,6 +94,64 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+class LatencyRecorder:
+    """Call count plus latency percentiles over a window of recent samples (in ms)"""
+    def __init__(self, window: int = 500):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.max_ms = 0.0
+    
+    def record(self, seconds: float):
+        ms = seconds * 1000
+        self.samples.append(ms)
+        self.count += 1
+        self.max_ms = max(self.max_ms, ms)
+    
+    def stats(self) -> dict:
+        ordered = sorted(self.samples)
+        def percentile(p):
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 2) if ordered else None
+        return {
+            "count": self.count,
+            "p50Ms": percentile(0.50),
+            "p95Ms": percentile(0.95),
+            "maxMs": round(self.max_ms, 2)
+        }
+
+password_hash_latency = {"hash": LatencyRecorder(), "verify": LatencyRecorder()}
+password_hash_in_flight = 0
+password_hash_rejected = 0
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+async def run_password_task(kind: str, func, *args):
+    global password_hash_in_flight, password_hash_rejected
+    if password_hash_in_flight >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_LIMIT:
+        password_hash_rejected += 1
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy, please retry shortly",
+            headers={"Retry-After": str(PASSWORD_HASH_RETRY_AFTER_SECONDS)}
+        )
+    
+    password_hash_in_flight += 1
+    try:
+        loop = asyncio.get_running_loop()
+        result, elapsed = await loop.run_in_executor(password_executor, _timed, func, *args)
+        password_hash_latency[kind].record(elapsed)
+        return result
+    finally:
+        password_hash_in_flight -= 1
+
+async def hash_password_async(password: str) -> str:
+    return await run_password_task("hash", hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await run_password_task("verify", verify_password, plain_password, hashed_password)
+
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(hours=JWT_EXPIRATION_HOURS)
@@ -74,6 +168,325 @@ def verify_token(token: str) -> dict:
     except jwt.JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+class TTLCache:
+    """Small in-process LRU cache whose entries expire after `ttl` seconds"""
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return default
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+    
+    def set(self, key, value, ttl: Optional[float] = None):
+        self.entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+    
+    def peek(self, key, default=None):
+        """Like get, but without counting a lookup or refreshing LRU order"""
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return default
+        return entry[1]
+    
+    def items(self) -> list:
+        """(key, value) for every unexpired entry, without counting lookups or refreshing LRU order"""
+        now = time.monotonic()
+        return [(key, value) for key, (expires_at, value) in self.entries.items() if expires_at >= now]
+    
+    def pop(self, key):
+        self.entries.pop(key, None)
+    
+    def clear(self):
+        self.entries.clear()
+    
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRatio": round(self.hits / lookups, 4) if lookups else None
+        }
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one execution whose result they all share"""
+    def __init__(self):
+        self.in_flight = {}
+        self.coalesced = 0
+    
+    async def do(self, key, fn):
+        task = self.in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # A cancelled caller must not cancel the call the others are waiting on
+        return await asyncio.shield(task)
+
+# Jobs that should run on one worker at a time hold a lease document in `meta`: the
+# holder renews it every run, and another worker takes over once it has expired.
+WORKER_ID = uuid.uuid4().hex
+
+async def acquire_lease(name: str, seconds: float) -> bool:
+    """Take or renew the named lease for this worker; False while another worker holds it"""
+    now = datetime.utcnow()
+    try:
+        await db.meta.update_one(
+            {"_id": f"lease:{name}", "$or": [{"holder": WORKER_ID}, {"expiresAt": {"$lte": now}}]},
+            {"$set": {"holder": WORKER_ID, "expiresAt": now + timedelta(seconds=seconds)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # The lease exists and neither matched: the upsert collided with the holder's document
+        return False
+    return True
+
+# Outbound HTTP: one pooled httpx client per upstream for the application's lifetime
+# (HTTP/2 when the h2 package is installed). Each upstream has its own timeout and pool
+# size, a retry budget that caps retries at a fraction of recent requests, and a
+# circuit breaker that fails fast while the upstream keeps erroring.
+HTTP_UPSTREAMS = {
+    "youtube": {"timeout": 10.0, "max_connections": 20, "retries": 2},
+    "weather": {"timeout": 5.0, "max_connections": 20, "retries": 2},
+    # Completions are slow and billed per call - never retried
+    "llm": {"timeout": 30.0, "max_connections": 10, "retries": 0},
+}
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+RETRY_BACKOFF_SECONDS = 0.2
+
+class UpstreamUnavailable(Exception):
+    pass
+
+class RetryBudget:
+    """Permits retries up to `ratio` of the requests made in the last `window` seconds, with a small floor"""
+    def __init__(self, ratio: float = 0.2, min_retries: int = 3, window: float = 60.0):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self.requests = deque()
+        self.retries = deque()
+    
+    def trim(self, now: float):
+        for events in (self.requests, self.retries):
+            while events and events[0] < now - self.window:
+                events.popleft()
+    
+    def record_request(self):
+        self.requests.append(time.monotonic())
+    
+    def try_spend(self) -> bool:
+        now = time.monotonic()
+        self.trim(now)
+        if len(self.retries) >= max(self.min_retries, self.ratio * len(self.requests)):
+            return False
+        self.retries.append(now)
+        return True
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures; after `reset_timeout` one trial request is let through"""
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+    
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half-open"
+    
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+    
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+    
+    def record_failure(self):
+        self.failures += 1
+        # A failed trial re-opens the circuit immediately
+        if self.trial_in_flight or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self.trial_in_flight = False
+    
+    def release_trial(self):
+        """Let another trial through after one ended without an outcome (e.g. it was cancelled)"""
+        self.trial_in_flight = False
+
+class UpstreamClient:
+    def __init__(self, name: str, timeout: float, max_connections: int, retries: int):
+        self.name = name
+        self.max_connections = max_connections
+        self.retries = retries
+        self.client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 5.0)),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+        self.budget = RetryBudget()
+        self.breaker = CircuitBreaker()
+        self.latency = LatencyRecorder()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.retried = 0
+        self.failures = 0
+        self.rejected = 0
+    
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Send a request, retrying transport errors and retryable statuses within the retry budget"""
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise UpstreamUnavailable(f"Circuit open for upstream '{self.name}'")
+        
+        # Closed circuits never have a trial in flight, so this is only set for the trial request
+        trial = self.breaker.trial_in_flight
+        self.budget.record_request()
+        attempt = 0
+        try:
+            while True:
+                self.in_flight += 1
+                self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+                self.requests += 1
+                started = time.perf_counter()
+                response, error = None, None
+                try:
+                    response = await self.client.request(method, url, **kwargs)
+                except httpx.TransportError as e:
+                    error = e
+                finally:
+                    self.in_flight -= 1
+                    self.latency.record(time.perf_counter() - started)
+                
+                retryable = error is not None or response.status_code in RETRYABLE_STATUS_CODES
+                if retryable and attempt < self.retries and self.budget.try_spend():
+                    attempt += 1
+                    self.retried += 1
+                    await asyncio.sleep(RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+                    continue
+                
+                if error is not None or response.status_code >= 500:
+                    self.failures += 1
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                if error is not None:
+                    raise error
+                return response
+        finally:
+            # A trial cancelled or failed with a non-transport error recorded no outcome;
+            # without this the circuit would stay half-open with every request rejected
+            if trial:
+                self.breaker.release_trial()
+    
+    def stats(self) -> dict:
+        return {
+            "http2": HTTP2_AVAILABLE,
+            "maxConnections": self.max_connections,
+            "inFlight": self.in_flight,
+            "peakInFlight": self.peak_in_flight,
+            # Requests beyond the pool size wait for a free connection
+            "queued": max(0, self.in_flight - self.max_connections),
+            "saturation": round(self.in_flight / self.max_connections, 2),
+            "requests": self.requests,
+            "retries": self.retried,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "circuit": self.breaker.state,
+            "latency": self.latency.stats()
+        }
+
+class HttpClientRegistry:
+    """Application-lifetime clients, one per configured upstream"""
+    def __init__(self, upstreams: dict):
+        self.upstreams = upstreams
+        self.clients = {}
+    
+    def start(self):
+        for name in self.upstreams:
+            self.get(name)
+    
+    def get(self, name: str) -> UpstreamClient:
+        client = self.clients.get(name)
+        if client is None:
+            client = self.clients[name] = UpstreamClient(name, **self.upstreams[name])
+        return client
+    
+    async def close(self):
+        clients, self.clients = self.clients, {}
+        for client in clients.values():
+            await client.client.aclose()
+    
+    def stats(self) -> dict:
+        return {name: client.stats() for name, client in self.clients.items()}
+
+http_clients = HttpClientRegistry(HTTP_UPSTREAMS)
+
+# Authenticated user cache: a per-request memo (handlers like checkin_court resolve
+# the caller more than once) in front of a short-TTL process-wide cache
+USER_CACHE_TTL_SECONDS = float(os.environ.get('USER_CACHE_TTL_SECONDS', '30'))
+user_cache = TTLCache(max_size=10000, ttl=USER_CACHE_TTL_SECONDS)
+request_users = ContextVar("request_users", default=None)
+user_cache_request_hits = 0
+
+async def load_user(user_id: str) -> Optional[dict]:
+    global user_cache_request_hits
+    # Each request runs in its own task, so the memo set here is request-scoped
+    scoped = request_users.get()
+    if scoped is None:
+        scoped = {}
+        request_users.set(scoped)
+    if user_id in scoped:
+        user_cache_request_hits += 1
+        return scoped[user_id]
+    
+    user = user_cache.get(user_id)
+    if user is None:
+        user = await db.users.find_one({"_id": ObjectId(user_id)}, USER_PROFILE_PROJECTION)
+        if not user:
+            return None
+        user["_id"] = str(user["_id"])
+        if user.get("currentCourtId"):
+            user["currentCourtId"] = str(user["currentCourtId"])
+        user_cache.set(user_id, user)
+    
+    scoped[user_id] = user
+    return user
+
+def invalidate_user(user_id):
+    """Drop a user from both cache tiers after writing to their document"""
+    user_cache.pop(str(user_id))
+    scoped = request_users.get()
+    if scoped:
+        scoped.pop(str(user_id), None)
+
 async def get_current_user(authorization: Optional[str] = Header(None)):
     if not authorization:
         raise HTTPException(status_code=401, detail="Authorization header missing")
@@ -85,15 +498,209 @@ async def get_current_user(authorization: Optional[str] = Header(None)):
         if not user_id:
             raise HTTPException(status_code=401, detail="Invalid token payload")
         
-        user = await db.users.find_one({"_id": ObjectId(user_id)})
+        user = await load_user(user_id)
         if not user:
             raise HTTPException(status_code=401, detail="User not found")
         
-        user["_id"] = str(user["_id"])
-        return user
+        return dict(user)
     except Exception as e:
         raise HTTPException(status_code=401, detail=str(e))
 
+# Pagination helpers
+# List endpoints use keyset pagination: each page returns at most `limit` items and,
+# when more remain, an opaque cursor in the X-Next-Cursor header to pass back as `cursor`.
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(*parts) -> str:
+    raw = "|".join(part.isoformat() if isinstance(part, datetime) else str(part) for part in parts)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, *types) -> list:
+    """Decode a cursor back into values of the given types (ObjectId, datetime or str)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        parts = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        if len(parts) != len(types):
+            raise ValueError("Cursor has the wrong number of parts")
+        return [datetime.fromisoformat(part) if t is datetime else t(part) for part, t in zip(parts, types)]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def set_next_cursor(response: Response, cursor: Optional[str]):
+    if cursor:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
+
+# Fast JSON path for list endpoints: handlers build plain dicts straight from the raw
+# documents and return fast_json(...), which skips jsonable_encoder and encodes with
+# orjson when it's installed (stdlib json otherwise). ObjectIds encode as strings and
+# datetimes as ISO 8601, the same output jsonable_encoder gives.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def json_default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps_json(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=json_default)
+    return json.dumps(content, default=json_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+    
+    def render(self, content) -> bytes:
+        return dumps_json(content)
+
+def fast_json(content, response: Optional[Response] = None) -> FastJSONResponse:
+    """Encoded response that keeps headers (e.g. X-Next-Cursor) set on the injected response"""
+    return FastJSONResponse(content, headers=dict(response.headers) if response else None)
+
+# Realtime fan-out
+REALTIME_QUEUE_SIZE = 100  # events buffered per connection before new ones are dropped
+
+class FanoutBackend(ABC):
+    """
+    Interface for delivering realtime events to subscribed connections.
+    Topics are plain strings such as "user:<id>". A broker-backed backend
+    (e.g. Redis pub/sub) forwards publish() to the broker and delivers what
+    it receives to local subscribers, so events reach clients on any worker.
+    """
+    async def start(self):
+        pass
+    
+    async def stop(self):
+        pass
+    
+    @abstractmethod
+    def subscribe(self, topic: str, queue: asyncio.Queue):
+        ...
+    
+    @abstractmethod
+    def unsubscribe(self, topic: str, queue: asyncio.Queue):
+        ...
+    
+    @abstractmethod
+    async def publish(self, topic: str, event: dict):
+        ...
+
+class InProcessFanout(FanoutBackend):
+    """Default backend - delivers to subscribers within this worker process"""
+    def __init__(self):
+        self.subscribers = {}
+    
+    def subscribe(self, topic: str, queue: asyncio.Queue):
+        self.subscribers.setdefault(topic, set()).add(queue)
+    
+    def unsubscribe(self, topic: str, queue: asyncio.Queue):
+        queues = self.subscribers.get(topic)
+        if queues:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[topic]
+    
+    async def publish(self, topic: str, event: dict):
+        self.deliver(topic, event)
+    
+    def deliver(self, topic: str, event: dict):
+        for queue in list(self.subscribers.get(topic, ())):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                logging.warning(f"Realtime queue full for {topic}, dropping {event.get('type')} event")
+
+# Register broker-backed implementations here to make them selectable
+FANOUT_BACKENDS = {
+    "memory": InProcessFanout,
+}
+
+def create_fanout_backend() -> FanoutBackend:
+    backend_name = os.environ.get('REALTIME_FANOUT_BACKEND', 'memory')
+    if backend_name not in FANOUT_BACKENDS:
+        raise RuntimeError(f"Unknown REALTIME_FANOUT_BACKEND: {backend_name}")
+    return FANOUT_BACKENDS[backend_name]()
+
+realtime = create_fanout_backend()
+
+def user_topic(user_id) -> str:
+    return f"user:{user_id}"
+
+def court_topic(court_id) -> str:
+    return f"court:{court_id}"
+
+# Where court occupancy events come from: "local" publishes from the check-in
+# handlers of this worker, "changestream" relays MongoDB change stream updates
+court_events_source = "local"
+
+async def publish_court_occupancy(court_id, current_players: int, version: int):
+    record_court_occupancy(court_id, current_players)
+    try:
+        await record_occupancy_history(court_id, current_players, version)
+    except Exception as e:
+        # History only feeds the hourly profiles - it must never fail the check-in
+        logging.warning(f"Could not record occupancy history for court {court_id}: {str(e)}")
+    if court_events_source != "local":
+        return  # the change stream watcher publishes instead
+    await realtime.publish(court_topic(court_id), {
+        "type": "occupancy",
+        "courtId": str(court_id),
+        "currentPlayers": current_players
+    })
+
+async def watch_court_changes():
+    """Relay occupancy updates from a MongoDB change stream (replica sets only)"""
+    pipeline = [{
+        "$match": {
+            "operationType": "update",
+            "updateDescription.updatedFields.currentPlayers": {"$exists": True}
+        }
+    }]
+    resume_token = None
+    while True:
+        try:
+            async with db.courts.watch(pipeline, resume_after=resume_token) as stream:
+                async for change in stream:
+                    resume_token = stream.resume_token
+                    court_id = change["documentKey"]["_id"]
+                    current_players = change["updateDescription"]["updatedFields"]["currentPlayers"]
+                    record_court_occupancy(court_id, current_players)
+                    await realtime.publish(court_topic(court_id), {
+                        "type": "occupancy",
+                        "courtId": str(court_id),
+                        "currentPlayers": current_players
+                    })
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Court change stream error, reconnecting: {str(e)}")
+            await asyncio.sleep(5)
+
+async def start_court_change_stream():
+    """
+    Switch occupancy events to a change stream when COURT_CHANGE_STREAMS allows it
+    ("auto" - default, when connected to a replica set; "on"; "off"), so every
+    worker sees check-ins handled by the others.
+    """
+    global court_events_source
+    mode = os.environ.get('COURT_CHANGE_STREAMS', 'auto').lower()
+    if mode == "off":
+        return None
+    if mode == "auto":
+        hello = await db.command("hello")
+        if not hello.get("setName"):
+            logging.info("Not connected to a replica set - court events stay in-process")
+            return None
+    court_events_source = "changestream"
+    logging.info("Court occupancy events sourced from MongoDB change stream")
+    return asyncio.create_task(watch_court_changes())
+
 # Pydantic Models
 
 class UserRegister(BaseModel):
@@ -158,6 +765,24 @@ class FriendRequestResponse(BaseModel):
     status: str
     message: str
 
+# Field projections: every read fetches only the fields its caller uses, so list
+# calls skip large profilePic payloads and court player sets. The bcrypt password
+# hash is only ever read by login (enforced by tests/test_projections.py).
+USER_PROFILE_PROJECTION = {
+    "username": 1, "email": 1, "profilePic": 1, "avatarUrl": 1, "isPublic": 1, "currentCourtId": 1,
+    "profileImageId": 1
+}
+USER_LOGIN_PROJECTION = {**USER_PROFILE_PROJECTION, "password": 1}
+USER_SUMMARY_PROJECTION = {"username": 1, "profilePic": 1}
+ID_PROJECTION = {"_id": 1}
+COURT_STATIC_PROJECTION = {
+    "name": 1, "address": 1, "latitude": 1, "longitude": 1, "hours": 1,
+    "phoneNumber": 1, "rating": 1, "averagePlayers": 1, "image": 1
+}
+COURT_PROJECTION = {**COURT_STATIC_PROJECTION, "currentPlayers": 1}
+MESSAGE_PROJECTION = {"fromUserId": 1, "toUserId": 1, "message": 1, "timestamp": 1, "read": 1}
+CONVERSATION_PROJECTION = {"participants": 1, "lastMessage": 1, "timestamp": 1, "unread": 1}
+
 # Initialize courts data (production-safe, idempotent)
 async def initialize_courts():
     """
@@ -1187,18 +1812,126 @@ async def initialize_courts():
                 "image": None
             }
         ]
+        for court in nationwide_courts:
+            court.update(court_geo_fields(court["latitude"], court["longitude"]))
         await db.courts.insert_many(nationwide_courts)
+        invalidate_court_catalog()
+        await bump_court_catalog_version(db)
         logging.info("Initialized nationwide basketball courts database covering all 50 states")
+    except Exception as e:
+        logging.error(f"Courts initialization error: {str(e)}")
+
+# Sorts before any real message timestamp
+EPOCH = datetime(1970, 1, 1)
+
+def conversation_key(user_a: ObjectId, user_b: ObjectId) -> str:
+    """Conversation summary _id: the two user ids, sorted, joined by an underscore"""
+    first, second = sorted([str(user_a), str(user_b)])
+    return f"{first}_{second}"
+
+async def migration_completed(name: str) -> bool:
+    return await db.meta.find_one({"_id": f"migration:{name}"}, ID_PROJECTION) is not None
+
+async def mark_migration_completed(name: str):
+    await db.meta.update_one(
+        {"_id": f"migration:{name}"},
+        {"$set": {"completedAt": datetime.utcnow()}},
+        upsert=True
+    )
+
+async def backfill_conversations():
+    """
+    One-time migration: build the materialized `conversations` summaries
+    from existing messages. Recorded as done in `meta` once it has run, so
+    summaries written by live sends in the meantime don't cause it to be skipped.
+    """
+    if await migration_completed("conversations"):
+        return
+    
+    pair = {
+        "$cond": [
+            {"$lt": ["$fromUserId", "$toUserId"]},
+            ["$fromUserId", "$toUserId"],
+            ["$toUserId", "$fromUserId"]
+        ]
+    }
+    await db.messages.aggregate([
+        {"$sort": {"timestamp": -1, "_id": -1}},
+        # Unread counts are per recipient, so group each direction of a pair first
+        {
+            "$group": {
+                "_id": {"participants": pair, "toUserId": "$toUserId"},
+                "fromUserId": {"$first": "$fromUserId"},
+                "lastMessageId": {"$first": "$_id"},
+                "lastMessage": {"$first": "$message"},
+                "timestamp": {"$first": "$timestamp"},
+                "unread": {"$sum": {"$cond": [{"$eq": ["$read", False]}, 1, 0]}}
+            }
+        },
+        {"$sort": {"timestamp": -1, "lastMessageId": -1}},
+        {
+            "$group": {
+                "_id": {
+                    "$concat": [
+                        {"$toString": {"$arrayElemAt": ["$_id.participants", 0]}},
+                        "_",
+                        {"$toString": {"$arrayElemAt": ["$_id.participants", 1]}}
+                    ]
+                },
+                "participants": {"$first": "$_id.participants"},
+                "lastMessageId": {"$first": "$lastMessageId"},
+                "lastMessage": {"$first": "$lastMessage"},
+                "lastFromUserId": {"$first": "$fromUserId"},
+                "timestamp": {"$first": "$timestamp"},
+                "unreadCounts": {"$push": {"k": {"$toString": "$_id.toUserId"}, "v": "$unread"}}
+            }
+        },
+        {"$set": {"unread": {"$arrayToObject": "$unreadCounts"}}},
+        {"$unset": "unreadCounts"},
+        {"$merge": {"into": "conversations", "on": "_id", "whenMatched": "keepExisting", "whenNotMatched": "insert"}}
+    ]).to_list(None)
+    
+    await mark_migration_completed("conversations")
+    count = await db.conversations.count_documents({})
+    logging.info(f"Backfilled conversation summaries ({count} total)")
+
+async def backfill_court_geo_fields():
+    """
+    One-time migration: add the GeoJSON `location` and `geohash` fields to
+    courts created before geo queries existed. Idempotent - only touches
+    courts that are missing a field.
+    """
+    result = await db.courts.update_many(
+        {"location": {"$exists": False}, "latitude": {"$type": "number"}, "longitude": {"$type": "number"}},
+        [{"$set": {"location": {"type": "Point", "coordinates": ["$longitude", "$latitude"]}}}]
+    )
+    if result.modified_count:
+        logging.info(f"Backfilled location on {result.modified_count} courts")
+    
+    # Geohash encoding can't be expressed as a pipeline update, so batch it from here
+    updates = []
+    cursor = db.courts.find(
+        {"geohash": {"$exists": False}, "latitude": {"$type": "number"}, "longitude": {"$type": "number"}},
+        {"latitude": 1, "longitude": 1}
+    )
+    async for court in cursor:
+        updates.append(UpdateOne(
+            {"_id": court["_id"]},
+            {"$set": {"geohash": encode_geohash(court["latitude"], court["longitude"])}}
+        ))
+    if updates:
+        await db.courts.bulk_write(updates, ordered=False)
+        logging.info(f"Backfilled geohash on {len(updates)} courts")
 
 # Authentication Routes
 @api_router.post("/auth/register")
 async def register(user: UserRegister):
     # Check if user exists
-    existing_user = await db.users.find_one({"email": user.email})
+    existing_user = await db.users.find_one({"email": user.email}, ID_PROJECTION)
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    existing_username = await db.users.find_one({"username": user.username})
+    existing_username = await db.users.find_one({"username": user.username}, ID_PROJECTION)
     if existing_username:
         raise HTTPException(status_code=400, detail="Username already taken")
     
@@ -1206,7 +1939,7 @@ async def register(user: UserRegister):
     user_dict = {
         "username": user.username,
         "email": user.email,
-        "password": hash_password(user.password),
+        "password": await hash_password_async(user.password),
         "profilePic": None,
         "isPublic": True,
         "currentCourtId": None,
@@ -1234,11 +1967,11 @@ async def register(user: UserRegister):
 
 @api_router.post("/auth/login")
 async def login(credentials: UserLogin):
-    user = await db.users.find_one({"email": credentials.email})
+    user = await db.users.find_one({"email": credentials.email}, USER_LOGIN_PROJECTION)
     if not user:
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
-    if not verify_password(credentials.password, user["password"]):
+    if not await verify_password_async(credentials.password, user["password"]):
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
     user_id = str(user["_id"])
@@ -1272,9 +2005,22 @@ async def get_me(authorization: Optional[str] = Header(None)):
 
 # User Routes
 @api_router.get("/users")
-async def get_users(authorization: Optional[str] = Header(None)):
+async def get_users(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    authorization: Optional[str] = Header(None)
+):
     current_user = await get_current_user(authorization)
-    users = await db.users.find({"_id": {"$ne": ObjectId(current_user["_id"])}}).to_list(1000)
+    
+    id_filter = {"$ne": ObjectId(current_user["_id"])}
+    if cursor:
+        id_filter["$gt"] = decode_cursor(cursor, ObjectId)[0]
+    
+    users = await db.users.find({"_id": id_filter}, USER_SUMMARY_PROJECTION).sort("_id", 1).limit(limit + 1).to_list(limit + 1)
+    if len(users) > limit:
+        users = users[:limit]
+        set_next_cursor(response, encode_cursor(users[-1]["_id"]))
     
     return [{
         "id": str(user["_id"]),
@@ -1282,26 +2028,178 @@ async def get_users(authorization: Optional[str] = Header(None)):
         "profilePic": user.get("profilePic")
     } for user in users]
 
+# Profile images: uploads are stored in the image store (GridFS or filesystem) with
+# fixed-size thumbnails generated once; the user document only keeps the image id
+# and the URL of the medium thumbnail in profilePic. The app hands profilePic straight
+# to <Image>, which can't load relative URIs, so IMAGE_BASE_URL (the API's public
+# origin) is required.
+IMAGE_STORE_BACKEND = os.environ.get('IMAGE_STORE_BACKEND', 'gridfs')
+IMAGE_STORE_PATH = os.environ.get('IMAGE_STORE_PATH', str(ROOT_DIR / 'uploads'))
+IMAGE_BASE_URL = os.environ.get('IMAGE_BASE_URL', '').rstrip('/')
+MAX_IMAGE_UPLOAD_BYTES = 5 * 1024 * 1024
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+IMAGE_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+image_store = create_image_store(IMAGE_STORE_BACKEND, db, IMAGE_STORE_PATH)
+
+def profile_image_url(image_id: str, size: str = "medium") -> str:
+    return f"{IMAGE_BASE_URL}/api/images/{image_id}/{size}"
+
+def is_profile_image_url(url: str, image_id: Optional[str]) -> bool:
+    """Whether url points at one of image_id's variants, whatever base URL it was built with"""
+    return bool(image_id) and f"/api/images/{image_id}/" in url
+
+def check_image_settings():
+    if not re.match(r"https?://[^/]+", IMAGE_BASE_URL):
+        raise RuntimeError(
+            "IMAGE_BASE_URL must be the API's absolute public origin (e.g. https://api.example.com) "
+            "so profile image URLs can be loaded by the app"
+        )
+
+def decode_data_url(data_url: str) -> bytes:
+    """Bytes of a base64 `data:image/...;base64,` URL"""
+    header, _, payload = data_url.partition(",")
+    if not header.startswith("data:image/") or not header.endswith(";base64"):
+        raise HTTPException(status_code=400, detail="Only base64 image data URLs are supported")
+    if len(payload) * 3 // 4 > MAX_IMAGE_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="Image is too large")
+    try:
+        return base64.b64decode(payload, validate=True)
+    except binascii.Error:
+        raise HTTPException(status_code=400, detail="Invalid base64 image data")
+
+async def store_profile_image(data: bytes) -> str:
+    """Validate an uploaded image, store it with its thumbnails and return the new image id"""
+    if len(data) > MAX_IMAGE_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="Image is too large")
+    try:
+        thumbnails = await asyncio.to_thread(make_thumbnails, data)
+    except InvalidImage as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    image_id = uuid.uuid4().hex
+    await image_store.put(f"{image_id}/original", data)
+    for size, thumbnail in thumbnails.items():
+        await image_store.put(f"{image_id}/{size}", thumbnail)
+    return image_id
+
+@api_router.post("/users/profile/image")
+async def upload_profile_image(file: UploadFile = File(...), authorization: Optional[str] = Header(None)):
+    user = await get_current_user(authorization)
+    
+    image_id = await store_profile_image(await file.read(MAX_IMAGE_UPLOAD_BYTES + 1))
+    await db.users.update_one(
+        {"_id": ObjectId(user["_id"])},
+        {"$set": {"profilePic": profile_image_url(image_id), "profileImageId": image_id}}
+    )
+    invalidate_user(user["_id"])
+    if user.get("profileImageId"):
+        await image_store.delete(user["profileImageId"])
+    
+    return {
+        "imageId": image_id,
+        "profilePic": profile_image_url(image_id),
+        "thumbnails": {size: profile_image_url(image_id, size) for size in THUMBNAIL_SIZES}
+    }
+
+@api_router.get("/images/{image_id}/{size}")
+async def get_image(image_id: str, size: str, request: Request):
+    if size not in THUMBNAIL_SIZES or not IMAGE_ID_PATTERN.fullmatch(image_id):
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    # Image ids are never reused, so a thumbnail never changes once stored
+    etag = f'"{image_id}-{size}"'
+    headers = {"Cache-Control": IMAGE_CACHE_CONTROL, "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    
+    data = await image_store.get(f"{image_id}/{size}")
+    if data is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return Response(content=data, media_type=THUMBNAIL_CONTENT_TYPE, headers=headers)
+
+async def migrate_relative_profile_image_urls():
+    """Prefix IMAGE_BASE_URL to profile image URLs saved while it was unset"""
+    result = await db.users.update_many(
+        {"profilePic": {"$regex": "^/api/images/"}},
+        [{"$set": {"profilePic": {"$concat": [IMAGE_BASE_URL, "$profilePic"]}}}]
+    )
+    if result.modified_count:
+        user_cache.clear()
+        logging.info(f"Made {result.modified_count} relative profile image URLs absolute")
+
+async def migrate_inline_profile_images():
+    """
+    One-time migration: move base64 data URLs stored in profilePic/avatarUrl
+    into the image store. Users whose image can't be decoded are left as-is.
+    """
+    inline = {"$regex": "^data:"}
+    cursor = db.users.find(
+        {"$or": [{"profilePic": inline}, {"avatarUrl": inline}]},
+        {"profilePic": 1, "avatarUrl": 1}
+    )
+    migrated = 0
+    async for user in cursor:
+        fields = [field for field in ("profilePic", "avatarUrl") if str(user.get(field) or "").startswith("data:")]
+        try:
+            image_id = await store_profile_image(decode_data_url(user[fields[0]]))
+        except HTTPException as e:
+            logging.warning(f"Skipping inline profile image of user {user['_id']}: {e.detail}")
+            continue
+        
+        await db.users.update_one(
+            {"_id": user["_id"]},
+            {"$set": {**{field: profile_image_url(image_id) for field in fields}, "profileImageId": image_id}}
+        )
+        invalidate_user(user["_id"])
+        migrated += 1
+    
+    if migrated:
+        logging.info(f"Moved {migrated} inline profile images to the image store")
+
 @api_router.put("/users/profile")
 async def update_profile(update: UserUpdate, authorization: Optional[str] = Header(None)):
     user = await get_current_user(authorization)
     
     update_data = {}
+    image_id = None
     if update.username:
         update_data["username"] = update.username
     if update.profilePic:
-        update_data["profilePic"] = update.profilePic
+        if update.profilePic.startswith("data:"):
+            # Inline uploads go to the image store; the document keeps the thumbnail URL
+            image_id = await store_profile_image(decode_data_url(update.profilePic))
+            update_data["profilePic"] = profile_image_url(image_id)
+        else:
+            update_data["profilePic"] = update.profilePic
     if update.avatarUrl:
         update_data["avatarUrl"] = update.avatarUrl
         update_data["profilePic"] = update.avatarUrl  # Use avatarUrl as profilePic for display
+        if image_id:
+            await image_store.delete(image_id)  # superseded by avatarUrl
+            image_id = None
+    
+    previous_image_id = user.get("profileImageId")
+    if "profilePic" in update_data:
+        profile_pic = update_data["profilePic"]
+        if image_id is None and (
+            profile_pic == user.get("profilePic") or is_profile_image_url(profile_pic, previous_image_id)
+        ):
+            # Clients send back the URL they were given: the stored image stays
+            del update_data["profilePic"]
+        else:
+            update_data["profileImageId"] = image_id
     
     if update_data:
         await db.users.update_one(
             {"_id": ObjectId(user["_id"])},
             {"$set": update_data}
         )
+        invalidate_user(user["_id"])
+    if "profileImageId" in update_data and previous_image_id:
+        await image_store.delete(previous_image_id)
     
-    updated_user = await db.users.find_one({"_id": ObjectId(user["_id"])})
+    updated_user = await db.users.find_one({"_id": ObjectId(user["_id"])}, USER_PROFILE_PROJECTION)
     return {
         "id": str(updated_user["_id"]),
         "username": updated_user["username"],
@@ -1323,33 +2221,25 @@ async def toggle_privacy(authorization: Optional[str] = Header(None)):
         {"_id": ObjectId(user["_id"])},
         {"$set": {"isPublic": new_public}}
     )
+    invalidate_user(user["_id"])
     
-    # If user is currently at a court and switching to private, remove from court count
-    if user.get("currentCourtId") and not new_public:
-        await db.courts.update_one(
-            {"_id": ObjectId(user["currentCourtId"])},
-            {
-                "$pull": {"publicUsersAtCourt": user["_id"]},
-                "$inc": {"currentPlayers": -1}
-            }
-        )
-    elif user.get("currentCourtId") and new_public:
-        # If switching to public and at a court, add to count
-        await db.courts.update_one(
-            {"_id": ObjectId(user["currentCourtId"])},
-            {
-                "$addToSet": {"publicUsersAtCourt": user["_id"]},
-                "$inc": {"currentPlayers": 1}
-            }
-        )
+    # If user is currently at a court, add them to or remove them from the court's public count
+    if user.get("currentCourtId"):
+        if new_public:
+            await join_court(ObjectId(user["currentCourtId"]), user["_id"])
+        else:
+            await leave_court(ObjectId(user["currentCourtId"]), user["_id"])
     
     return {"isPublic": new_public}
 
 # Court Routes
-@api_router.get("/courts")
-async def get_courts():
-    courts = await db.courts.find().to_list(1000)
-    return [{
+COURTS_MAX_PAGE_SIZE = 1000
+NEARBY_DEFAULT_RADIUS_METERS = 50000  # ~31 miles
+NEARBY_MAX_RADIUS_METERS = 500000
+NEARBY_MAX_LIMIT = 200
+
+def court_to_dict(court: dict) -> dict:
+    return {
         "id": str(court["_id"]),
         "name": court["name"],
         "address": court["address"],
@@ -1361,166 +2251,940 @@ async def get_courts():
         "currentPlayers": court.get("currentPlayers", 0),
         "averagePlayers": court.get("averagePlayers", 12),
         "image": court.get("image")
-    } for court in courts]
+    }
 
-@api_router.get("/courts/{court_id}")
-async def get_court(court_id: str):
-    try:
-        court = await db.courts.find_one({"_id": ObjectId(court_id)})
-        if not court:
-            raise HTTPException(status_code=404, detail="Court not found")
-        
-        return {
-            "id": str(court["_id"]),
-            "name": court["name"],
-            "address": court["address"],
-            "latitude": court["latitude"],
-            "longitude": court["longitude"],
-            "hours": court["hours"],
-            "phoneNumber": court["phoneNumber"],
-            "rating": court["rating"],
-            "currentPlayers": court.get("currentPlayers", 0),
-            "averagePlayers": court.get("averagePlayers", 12),
-            "image": court.get("image")
-        }
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+# Court catalog cache: two tiers with different lifetimes. Static court fields are
+# serialized once per court into an open JSON object fragment and cached for a long
+# time; currentPlayers comes from a short-lived occupancy snapshot that occupancy
+# events keep current, and is appended to each fragment per response. Other
+# processes that write courts bump the version in `meta`, which workers poll.
+COURT_CATALOG_TTL_SECONDS = float(os.environ.get('COURT_CATALOG_TTL_SECONDS', '3600'))
+COURT_OCCUPANCY_TTL_SECONDS = float(os.environ.get('COURT_OCCUPANCY_TTL_SECONDS', '5'))
+COURT_CATALOG_VERSION_CHECK_SECONDS = 10
+court_catalog_cache = TTLCache(max_size=1, ttl=COURT_CATALOG_TTL_SECONDS)
+court_occupancy_cache = TTLCache(max_size=1, ttl=COURT_OCCUPANCY_TTL_SECONDS)
+court_catalog_lock = asyncio.Lock()
+court_occupancy_lock = asyncio.Lock()
+court_catalog_version = None
+court_catalog_checked_at = 0.0
 
-@api_router.post("/courts/{court_id}/checkin")
-async def checkin_court(court_id: str, authorization: Optional[str] = Header(None)):
-    user = await get_current_user(authorization)
+class CourtCatalog:
+    """Court ids in _id order, each court's pre-serialized static fields and the scoring arrays"""
+    def __init__(self, courts: list):
+        self.ids = [court["_id"] for court in courts]
+        self.fragments = {court["_id"]: court_static_fragment(court) for court in courts}
+        self.scoring = CourtScoringIndex(courts)
+
+def court_static_fragment(court: dict) -> bytes:
+    """JSON for a court without currentPlayers, minus the closing brace"""
+    static = court_to_dict(court)
+    del static["currentPlayers"]
+    return dumps_json(static)[:-1]
+
+def court_json(fragment: bytes, current_players: int, expected_players: Optional[float] = None) -> bytes:
+    if expected_players is None:
+        return fragment + b',"currentPlayers":%d}' % current_players
+    return fragment + b',"currentPlayers":%d,"expectedPlayers":%.1f}' % (current_players, expected_players)
+
+def invalidate_court_catalog():
+    court_catalog_cache.clear()
+
+async def get_court_catalog() -> CourtCatalog:
+    global court_catalog_version, court_catalog_checked_at
+    catalog = court_catalog_cache.get("catalog")
+    if catalog is not None and time.monotonic() - court_catalog_checked_at >= COURT_CATALOG_VERSION_CHECK_SECONDS:
+        court_catalog_checked_at = time.monotonic()
+        if await read_court_catalog_version(db) != court_catalog_version:
+            invalidate_court_catalog()
+            catalog = None
+    if catalog is not None:
+        return catalog
     
-    # Check out from current court if any
-    if user.get("currentCourtId"):
-        await checkout_court(user["currentCourtId"], authorization)
+    async with court_catalog_lock:
+        catalog = court_catalog_cache.peek("catalog")
+        if catalog is None:
+            # Read the version first so a bump during the load triggers another reload
+            version = await read_court_catalog_version(db)
+            courts = await db.courts.find({}, COURT_STATIC_PROJECTION).sort("_id", 1).to_list(None)
+            catalog = CourtCatalog(courts)
+            court_catalog_cache.set("catalog", catalog)
+            court_catalog_version = version
+            court_catalog_checked_at = time.monotonic()
+        return catalog
+
+async def get_court_occupancy() -> dict:
+    occupancy = court_occupancy_cache.get("occupancy")
+    if occupancy is not None:
+        return occupancy
     
-    # Check in to new court
-    court = await db.courts.find_one({"_id": ObjectId(court_id)})
-    if not court:
-        raise HTTPException(status_code=404, detail="Court not found")
+    async with court_occupancy_lock:
+        occupancy = court_occupancy_cache.peek("occupancy")
+        if occupancy is None:
+            courts = await db.courts.find({}, {"currentPlayers": 1}).to_list(None)
+            occupancy = {court["_id"]: court.get("currentPlayers", 0) for court in courts}
+            court_occupancy_cache.set("occupancy", occupancy)
+        return occupancy
+
+def record_court_occupancy(court_id, current_players: int):
+    """Apply an occupancy change to the cached snapshot, if there is one, and to cached recommendations"""
+    occupancy = court_occupancy_cache.peek("occupancy")
+    if occupancy is not None:
+        occupancy[ObjectId(court_id)] = current_players
+    recommendation_cache.record_occupancy(ObjectId(court_id), current_players)
+
+def json_etag_response(request: Request, body: bytes, headers: Optional[dict] = None) -> Response:
+    """JSON response with a strong ETag over the body; 304 when If-None-Match matches"""
+    etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+    headers = {**(headers or {}), "ETag": etag, "Cache-Control": "no-cache"}
     
-    # Update user's current court
-    await db.users.update_one(
-        {"_id": ObjectId(user["_id"])},
-        {"$set": {"currentCourtId": ObjectId(court_id)}}
-    )
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        if "*" in tags or etag in tags:
+            return Response(status_code=304, headers=headers)
     
-    # If user is public, update court player count
-    if user.get("isPublic", True):
-        await db.courts.update_one(
-            {"_id": ObjectId(court_id)},
-            {
-                "$addToSet": {"publicUsersAtCourt": user["_id"]},
-                "$inc": {"currentPlayers": 1}
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@api_router.get("/courts")
+async def get_courts(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(COURTS_MAX_PAGE_SIZE, ge=1, le=COURTS_MAX_PAGE_SIZE)
+):
+    catalog = await get_court_catalog()
+    occupancy = await get_court_occupancy()
+    
+    start = bisect.bisect_right(catalog.ids, decode_cursor(cursor, ObjectId)[0]) if cursor else 0
+    page_ids = catalog.ids[start:start + limit]
+    headers = {}
+    if start + limit < len(catalog.ids):
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(page_ids[-1])
+    
+    body = b"[" + b",".join(
+        court_json(catalog.fragments[court_id], occupancy.get(court_id, 0)) for court_id in page_ids
+    ) + b"]"
+    return json_etag_response(request, body, headers)
+
+@api_router.get("/courts/nearby")
+async def get_nearby_courts(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius: float = Query(NEARBY_DEFAULT_RADIUS_METERS, gt=0, le=NEARBY_MAX_RADIUS_METERS),
+    limit: int = Query(50, ge=1, le=NEARBY_MAX_LIMIT)
+):
+    """Courts within `radius` meters of (lat, lon), closest first"""
+    courts = await db.courts.aggregate([
+        {
+            "$geoNear": {
+                "near": court_location(lat, lon),
+                "distanceField": "distance",
+                "maxDistance": radius,
+                "spherical": True
             }
-        )
+        },
+        {"$limit": limit},
+        {"$project": {**COURT_PROJECTION, "distance": 1}}
+    ]).to_list(limit)
     
-    updated_court = await db.courts.find_one({"_id": ObjectId(court_id)})
+    return fast_json([{
+        **court_to_dict(court),
+        "distance": round(court["distance"], 1)
+    } for court in courts])
+
+# Zoom level at which the viewport switches from clusters to individual courts
+CLUSTER_MAX_ZOOM = 12
+VIEWPORT_MAX_COURTS = 500
+
+def cluster_precision(zoom: int) -> int:
+    """Geohash prefix length used to bucket courts at a given map zoom"""
+    if zoom <= 3:
+        return 2
+    if zoom <= 5:
+        return 3
+    if zoom <= 7:
+        return 4
+    if zoom <= 9:
+        return 5
+    return 6
+
+def viewport_filter(min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> dict:
+    if max_lon - min_lon >= 180:
+        # 2dsphere polygons can't span a hemisphere; world-scale views only need the latitude band
+        return {"latitude": {"$gte": min_lat, "$lte": max_lat}}
     return {
-        "message": "Checked in successfully",
-        "currentPlayers": updated_court.get("currentPlayers", 0)
+        "location": {
+            "$geoWithin": {
+                "$geometry": {
+                    "type": "Polygon",
+                    "coordinates": [[
+                        [min_lon, min_lat],
+                        [max_lon, min_lat],
+                        [max_lon, max_lat],
+                        [min_lon, max_lat],
+                        [min_lon, min_lat]
+                    ]]
+                }
+            }
+        }
     }
 
-@api_router.post("/courts/{court_id}/checkout")
-async def checkout_court(court_id: str, authorization: Optional[str] = Header(None)):
-    user = await get_current_user(authorization)
+@api_router.get("/courts/viewport")
+async def get_viewport_courts(
+    min_lat: float = Query(..., alias="minLat", ge=-90, le=90),
+    min_lon: float = Query(..., alias="minLon", ge=-180, le=180),
+    max_lat: float = Query(..., alias="maxLat", ge=-90, le=90),
+    max_lon: float = Query(..., alias="maxLon", ge=-180, le=180),
+    zoom: int = Query(..., ge=0, le=22)
+):
+    """
+    Courts inside the visible map area. At high zoom individual courts are
+    returned; at low zoom courts are grouped by geohash cell into clusters
+    with a count and centroid, so the payload scales with the viewport.
+    """
+    if min_lat >= max_lat or min_lon >= max_lon:
+        raise HTTPException(status_code=400, detail="Invalid viewport bounds")
     
-    # Update user's current court to None
-    await db.users.update_one(
-        {"_id": ObjectId(user["_id"])},
-        {"$set": {"currentCourtId": None}}
-    )
+    match = viewport_filter(min_lat, min_lon, max_lat, max_lon)
     
-    # If user is public, decrease court player count
-    if user.get("isPublic", True):
-        await db.courts.update_one(
-            {"_id": ObjectId(court_id)},
-            {
-                "$pull": {"publicUsersAtCourt": user["_id"]},
-                "$inc": {"currentPlayers": -1}
+    if zoom >= CLUSTER_MAX_ZOOM:
+        courts = await db.courts.find(match, COURT_PROJECTION).to_list(VIEWPORT_MAX_COURTS)
+        return fast_json({
+            "zoom": zoom,
+            "clustered": False,
+            "courts": [court_to_dict(court) for court in courts],
+            "clusters": []
+        })
+    
+    precision = cluster_precision(zoom)
+    clusters = await db.courts.aggregate([
+        {"$match": match},
+        {
+            "$group": {
+                "_id": {"$substrCP": ["$geohash", 0, precision]},
+                "count": {"$sum": 1},
+                "latitude": {"$avg": "$latitude"},
+                "longitude": {"$avg": "$longitude"},
+                "currentPlayers": {"$sum": "$currentPlayers"},
+                "courtId": {"$first": "$_id"}
             }
-        )
-        
-        # Ensure player count doesn't go below 0
-        await db.courts.update_one(
-            {"_id": ObjectId(court_id), "currentPlayers": {"$lt": 0}},
-            {"$set": {"currentPlayers": 0}}
-        )
+        },
+        {"$sort": {"count": -1}}
+    ]).to_list(None)
     
-    updated_court = await db.courts.find_one({"_id": ObjectId(court_id)})
-    return {
-        "message": "Checked out successfully",
-        "currentPlayers": updated_court.get("currentPlayers", 0) if updated_court else 0
-    }
+    return fast_json({
+        "zoom": zoom,
+        "clustered": True,
+        "courts": [],
+        "clusters": [{
+            "geohash": cluster["_id"],
+            "count": cluster["count"],
+            "latitude": cluster["latitude"],
+            "longitude": cluster["longitude"],
+            "currentPlayers": cluster["currentPlayers"],
+            # Single-court clusters can be rendered as a regular marker
+            "courtId": str(cluster["courtId"]) if cluster["count"] == 1 else None
+        } for cluster in clusters]
+    })
 
-# Message Routes
-@api_router.get("/messages/conversations")
-async def get_conversations(authorization: Optional[str] = Header(None)):
-    user = await get_current_user(authorization)
-    user_id = ObjectId(user["_id"])
+LIVE_MAX_COURTS = 200
+LIVE_KEEPALIVE_SECONDS = 15
+
+@api_router.get("/courts/live")
+async def court_occupancy_feed(
+    request: Request,
+    ids: Optional[str] = None,
+    min_lat: Optional[float] = Query(None, alias="minLat", ge=-90, le=90),
+    min_lon: Optional[float] = Query(None, alias="minLon", ge=-180, le=180),
+    max_lat: Optional[float] = Query(None, alias="maxLat", ge=-90, le=90),
+    max_lon: Optional[float] = Query(None, alias="maxLon", ge=-180, le=180)
+):
+    """
+    Server-sent events stream of occupancy changes for the courts a client is
+    looking at - either a comma-separated list of `ids` or the courts inside a
+    bounding box. The first event is a snapshot of the current counts; after
+    that only changed courts are sent.
+    """
+    if ids:
+        try:
+            court_ids = [ObjectId(court_id) for court_id in ids.split(",") if court_id]
+        except InvalidId:
+            raise HTTPException(status_code=400, detail="Invalid court id")
+        query = {"_id": {"$in": court_ids[:LIVE_MAX_COURTS]}}
+    elif None not in (min_lat, min_lon, max_lat, max_lon):
+        if min_lat >= max_lat or min_lon >= max_lon:
+            raise HTTPException(status_code=400, detail="Invalid viewport bounds")
+        query = viewport_filter(min_lat, min_lon, max_lat, max_lon)
+    else:
+        raise HTTPException(status_code=400, detail="Provide ids or minLat/minLon/maxLat/maxLon")
     
-    # Get all messages involving this user
-    messages = await db.messages.find({
-        "$or": [
-            {"fromUserId": user_id},
-            {"toUserId": user_id}
-        ]
-    }).sort("timestamp", -1).to_list(1000)
+    courts = await db.courts.find(query, {"currentPlayers": 1}).limit(LIVE_MAX_COURTS).to_list(LIVE_MAX_COURTS)
+    snapshot = [{"courtId": str(court["_id"]), "currentPlayers": court.get("currentPlayers", 0)} for court in courts]
+    topics = [court_topic(court["_id"]) for court in courts]
     
-    # Group by conversation
-    conversations = {}
-    for msg in messages:
-        other_user_id = msg["toUserId"] if msg["fromUserId"] == user_id else msg["fromUserId"]
-        other_user_id_str = str(other_user_id)
-        
-        if other_user_id_str not in conversations:
-            other_user = await db.users.find_one({"_id": other_user_id})
-            if other_user:
-                unread_count = await db.messages.count_documents({
-                    "fromUserId": other_user_id,
-                    "toUserId": user_id,
-                    "read": False
-                })
-                
-                conversations[other_user_id_str] = {
-                    "userId": str(other_user["_id"]),
-                    "username": other_user["username"],
-                    "profilePic": other_user.get("profilePic"),
-                    "lastMessage": msg["message"],
-                    "timestamp": msg["timestamp"],
-                    "unreadCount": unread_count
-                }
+    async def event_stream():
+        queue = asyncio.Queue(maxsize=REALTIME_QUEUE_SIZE)
+        for topic in topics:
+            realtime.subscribe(topic, queue)
+        try:
+            yield f"event: snapshot\ndata: {json.dumps(snapshot)}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=LIVE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: occupancy\ndata: {json.dumps(event)}\n\n"
+        finally:
+            for topic in topics:
+                realtime.unsubscribe(topic, queue)
     
-    return list(conversations.values())
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-@api_router.get("/messages/{other_user_id}")
-async def get_messages(other_user_id: str, authorization: Optional[str] = Header(None)):
+@api_router.get("/courts/{court_id}")
+async def get_court(court_id: str, request: Request):
+    court_id = parse_court_id(court_id)
+    catalog = await get_court_catalog()
+    fragment = catalog.fragments.get(court_id)
+    if fragment is None:
+        court = await db.courts.find_one({"_id": court_id}, COURT_STATIC_PROJECTION)
+        if not court:
+            raise HTTPException(status_code=404, detail="Court not found")
+        # Added since the catalog was loaded
+        invalidate_court_catalog()
+        fragment = court_static_fragment(court)
+        average_players = court.get("averagePlayers", 12)
+    else:
+        average_players = catalog.scoring.average_players[catalog.scoring.positions[court_id]]
+    
+    occupancy = await get_court_occupancy()
+    expected_players = expected_players_at(
+        [court_id], np.array([average_players], dtype=float), await get_court_profiles(),
+        datetime.now(), datetime.utcnow()
+    )[0]
+    return json_etag_response(request, court_json(fragment, occupancy.get(court_id, 0), expected_players))
+
+# Check-in service
+# A court's currentPlayers is recomputed from the size of its publicUsersAtCourt set in the
+# same atomic update that adds or removes the player, so concurrent check-ins can't make
+# the count drift or go negative, and every write returns the new count without a re-read.
+# The same update bumps occupancyVersion, which orders the counts for the history writes.
+COUNT_PLAYERS_STAGE = {"$set": {
+    "currentPlayers": {"$size": "$publicUsersAtCourt"},
+    "occupancyVersion": {"$add": [{"$ifNull": ["$occupancyVersion", 0]}, 1]}
+}}
+OCCUPANCY_PROJECTION = {"currentPlayers": 1, "occupancyVersion": 1}
+
+async def join_court(court_id: ObjectId, user_id: str) -> Optional[int]:
+    """Add a public player to a court; returns the new count, or None if the court doesn't exist"""
+    court = await db.courts.find_one_and_update(
+        {"_id": court_id},
+        [
+            {"$set": {"publicUsersAtCourt": {"$setUnion": [{"$ifNull": ["$publicUsersAtCourt", []]}, [user_id]]}}},
+            COUNT_PLAYERS_STAGE
+        ],
+        projection=OCCUPANCY_PROJECTION,
+        return_document=ReturnDocument.AFTER
+    )
+    if not court:
+        return None
+    await publish_court_occupancy(court_id, court["currentPlayers"], court["occupancyVersion"])
+    return court["currentPlayers"]
+
+async def leave_court(court_id: ObjectId, user_id: str) -> Optional[int]:
+    """Remove a player from a court (a no-op if they aren't there); returns the new count"""
+    court = await db.courts.find_one_and_update(
+        {"_id": court_id},
+        [
+            {"$set": {"publicUsersAtCourt": {"$filter": {
+                "input": {"$ifNull": ["$publicUsersAtCourt", []]},
+                "cond": {"$ne": ["$$this", user_id]}
+            }}}},
+            COUNT_PLAYERS_STAGE
+        ],
+        projection=OCCUPANCY_PROJECTION,
+        return_document=ReturnDocument.AFTER
+    )
+    if not court:
+        return None
+    await publish_court_occupancy(court_id, court["currentPlayers"], court["occupancyVersion"])
+    return court["currentPlayers"]
+
+async def checkin_user(user: dict, court_id: ObjectId) -> int:
+    """
+    Move a user to a court. The court is joined first (which also proves it
+    exists) and the session opened, then the user's currentCourtId is swapped
+    atomically, and only then is the court returned by the swap left - so
+    concurrent check-ins by the same user always converge on one court. A
+    check-in interrupted between those writes is repaired by
+    reconcile_court_memberships. The user records the session as
+    currentCheckinId, so the idle sweep only checks out the session it closed.
+    """
+    user_id = user["_id"]
+    if user.get("isPublic", True):
+        current_players = await join_court(court_id, user_id)
+    else:
+        court = await db.courts.find_one({"_id": court_id}, {"currentPlayers": 1})
+        current_players = court.get("currentPlayers", 0) if court else None
+    if current_players is None:
+        raise HTTPException(status_code=404, detail="Court not found")
+    
+    session_id = await open_checkin_session(user, court_id)
+    previous = await db.users.find_one_and_update(
+        {"_id": ObjectId(user_id)},
+        {"$set": {"currentCourtId": court_id, "currentCheckinId": session_id}},
+        projection={"currentCourtId": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    invalidate_user(user_id)
+    
+    previous_court_id = previous.get("currentCourtId") if previous else None
+    if previous_court_id and ObjectId(previous_court_id) != court_id:
+        await leave_court(ObjectId(previous_court_id), user_id)
+        await close_checkin_sessions(user_id, ObjectId(previous_court_id), "moved")
+    
+    return current_players
+
+async def checkout_user(user_id: str, court_id: ObjectId) -> int:
+    """Check a user out of court_id if that is where they are; returns the court's count"""
+    previous = await db.users.find_one_and_update(
+        {"_id": ObjectId(user_id), "currentCourtId": court_id},
+        {"$set": {"currentCourtId": None}, "$unset": {"currentCheckinId": ""}},
+        projection={"_id": 1}
+    )
+    invalidate_user(user_id)
+    
+    if previous:
+        current_players = await leave_court(court_id, user_id)
+        await close_checkin_sessions(user_id, court_id, "checkout")
+    else:
+        # Not checked in here - nothing to undo
+        court = await db.courts.find_one({"_id": court_id}, {"currentPlayers": 1})
+        current_players = court.get("currentPlayers", 0) if court else None
+    
+    return current_players or 0
+
+# Check-in sessions: one `checkins` document per visit. Sessions idle for longer than
+# CHECKIN_IDLE_HOURS are closed by a background sweeper, which also checks the player
+# out; closed sessions are kept for CHECKIN_HISTORY_DAYS (TTL index) as play history.
+CHECKIN_IDLE_HOURS = float(os.environ.get('CHECKIN_IDLE_HOURS', '3'))
+CHECKIN_HISTORY_DAYS = int(os.environ.get('CHECKIN_HISTORY_DAYS', '30'))
+CHECKIN_SWEEP_INTERVAL_SECONDS = 300
+CHECKIN_SWEEP_BATCH_SIZE = 1000
+
+async def open_checkin_session(user: dict, court_id: ObjectId) -> ObjectId:
+    """Start a session at court_id, or refresh the open one (re-checking in keeps it alive); returns its id"""
+    now = datetime.utcnow()
+    session = await db.checkins.find_one_and_update(
+        {"userId": ObjectId(user["_id"]), "courtId": court_id, "endedAt": None},
+        {
+            "$set": {"lastSeenAt": now, "isPublic": user.get("isPublic", True)},
+            "$setOnInsert": {"startedAt": now}
+        },
+        projection=ID_PROJECTION,
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return session["_id"]
+
+async def close_checkin_sessions(user_id: str, court_id: ObjectId, reason: str):
+    await db.checkins.update_many(
+        {"userId": ObjectId(user_id), "courtId": court_id, "endedAt": None},
+        {"$set": {"endedAt": datetime.utcnow(), "endReason": reason}}
+    )
+
+async def sweep_idle_checkins() -> int:
+    """Close idle sessions and check their players out in bulk; returns sessions closed"""
+    now = datetime.utcnow()
+    cutoff = now - timedelta(hours=CHECKIN_IDLE_HOURS)
+    idle = await db.checkins.find(
+        {"endedAt": None, "lastSeenAt": {"$lt": cutoff}}, ID_PROJECTION
+    ).limit(CHECKIN_SWEEP_BATCH_SIZE).to_list(CHECKIN_SWEEP_BATCH_SIZE)
+    if not idle:
+        return 0
+    idle_ids = [session["_id"] for session in idle]
+    
+    # Tag the sessions this sweep closes, so ones refreshed in the meantime are left alone
+    sweep_id = ObjectId()
+    await db.checkins.update_many(
+        {"_id": {"$in": idle_ids}, "endedAt": None, "lastSeenAt": {"$lt": cutoff}},
+        {"$set": {"endedAt": now, "endReason": "expired", "sweepId": sweep_id}}
+    )
+    sessions = await db.checkins.find({"sweepId": sweep_id}, {"userId": 1, "courtId": 1}).to_list(None)
+    if not sessions:
+        return 0
+    
+    # Only check out users still on the session this sweep closed - one who checked in
+    # again since has a new currentCheckinId. Users checked in before sessions were
+    # recorded on the user document are matched by court instead.
+    await db.users.bulk_write([
+        UpdateOne(
+            {"_id": session["userId"], "$or": [
+                {"currentCheckinId": session["_id"]},
+                {"currentCourtId": session["courtId"], "currentCheckinId": {"$exists": False}}
+            ]},
+            {"$set": {"currentCourtId": None}, "$unset": {"currentCheckinId": ""}}
+        )
+        for session in sessions
+    ], ordered=False)
+    
+    user_ids = list({session["userId"] for session in sessions})
+    checked_in = await db.users.find(
+        {"_id": {"$in": user_ids}, "currentCourtId": {"$ne": None}}, {"currentCourtId": 1}
+    ).to_list(len(user_ids))
+    still_at_court = {(user["_id"], ObjectId(user["currentCourtId"])) for user in checked_in}
+    
+    players_by_court = {}
+    for session in sessions:
+        invalidate_user(session["userId"])
+        if (session["userId"], session["courtId"]) in still_at_court:
+            continue
+        players_by_court.setdefault(session["courtId"], []).append(str(session["userId"]))
+    if not players_by_court:
+        return len(sessions)
+    
+    await db.courts.bulk_write([
+        UpdateOne(
+            {"_id": court_id},
+            [
+                {"$set": {"publicUsersAtCourt": {"$filter": {
+                    "input": {"$ifNull": ["$publicUsersAtCourt", []]},
+                    "cond": {"$not": {"$in": ["$$this", player_ids]}}
+                }}}},
+                COUNT_PLAYERS_STAGE
+            ]
+        )
+        for court_id, player_ids in players_by_court.items()
+    ], ordered=False)
+    
+    courts = await db.courts.find(
+        {"_id": {"$in": list(players_by_court)}}, OCCUPANCY_PROJECTION
+    ).to_list(len(players_by_court))
+    for court in courts:
+        await publish_court_occupancy(court["_id"], court.get("currentPlayers", 0), court["occupancyVersion"])
+    
+    logging.info(f"Auto-checked out {len(sessions)} idle sessions across {len(players_by_court)} courts")
+    return len(sessions)
+
+# A check-in touches the court and the user in separate writes, so a worker dying
+# between them leaves the court's member list disagreeing with users.currentCourtId.
+# One worker (the lease holder) compares the two on each sweep, a page of courts and
+# users at a time; a disagreement seen on two consecutive sweeps can't be an
+# in-flight check-in and is repaired in favour of users.currentCourtId.
+MEMBERSHIP_RECONCILE_PAGE_SIZE = 500
+suspected_membership_mismatches = set()
+
+async def find_membership_mismatches() -> set:
+    """("join" | "leave", court_id, user_id) for each member list entry that disagrees with the user's currentCourtId"""
+    mismatches = set()
+    
+    # Listed players whose currentCourtId points elsewhere (or who went private)
+    after_id = None
+    while True:
+        query = {"publicUsersAtCourt.0": {"$exists": True}}
+        if after_id is not None:
+            query["_id"] = {"$gt": after_id}
+        courts = await db.courts.find(query, {"publicUsersAtCourt": 1}).sort("_id", 1).limit(
+            MEMBERSHIP_RECONCILE_PAGE_SIZE
+        ).to_list(MEMBERSHIP_RECONCILE_PAGE_SIZE)
+        if not courts:
+            break
+        after_id = courts[-1]["_id"]
+        
+        listed = {(court["_id"], user_id) for court in courts for user_id in court["publicUsersAtCourt"]}
+        users = await db.users.find(
+            {"_id": {"$in": list({ObjectId(user_id) for _, user_id in listed})}},
+            {"currentCourtId": 1, "isPublic": 1}
+        ).to_list(None)
+        at_court = {
+            (ObjectId(user["currentCourtId"]), str(user["_id"]))
+            for user in users if user.get("currentCourtId") and user.get("isPublic", True)
+        }
+        mismatches |= {("leave", court_id, user_id) for court_id, user_id in listed - at_court}
+    
+    # Checked-in public players missing from their court's list
+    after_id = None
+    while True:
+        query = {"currentCourtId": {"$ne": None}, "isPublic": {"$ne": False}}
+        if after_id is not None:
+            query["_id"] = {"$gt": after_id}
+        users = await db.users.find(query, {"currentCourtId": 1}).sort("_id", 1).limit(
+            MEMBERSHIP_RECONCILE_PAGE_SIZE
+        ).to_list(MEMBERSHIP_RECONCILE_PAGE_SIZE)
+        if not users:
+            break
+        after_id = users[-1]["_id"]
+        
+        expected = {(ObjectId(user["currentCourtId"]), str(user["_id"])) for user in users}
+        courts = await db.courts.find(
+            {"_id": {"$in": list({court_id for court_id, _ in expected})}}, {"publicUsersAtCourt": 1}
+        ).to_list(None)
+        listed = {
+            (court["_id"], user_id)
+            for court in courts for user_id in court.get("publicUsersAtCourt", [])
+        }
+        mismatches |= {("join", court_id, user_id) for court_id, user_id in expected - listed}
+    
+    return mismatches
+
+async def reconcile_court_memberships() -> int:
+    """Repair member lists that disagreed with users.currentCourtId on the last two sweeps; returns entries repaired"""
+    global suspected_membership_mismatches
+    mismatches = await find_membership_mismatches()
+    confirmed = mismatches & suspected_membership_mismatches
+    suspected_membership_mismatches = mismatches - confirmed
+
+    for action, court_id, user_id in confirmed:
+        if action == "join":
+            await join_court(court_id, user_id)
+        else:
+            await leave_court(court_id, user_id)
+    if confirmed:
+        logging.info(f"Repaired {len(confirmed)} court memberships out of step with users.currentCourtId")
+    return len(confirmed)
+
+async def checkin_sweeper():
+    while True:
+        try:
+            await sweep_idle_checkins()
+            if await acquire_lease("courtMemberships", 2 * CHECKIN_SWEEP_INTERVAL_SECONDS):
+                await reconcile_court_memberships()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Check-in sweep error: {str(e)}")
+        await asyncio.sleep(CHECKIN_SWEEP_INTERVAL_SECONDS)
+
+# Occupancy history: every occupancy change is folded into an hourly `court_occupancy`
+# bucket per court (UTC hours) holding the time-weighted player count so far. An hourly
+# job, run by one worker under a lease, rolls the last COURT_PROFILE_WEEKS of buckets
+# into `court_profiles`: expected players for each hour of the week, which replace the
+# static averagePlayers seed as history accumulates. Workers keep all profiles in
+# memory for O(1) lookups.
+COURT_PROFILE_WEEKS = int(os.environ.get('COURT_PROFILE_WEEKS', '8'))
+COURT_PROFILE_INTERVAL_SECONDS = 3600
+COURT_PROFILE_CACHE_TTL_SECONDS = 600
+COURT_OCCUPANCY_PROJECTION = {"courtId": 1, "hour": 1, "players": 1, "playerSeconds": 1, "firstAt": 1, "updatedAt": 1}
+COURT_PROFILE_PROJECTION = {"expectedPlayers": 1, "weeksObserved": 1}
+
+async def record_occupancy_history(court_id, current_players: int, version: int):
+    """
+    Fold a count into the court's bucket for this hour. Concurrent check-ins can land
+    here out of order, so a count older than the bucket's (by the court's occupancyVersion)
+    only raises the peak, and time is never accrued backwards.
+    """
+    now = datetime.utcnow()
+    hour = now.replace(minute=0, second=0, microsecond=0)
+    newer = {"$gt": [version, {"$ifNull": ["$version", 0]}]}
+    await db.court_occupancy.update_one(
+        {"courtId": ObjectId(court_id), "hour": hour},
+        [{"$set": {
+            # The previous count held from the last change until now
+            "playerSeconds": {"$cond": [newer, {"$add": [
+                {"$ifNull": ["$playerSeconds", 0]},
+                {"$multiply": [
+                    {"$ifNull": ["$players", 0]},
+                    {"$max": [0, {"$divide": [{"$subtract": [now, {"$ifNull": ["$updatedAt", now]}]}, 1000]}]}
+                ]}
+            ]}, "$playerSeconds"]},
+            "firstAt": {"$ifNull": ["$firstAt", now]},
+            "players": {"$cond": [newer, current_players, "$players"]},
+            "peak": {"$max": [{"$ifNull": ["$peak", 0]}, current_players]},
+            "version": {"$cond": [newer, version, "$version"]},
+            "updatedAt": {"$cond": [newer, {"$max": [now, {"$ifNull": ["$updatedAt", now]}]}, "$updatedAt"]}
+        }}],
+        upsert=True
+    )
+
+def bucket_average_players(bucket: dict, opening_players: int) -> float:
+    """
+    Time-weighted players over a completed hour: the count carried in from earlier
+    hours until the first change, the recorded changes, then the last count to the
+    end of the hour
+    """
+    hour_end = bucket["hour"] + timedelta(hours=1)
+    player_seconds = (
+        opening_players * (bucket["firstAt"] - bucket["hour"]).total_seconds()
+        + bucket["playerSeconds"]
+        + bucket["players"] * (hour_end - bucket["updatedAt"]).total_seconds()
+    )
+    return player_seconds / 3600
+
+def occupancy_profile(buckets: list, end: datetime, start: Optional[datetime] = None,
+                      opening_players: int = 0) -> dict:
+    """
+    Expected players per hour of the week from one court's buckets (sorted by hour).
+    A court with history before the window passes the window `start` and the count it
+    last recorded before it, which is held until the first bucket in the window.
+    """
+    first_hour = start or buckets[0]["hour"]
+    hours = int((end - first_hour).total_seconds() // 3600)
+    averages = np.zeros(hours)
+    carried = opening_players
+    position = 0
+    for bucket in buckets:
+        index = int((bucket["hour"] - first_hour).total_seconds() // 3600)
+        # Hours without changes kept the last count
+        averages[position:index] = carried
+        averages[index] = bucket_average_players(bucket, carried)
+        carried = bucket["players"]
+        position = index + 1
+    averages[position:] = carried
+    
+    slots = (weekly_slot(first_hour) + np.arange(hours)) % HOURS_PER_WEEK
+    totals = np.bincount(slots, weights=averages, minlength=HOURS_PER_WEEK)
+    counts = np.bincount(slots, minlength=HOURS_PER_WEEK)
+    return {
+        "expectedPlayers": np.round(totals / np.maximum(counts, 1), 2).tolist(),
+        "weeksObserved": round(hours / HOURS_PER_WEEK, 2)
+    }
+
+async def build_court_profiles() -> int:
+    """Recompute every court's profile from the completed hours in the window; returns courts profiled"""
+    end = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    start = end - timedelta(weeks=COURT_PROFILE_WEEKS)
+    # The count each court last recorded before the window is carried into its first hour
+    opening = await db.court_occupancy.aggregate([
+        {"$match": {"hour": {"$lt": start}}},
+        {"$sort": {"courtId": -1, "hour": -1}},
+        {"$group": {"_id": "$courtId", "players": {"$first": "$players"}}}
+    ]).to_list(None)
+    opening_players = {row["_id"]: row["players"] for row in opening}
+    cursor = db.court_occupancy.find(
+        {"hour": {"$gte": start, "$lt": end}}, COURT_OCCUPANCY_PROJECTION
+    ).sort([("courtId", 1), ("hour", 1)])
+    
+    court_ids = []
+    updates = []
+    buckets = []
+    
+    def add_profile():
+        court_id = buckets[0]["courtId"]
+        court_ids.append(court_id)
+        if court_id in opening_players:
+            profile = occupancy_profile(buckets, end, start, opening_players[court_id])
+        else:
+            profile = occupancy_profile(buckets, end)
+        updates.append(ReplaceOne(
+            {"_id": court_id},
+            {**profile, "updatedAt": end},
+            upsert=True
+        ))
+    
+    async for bucket in cursor:
+        if buckets and bucket["courtId"] != buckets[0]["courtId"]:
+            add_profile()
+            buckets = []
+        buckets.append(bucket)
+    if buckets:
+        add_profile()
+    
+    if updates:
+        await db.court_profiles.bulk_write(updates, ordered=False)
+    # Courts without history in the window go back to the prior
+    await db.court_profiles.delete_many({"_id": {"$nin": court_ids}})
+    court_profile_cache.clear()
+    logging.info(f"Built occupancy profiles for {len(updates)} courts")
+    return len(updates)
+
+async def court_profile_builder():
+    """Rebuilds the profiles on the worker holding the lease; the others read the result from `court_profiles`"""
+    while True:
+        try:
+            if await acquire_lease("courtProfiles", 2 * COURT_PROFILE_INTERVAL_SECONDS):
+                await build_court_profiles()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Court profile build error: {str(e)}")
+        await asyncio.sleep(COURT_PROFILE_INTERVAL_SECONDS)
+
+court_profile_cache = TTLCache(max_size=1, ttl=COURT_PROFILE_CACHE_TTL_SECONDS)
+court_profile_lock = asyncio.Lock()
+
+async def get_court_profiles() -> dict:
+    """{court id: (expected players per hour of the week, weeks observed)}"""
+    profiles = court_profile_cache.get("profiles")
+    if profiles is not None:
+        return profiles
+    
+    async with court_profile_lock:
+        profiles = court_profile_cache.peek("profiles")
+        if profiles is None:
+            documents = await db.court_profiles.find({}, COURT_PROFILE_PROJECTION).to_list(None)
+            profiles = {
+                document["_id"]: (np.array(document["expectedPlayers"], dtype=float), document["weeksObserved"])
+                for document in documents
+            }
+            court_profile_cache.set("profiles", profiles)
+        return profiles
+
+def expected_players_at(
+    court_ids: list, average_players: np.ndarray, profiles: dict, now: datetime, utc_now: datetime
+) -> np.ndarray:
+    """
+    Expected players at each court this hour: the learned profile where there is
+    history, blended with averagePlayers scaled by the hour-of-day prior. The
+    profile slot is read at utc_now, as occupancy buckets are UTC hours; the prior
+    uses now, the server's local clock, like the rest of the recommendation's
+    time of day.
+    """
+    slot = weekly_slot(utc_now)
+    learned = np.zeros(len(court_ids))
+    weeks_observed = np.zeros(len(court_ids))
+    for i, court_id in enumerate(court_ids):
+        profile = profiles.get(court_id)
+        if profile is not None:
+            learned[i] = profile[0][slot]
+            weeks_observed[i] = profile[1]
+    return blend_expected_players(average_players * activity_prior(now), learned, weeks_observed)
+
+def parse_court_id(court_id: str) -> ObjectId:
+    try:
+        return ObjectId(court_id)
+    except InvalidId:
+        raise HTTPException(status_code=400, detail="Invalid court id")
+
+@api_router.post("/courts/{court_id}/checkin")
+async def checkin_court(court_id: str, authorization: Optional[str] = Header(None)):
+    user = await get_current_user(authorization)
+    current_players = await checkin_user(user, parse_court_id(court_id))
+    return {
+        "message": "Checked in successfully",
+        "currentPlayers": current_players
+    }
+
+@api_router.post("/courts/{court_id}/checkout")
+async def checkout_court(court_id: str, authorization: Optional[str] = Header(None)):
+    user = await get_current_user(authorization)
+    current_players = await checkout_user(user["_id"], parse_court_id(court_id))
+    return {
+        "message": "Checked out successfully",
+        "currentPlayers": current_players
+    }
+
+# Message Routes
+@api_router.get("/messages/conversations")
+async def get_conversations(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    authorization: Optional[str] = Header(None)
+):
     user = await get_current_user(authorization)
     user_id = ObjectId(user["_id"])
-    other_id = ObjectId(other_user_id)
     
-    # Mark messages as read
-    await db.messages.update_many(
-        {"fromUserId": other_id, "toUserId": user_id},
+    # Read from the materialized summaries, newest first; the cursor is the
+    # (timestamp, _id) of the final conversation on the previous page
+    query = {"participants": user_id}
+    if cursor:
+        after_timestamp, after_key = decode_cursor(cursor, datetime, str)
+        query["$or"] = [
+            {"timestamp": {"$lt": after_timestamp}},
+            {"timestamp": after_timestamp, "_id": {"$lt": after_key}}
+        ]
+    
+    conversations = await db.conversations.find(query, CONVERSATION_PROJECTION).sort(
+        [("timestamp", -1), ("_id", -1)]
+    ).limit(limit + 1).to_list(limit + 1)
+    if len(conversations) > limit:
+        conversations = conversations[:limit]
+        set_next_cursor(response, encode_cursor(conversations[-1]["timestamp"], conversations[-1]["_id"]))
+    
+    # Partner profiles in one round trip
+    other_user_ids = [
+        next(participant for participant in conv["participants"] if participant != user_id)
+        for conv in conversations
+    ]
+    other_users = await db.users.find(
+        {"_id": {"$in": other_user_ids}}, USER_SUMMARY_PROJECTION
+    ).to_list(len(other_user_ids))
+    other_users_by_id = {other_user["_id"]: other_user for other_user in other_users}
+    
+    results = []
+    for conv, other_user_id in zip(conversations, other_user_ids):
+        other_user = other_users_by_id.get(other_user_id)
+        if not other_user:
+            continue
+        results.append({
+            "userId": str(other_user_id),
+            "username": other_user["username"],
+            "profilePic": other_user.get("profilePic"),
+            "lastMessage": conv["lastMessage"],
+            "timestamp": conv["timestamp"],
+            "unreadCount": conv.get("unread", {}).get(str(user_id), 0)
+        })
+    
+    return fast_json(results, response)
+
+async def mark_conversation_read(user_id: ObjectId, other_id: ObjectId):
+    """Mark messages from other_id to user_id as read and notify the sender"""
+    result = await db.messages.update_many(
+        {"fromUserId": other_id, "toUserId": user_id, "read": False},
         {"$set": {"read": True}}
     )
+    if result.modified_count:
+        # Subtract only what was marked here - messages sent meanwhile stay unread
+        unread = f"unread.{user_id}"
+        await db.conversations.update_one(
+            {"_id": conversation_key(user_id, other_id)},
+            [{"$set": {unread: {"$max": [
+                0, {"$subtract": [{"$ifNull": [f"${unread}", 0]}, result.modified_count]}
+            ]}}}]
+        )
+        await realtime.publish(user_topic(other_id), {
+            "type": "read",
+            "userId": str(user_id),
+            "readAt": datetime.utcnow()
+        })
+
+@api_router.get("/messages/{other_user_id}")
+async def get_messages(
+    other_user_id: str,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    authorization: Optional[str] = Header(None)
+):
+    user = await get_current_user(authorization)
+    user_id = ObjectId(user["_id"])
+    other_id = ObjectId(other_user_id)
     
-    # Get messages
-    messages = await db.messages.find({
+    await mark_conversation_read(user_id, other_id)
+    
+    # Get the newest page of messages; the cursor pages back towards older ones
+    query = {
         "$or": [
             {"fromUserId": user_id, "toUserId": other_id},
             {"fromUserId": other_id, "toUserId": user_id}
         ]
-    }).sort("timestamp", 1).to_list(1000)
+    }
+    if cursor:
+        before_timestamp, before_id = decode_cursor(cursor, datetime, ObjectId)
+        query = {"$and": [query, {
+            "$or": [
+                {"timestamp": {"$lt": before_timestamp}},
+                {"timestamp": before_timestamp, "_id": {"$lt": before_id}}
+            ]
+        }]}
     
-    return [{
+    messages = await db.messages.find(query, MESSAGE_PROJECTION).sort([("timestamp", -1), ("_id", -1)]).limit(limit + 1).to_list(limit + 1)
+    if len(messages) > limit:
+        messages = messages[:limit]
+        set_next_cursor(response, encode_cursor(messages[-1]["timestamp"], messages[-1]["_id"]))
+    messages.reverse()  # chronological order for display
+    
+    return fast_json([{
         "id": str(msg["_id"]),
         "fromUserId": str(msg["fromUserId"]),
         "toUserId": str(msg["toUserId"]),
         "message": msg["message"],
         "timestamp": msg["timestamp"],
         "read": msg.get("read", False)
-    } for msg in messages]
+    } for msg in messages], response)
 
 @api_router.post("/messages/send")
 async def send_message(message: MessageSend, authorization: Optional[str] = Header(None)):
@@ -1536,7 +3200,34 @@ async def send_message(message: MessageSend, authorization: Optional[str] = Head
     
     result = await db.messages.insert_one(message_dict)
     
-    return {
+    # Keep the conversation summary in step with the new message
+    from_id = message_dict["fromUserId"]
+    to_id = message_dict["toUserId"]
+    # Concurrent sends can land out of order, so the last message only moves forward
+    timestamp = message_dict["timestamp"]
+    is_newer = {"$or": [
+        {"$gt": [timestamp, {"$ifNull": ["$timestamp", EPOCH]}]},
+        {"$and": [{"$eq": [timestamp, "$timestamp"]}, {"$gt": [result.inserted_id, "$lastMessageId"]}]}
+    ]}
+    
+    def if_newer(value, field):
+        return {"$cond": [is_newer, {"$literal": value}, f"${field}"]}
+    
+    unread = f"unread.{to_id}"
+    await db.conversations.update_one(
+        {"_id": conversation_key(from_id, to_id)},
+        [{"$set": {
+            "participants": {"$literal": sorted([from_id, to_id])},
+            "lastMessageId": if_newer(result.inserted_id, "lastMessageId"),
+            "lastMessage": if_newer(message.message, "lastMessage"),
+            "lastFromUserId": if_newer(from_id, "lastFromUserId"),
+            "timestamp": if_newer(timestamp, "timestamp"),
+            unread: {"$add": [{"$ifNull": [f"${unread}", 0]}, 1]}
+        }}],
+        upsert=True
+    )
+    
+    sent_message = {
         "id": str(result.inserted_id),
         "fromUserId": user["_id"],
         "toUserId": message.toUserId,
@@ -1544,29 +3235,190 @@ async def send_message(message: MessageSend, authorization: Optional[str] = Head
         "timestamp": message_dict["timestamp"],
         "read": False
     }
+    
+    # Push to the recipient and to the sender's other open sessions
+    event = {"type": "message", "message": sent_message}
+    await realtime.publish(user_topic(to_id), event)
+    await realtime.publish(user_topic(from_id), event)
+    
+    return sent_message
+
+# Realtime chat WebSocket
+# Server -> client events: {"type": "message", "message": {...}}, {"type": "read", "userId", "readAt"},
+#                          {"type": "typing", "userId", "isTyping"}
+# Client -> server events: {"type": "typing", "toUserId", "isTyping"}, {"type": "read", "userId"}
+@app.websocket("/ws")
+async def chat_websocket(websocket: WebSocket, token: Optional[str] = None):
+    # Browsers can't set headers on WebSocket requests, so the JWT may also come as ?token=
+    authorization = websocket.headers.get("authorization") or (f"Bearer {token}" if token else None)
+    try:
+        user = await get_current_user(authorization)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    await websocket.accept()
+    user_id = user["_id"]
+    topic = user_topic(user_id)
+    queue = asyncio.Queue(maxsize=REALTIME_QUEUE_SIZE)
+    realtime.subscribe(topic, queue)
+    sender = asyncio.create_task(send_realtime_events(websocket, queue))
+    
+    try:
+        while True:
+            try:
+                event = json.loads(await websocket.receive_text())
+            except ValueError:
+                continue
+            await handle_client_event(user_id, event)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logging.error(f"WebSocket error for user {user_id}: {str(e)}")
+    finally:
+        realtime.unsubscribe(topic, queue)
+        sender.cancel()
+
+async def send_realtime_events(websocket: WebSocket, queue: asyncio.Queue):
+    while True:
+        event = await queue.get()
+        await websocket.send_json(jsonable_encoder(event))
+
+# Typing indicators only reach users the sender already has a conversation or a
+# connection with. Clients send them on every keystroke, so allowed pairs are cached.
+TYPING_PERMISSION_TTL_SECONDS = 60
+typing_permissions = TTLCache(max_size=10000, ttl=TYPING_PERMISSION_TTL_SECONDS)
+
+async def may_send_typing(from_id: ObjectId, to_id: ObjectId) -> bool:
+    key = (from_id, to_id)
+    if typing_permissions.get(key):
+        return True
+    conversation = await db.conversations.find_one({"_id": conversation_key(from_id, to_id)}, ID_PROJECTION)
+    allowed = conversation is not None or bool(await connected_ids(from_id, [to_id]))
+    if allowed:
+        typing_permissions.set(key, True)
+    return allowed
+
+async def handle_client_event(user_id: str, event: dict):
+    if not isinstance(event, dict):
+        return
+    
+    try:
+        if event.get("type") == "typing" and event.get("toUserId"):
+            to_id = ObjectId(event["toUserId"])
+            if not await may_send_typing(ObjectId(user_id), to_id):
+                return
+            await realtime.publish(user_topic(to_id), {
+                "type": "typing",
+                "userId": user_id,
+                "isTyping": bool(event.get("isTyping", True))
+            })
+        elif event.get("type") == "read" and event.get("userId"):
+            await mark_conversation_read(ObjectId(user_id), ObjectId(event["userId"]))
+    except InvalidId:
+        logging.warning(f"Ignoring realtime event with invalid user id from {user_id}")
 
 # Networking Routes
+
+# Accepted friendships are denormalized into `connections`: one edge per
+# direction, {userId, otherId, createdAt}, unique on (userId, otherId).
+# friend_requests remains the record of pending/accepted requests.
+
+async def backfill_connections():
+    """
+    One-time migration: build `connections` edges from accepted
+    friend requests. Recorded as done in `meta` once it has run, so edges
+    written by live accepts in the meantime don't cause it to be skipped.
+    """
+    if await migration_completed("connections"):
+        return
+    
+    await db.friend_requests.aggregate([
+        {"$match": {"status": "accepted"}},
+        {
+            "$project": {
+                "_id": 0,
+                "edges": [
+                    {"userId": "$fromUserId", "otherId": "$toUserId"},
+                    {"userId": "$toUserId", "otherId": "$fromUserId"}
+                ],
+                "createdAt": {"$ifNull": ["$acceptedAt", "$createdAt"]}
+            }
+        },
+        {"$unwind": "$edges"},
+        {"$project": {"userId": "$edges.userId", "otherId": "$edges.otherId", "createdAt": 1}},
+        {"$merge": {"into": "connections", "on": ["userId", "otherId"], "whenMatched": "keepExisting", "whenNotMatched": "insert"}}
+    ]).to_list(None)
+    
+    await mark_migration_completed("connections")
+    logging.info("Backfilled connections from accepted friend requests")
+
+async def add_connection(user_a: ObjectId, user_b: ObjectId):
+    """Store both directions of an accepted friendship (idempotent)"""
+    now = datetime.utcnow()
+    await db.connections.bulk_write([
+        UpdateOne(
+            {"userId": user_a, "otherId": user_b},
+            {"$setOnInsert": {"createdAt": now}},
+            upsert=True
+        ),
+        UpdateOne(
+            {"userId": user_b, "otherId": user_a},
+            {"$setOnInsert": {"createdAt": now}},
+            upsert=True
+        )
+    ], ordered=False)
+
+async def connected_ids(user_id: ObjectId, other_ids: list) -> set:
+    """Which of other_ids the user is connected to, in one indexed lookup"""
+    edges = await db.connections.find(
+        {"userId": user_id, "otherId": {"$in": other_ids}},
+        {"otherId": 1}
+    ).to_list(None)
+    return {edge["otherId"] for edge in edges}
+
+async def fetch_users_in_order(user_ids: list, query: Optional[dict] = None) -> list:
+    """Users for the given ids in one $in query, keeping the order of user_ids"""
+    users = await db.users.find(
+        {"_id": {"$in": user_ids}, **(query or {})}, USER_SUMMARY_PROJECTION
+    ).to_list(len(user_ids))
+    users_by_id = {user["_id"]: user for user in users}
+    return [users_by_id[user_id] for user_id in user_ids if user_id in users_by_id]
+
+def network_user_to_dict(user: dict, is_connected: bool) -> dict:
+    return {
+        "id": str(user["_id"]),
+        "username": user["username"],
+        "profilePic": user.get("profilePic"),
+        "isConnected": is_connected
+    }
+
 @api_router.post("/network/friend-request")
 async def send_friend_request(request: FriendRequest, authorization: Optional[str] = Header(None)):
     user = await get_current_user(authorization)
+    user_id = ObjectId(user["_id"])
+    to_user_id = ObjectId(request.toUserId)
+    
+    if await db.connections.find_one({"userId": user_id, "otherId": to_user_id}, {"_id": 1}):
+        raise HTTPException(status_code=400, detail="You are already connected")
     
     # Check if request already exists
     existing_request = await db.friend_requests.find_one({
         "$or": [
-            {"fromUserId": ObjectId(user["_id"]), "toUserId": ObjectId(request.toUserId)},
-            {"fromUserId": ObjectId(request.toUserId), "toUserId": ObjectId(user["_id"])}
+            {"fromUserId": user_id, "toUserId": to_user_id},
+            {"fromUserId": to_user_id, "toUserId": user_id}
         ]
-    })
+    }, {"status": 1})
     
     if existing_request:
         if existing_request.get("status") == "accepted":
-            return {"status": "already_connected", "message": "You are already connected"}
-        return {"status": "pending", "message": "Friend request already sent"}
+            raise HTTPException(status_code=400, detail="You are already connected")
+        raise HTTPException(status_code=400, detail="Friend request already sent")
     
     # Create friend request
     friend_request = {
-        "fromUserId": ObjectId(user["_id"]),
-        "toUserId": ObjectId(request.toUserId),
+        "fromUserId": user_id,
+        "toUserId": to_user_id,
         "status": "pending",
         "createdAt": datetime.utcnow()
     }
@@ -1578,323 +3430,863 @@ async def send_friend_request(request: FriendRequest, authorization: Optional[st
 async def accept_friend_request(request_id: str, authorization: Optional[str] = Header(None)):
     user = await get_current_user(authorization)
     
+    request_filter = {"_id": ObjectId(request_id), "toUserId": ObjectId(user["_id"])}
+    
     # Update request status
-    result = await db.friend_requests.update_one(
-        {"_id": ObjectId(request_id), "toUserId": ObjectId(user["_id"])},
-        {"$set": {"status": "accepted", "acceptedAt": datetime.utcnow()}}
+    friend_request = await db.friend_requests.find_one_and_update(
+        {**request_filter, "status": "pending"},
+        {"$set": {"status": "accepted", "acceptedAt": datetime.utcnow()}},
+        projection={"fromUserId": 1, "toUserId": 1},
+        return_document=ReturnDocument.AFTER
     )
     
-    if result.modified_count == 0:
+    if not friend_request:
+        if await db.friend_requests.find_one(request_filter, ID_PROJECTION):
+            raise HTTPException(status_code=400, detail="Friend request already accepted")
         raise HTTPException(status_code=404, detail="Friend request not found")
     
+    await add_connection(friend_request["fromUserId"], friend_request["toUserId"])
     return {"status": "success", "message": "Friend request accepted"}
 
 @api_router.get("/network/connections")
-async def get_connections(authorization: Optional[str] = Header(None)):
+async def get_connections(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    authorization: Optional[str] = Header(None)
+):
+    user = await get_current_user(authorization)
+    
+    query = {"userId": ObjectId(user["_id"])}
+    if cursor:
+        query["otherId"] = {"$gt": decode_cursor(cursor, ObjectId)[0]}
+    
+    edges = await db.connections.find(query, {"otherId": 1}).sort("otherId", 1).limit(limit + 1).to_list(limit + 1)
+    if len(edges) > limit:
+        edges = edges[:limit]
+        set_next_cursor(response, encode_cursor(edges[-1]["otherId"]))
+    
+    connection_users = await fetch_users_in_order([edge["otherId"] for edge in edges])
+    return fast_json([network_user_to_dict(other_user, True) for other_user in connection_users], response)
+
+@api_router.get("/network/mutual/{other_user_id}")
+async def get_mutual_connections(
+    other_user_id: str,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    authorization: Optional[str] = Header(None)
+):
     user = await get_current_user(authorization)
     user_id = ObjectId(user["_id"])
+    try:
+        other_id = ObjectId(other_user_id)
+    except InvalidId:
+        raise HTTPException(status_code=400, detail="Invalid user id")
     
-    # Get accepted friend requests (both directions)
-    connections = await db.friend_requests.find({
-        "$or": [
-            {"fromUserId": user_id, "status": "accepted"},
-            {"toUserId": user_id, "status": "accepted"}
-        ]
-    }).to_list(1000)
-    
-    # Get user details for each connection
-    connection_users = []
-    for conn in connections:
-        other_user_id = conn["toUserId"] if conn["fromUserId"] == user_id else conn["fromUserId"]
-        other_user = await db.users.find_one({"_id": other_user_id})
-        if other_user:
-            connection_users.append({
-                "id": str(other_user["_id"]),
-                "username": other_user["username"],
-                "profilePic": other_user.get("profilePic"),
-                "isConnected": True
-            })
+    # A mutual connection has an edge from both users
+    match = {"userId": {"$in": [user_id, other_id]}, "otherId": {"$nin": [user_id, other_id]}}
+    if cursor:
+        match["otherId"]["$gt"] = decode_cursor(cursor, ObjectId)[0]
+    
+    mutual = await db.connections.aggregate([
+        {"$match": match},
+        {"$group": {"_id": "$otherId", "edges": {"$sum": 1}}},
+        {"$match": {"edges": 2}},
+        {"$sort": {"_id": 1}},
+        {"$limit": limit + 1}
+    ]).to_list(limit + 1)
+    if len(mutual) > limit:
+        mutual = mutual[:limit]
+        set_next_cursor(response, encode_cursor(mutual[-1]["_id"]))
+    
+    mutual_users = await fetch_users_in_order([row["_id"] for row in mutual])
+    return fast_json([network_user_to_dict(mutual_user, True) for mutual_user in mutual_users], response)
+
+SUGGESTIONS_MAX_FRIENDS = 1000
+
+@api_router.get("/network/suggestions")
+async def get_connection_suggestions(
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    authorization: Optional[str] = Header(None)
+):
+    """Friends-of-friends the user isn't connected to, ranked by mutual connections"""
+    user = await get_current_user(authorization)
+    user_id = ObjectId(user["_id"])
+    
+    edges = await db.connections.find({"userId": user_id}, {"otherId": 1}).limit(SUGGESTIONS_MAX_FRIENDS).to_list(SUGGESTIONS_MAX_FRIENDS)
+    friend_ids = [edge["otherId"] for edge in edges]
+    if not friend_ids:
+        return []
+    
+    suggestions = await db.connections.aggregate([
+        {"$match": {"userId": {"$in": friend_ids}, "otherId": {"$nin": friend_ids + [user_id]}}},
+        {"$group": {"_id": "$otherId", "mutualConnections": {"$sum": 1}}},
+        {"$sort": {"mutualConnections": -1, "_id": 1}},
+        {"$limit": limit}
+    ]).to_list(limit)
     
-    return connection_users
+    mutual_counts = {row["_id"]: row["mutualConnections"] for row in suggestions}
+    suggested_users = await fetch_users_in_order(list(mutual_counts))
+    return fast_json([
+        {**network_user_to_dict(suggested, False), "mutualConnections": mutual_counts[suggested["_id"]]}
+        for suggested in suggested_users
+    ])
+
+RECENT_PLAYERS_DAYS = 14
+
+async def recent_players_response(user_id: ObjectId, players: list) -> list:
+    """Shape player documents for the response, with connection status from one batched lookup"""
+    connected = await connected_ids(user_id, [player["_id"] for player in players])
+    return [network_user_to_dict(player, player["_id"] in connected) for player in players]
 
 @api_router.get("/network/recent-players")
-async def get_recent_players(authorization: Optional[str] = Header(None)):
+async def get_recent_players(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    authorization: Optional[str] = Header(None)
+):
     user = await get_current_user(authorization)
     user_id = ObjectId(user["_id"])
     
-    # Get user's current or recent court
-    current_user = await db.users.find_one({"_id": user_id})
-    if not current_user or not current_user.get("currentCourtId"):
-        # If no current court, find recent courts user has been to
-        # For now, return all public users as potential connections
-        public_users = await db.users.find({
-            "_id": {"$ne": user_id},
-            "isPublic": True
-        }).to_list(100)
+    if user.get("currentCourtId"):
+        # Other public users at the same court, paged in id order
+        court = await db.courts.find_one({"_id": ObjectId(user["currentCourtId"])}, {"publicUsersAtCourt": 1})
+        if not court or not court.get("publicUsersAtCourt"):
+            return []
         
-        recent_players = []
-        for u in public_users:
-            # Check if already connected
-            is_connected = await db.friend_requests.find_one({
-                "$or": [
-                    {"fromUserId": user_id, "toUserId": u["_id"], "status": "accepted"},
-                    {"fromUserId": u["_id"], "toUserId": user_id, "status": "accepted"}
-                ]
-            })
-            
-            recent_players.append({
-                "id": str(u["_id"]),
-                "username": u["username"],
-                "profilePic": u.get("profilePic"),
-                "isConnected": bool(is_connected)
-            })
+        players_at_court = sorted(
+            str(player_id) for player_id in court["publicUsersAtCourt"] if str(player_id) != str(user_id)
+        )
+        if cursor:
+            after_id = decode_cursor(cursor, str)[0]
+            players_at_court = [player_id for player_id in players_at_court if player_id > after_id]
+        if len(players_at_court) > limit:
+            players_at_court = players_at_court[:limit]
+            set_next_cursor(response, encode_cursor(players_at_court[-1]))
         
-        return recent_players
+        players = await fetch_users_in_order([ObjectId(player_id) for player_id in players_at_court], {"isPublic": True})
+        return fast_json(await recent_players_response(user_id, players), response)
     
-    # Get other public users at the same court
-    court_id = current_user["currentCourtId"]
-    court = await db.courts.find_one({"_id": court_id})
+    # If no current court, find players from the courts the user has recently played at
+    since = datetime.utcnow() - timedelta(days=RECENT_PLAYERS_DAYS)
+    played_court_ids = await db.checkins.distinct("courtId", {"userId": user_id, "startedAt": {"$gte": since}})
+    if played_court_ids:
+        pipeline = [
+            {
+                "$match": {
+                    "courtId": {"$in": played_court_ids},
+                    "userId": {"$ne": user_id},
+                    "isPublic": True,
+                    "startedAt": {"$gte": since}
+                }
+            },
+            {"$group": {"_id": "$userId", "lastPlayedAt": {"$max": "$lastSeenAt"}}}
+        ]
+        if cursor:
+            after_played_at, after_user_id = decode_cursor(cursor, datetime, ObjectId)
+            pipeline.append({
+                "$match": {
+                    "$or": [
+                        {"lastPlayedAt": {"$lt": after_played_at}},
+                        {"lastPlayedAt": after_played_at, "_id": {"$lt": after_user_id}}
+                    ]
+                }
+            })
+        pipeline += [{"$sort": {"lastPlayedAt": -1, "_id": -1}}, {"$limit": limit + 1}]
+        
+        played_with = await db.checkins.aggregate(pipeline).to_list(limit + 1)
+        if len(played_with) > limit:
+            played_with = played_with[:limit]
+            set_next_cursor(response, encode_cursor(played_with[-1]["lastPlayedAt"], played_with[-1]["_id"]))
+        
+        players = await fetch_users_in_order([row["_id"] for row in played_with], {"isPublic": True})
+        return fast_json(await recent_players_response(user_id, players), response)
     
-    if not court or not court.get("publicUsersAtCourt"):
-        return []
+    # No play history yet - suggest public users as potential connections
+    id_filter = {"$ne": user_id}
+    if cursor:
+        id_filter["$gt"] = decode_cursor(cursor, ObjectId)[0]
     
-    # Get user details for public users at court
-    recent_players = []
-    for user_id_at_court in court["publicUsersAtCourt"]:
-        if user_id_at_court == user_id:
-            continue
-            
-        other_user = await db.users.find_one({"_id": user_id_at_court})
-        if other_user:
-            # Check if already connected
-            is_connected = await db.friend_requests.find_one({
-                "$or": [
-                    {"fromUserId": user_id, "toUserId": other_user["_id"], "status": "accepted"},
-                    {"fromUserId": other_user["_id"], "toUserId": user_id, "status": "accepted"}
-                ]
-            })
-            
-            recent_players.append({
-                "id": str(other_user["_id"]),
-                "username": other_user["username"],
-                "profilePic": other_user.get("profilePic"),
-                "isConnected": bool(is_connected)
-            })
+    public_users = await db.users.find({
+        "_id": id_filter,
+        "isPublic": True
+    }, USER_SUMMARY_PROJECTION).sort("_id", 1).limit(limit + 1).to_list(limit + 1)
+    if len(public_users) > limit:
+        public_users = public_users[:limit]
+        set_next_cursor(response, encode_cursor(public_users[-1]["_id"]))
     
-    return recent_players
+    return fast_json(await recent_players_response(user_id, public_users), response)
 
 # Media/YouTube Routes
-@api_router.get("/media/youtube")
-async def get_youtube_videos(query: str = "NBA basketball highlights"):
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://www.googleapis.com/youtube/v3/search",
-                params={
-                    "part": "snippet",
-                    "q": query,
-                    "type": "video",
-                    "maxResults": 20,
-                    "key": YOUTUBE_API_KEY,
-                    "videoCategoryId": "17"  # Sports category
-                }
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                videos = []
-                for item in data.get("items", []):
-                    videos.append({
-                        "id": item["id"]["videoId"],
-                        "title": item["snippet"]["title"],
-                        "description": item["snippet"]["description"],
-                        "thumbnail": item["snippet"]["thumbnails"]["high"]["url"],
-                        "channelTitle": item["snippet"]["channelTitle"],
-                        "publishedAt": item["snippet"]["publishedAt"]
-                    })
-                return videos
-            else:
-                raise HTTPException(status_code=500, detail="Failed to fetch YouTube videos")
-    except Exception as e:
-        logging.error(f"YouTube API error: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+# Search results are cached per query: fresh for YOUTUBE_CACHE_TTL_SECONDS, then served
+# stale for up to YOUTUBE_CACHE_STALE_SECONDS while one background refresh runs.
+# Concurrent misses for a query share a single upstream call, and entries are persisted
+# to YOUTUBE_CACHE_PATH so a restarted worker doesn't start cold.
+YOUTUBE_API_URL = os.environ.get('YOUTUBE_API_URL', 'https://www.googleapis.com/youtube/v3/search')
+YOUTUBE_CACHE_TTL_SECONDS = float(os.environ.get('YOUTUBE_CACHE_TTL_SECONDS', '900'))
+YOUTUBE_CACHE_STALE_SECONDS = float(os.environ.get('YOUTUBE_CACHE_STALE_SECONDS', '86400'))
+YOUTUBE_CACHE_PATH = os.environ.get('YOUTUBE_CACHE_PATH', str(ROOT_DIR / 'cache' / 'youtube.json'))
+YOUTUBE_CACHE_MAX_QUERIES = 500
 
-# Court Prediction AI Endpoint
-@api_router.get("/courts/predict/recommended")
-async def get_recommended_court(
-    latitude: Optional[float] = None,
-    longitude: Optional[float] = None
-):
-    """
-    AI-powered court recommendation based on:
-    - Current weather conditions
-    - Time of day and day of week
-    - Historical player patterns
-    - Social media activity (mocked for MVP)
-    - User location
-    """
-    try:
-        # Get environment variables
-        weather_api_key = os.environ.get('OPENWEATHER_API_KEY')
-        openai_key = os.environ.get('EMERGENT_LLM_KEY')
+class YouTubeUpstreamError(Exception):
+    pass
+
+async def fetch_youtube_videos(query: str) -> list:
+    response = await http_clients.get("youtube").request(
+        "GET",
+        YOUTUBE_API_URL,
+        params={
+            "part": "snippet",
+            "q": query,
+            "type": "video",
+            "maxResults": 20,
+            "key": YOUTUBE_API_KEY,
+            "videoCategoryId": "17"  # Sports category
+        }
+    )
+    
+    if response.status_code != 200:
+        raise YouTubeUpstreamError(f"YouTube API returned {response.status_code}")
+    
+    return [{
+        "id": item["id"]["videoId"],
+        "title": item["snippet"]["title"],
+        "description": item["snippet"]["description"],
+        "thumbnail": item["snippet"]["thumbnails"]["high"]["url"],
+        "channelTitle": item["snippet"]["channelTitle"],
+        "publishedAt": item["snippet"]["publishedAt"]
+    } for item in response.json().get("items", [])]
+
+class YouTubeSearchCache:
+    """Stale-while-revalidate cache of search results, persisted to a JSON file"""
+    def __init__(self, path: Optional[str], ttl: float, stale_ttl: float, max_entries: int):
+        self.path = Path(path) if path else None
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # query -> {"fetchedAt": epoch seconds, "videos": [...]}
+        self.flights = SingleFlight()
+        self.refreshes = set()
+        self.save_lock = asyncio.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.upstream_calls = 0
+        self.upstream_errors = 0
+    
+    @staticmethod
+    def cache_key(query: str) -> str:
+        return " ".join(query.lower().split())
+    
+    async def load(self):
+        if not self.path:
+            return
+        try:
+            entries = json.loads(await asyncio.to_thread(self.path.read_text))
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable YouTube cache file {self.path}: {str(e)}")
+            return
+        
+        # Entries are also kept past the stale window, as a fallback when YouTube is down
+        for key, entry in sorted(entries.items(), key=lambda item: item[1]["fetchedAt"]):
+            self.entries[key] = entry
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        logging.info(f"Loaded {len(self.entries)} cached YouTube searches")
+    
+    async def save(self):
+        if not self.path:
+            return
+        snapshot = json.dumps(self.entries)
         
-        if not weather_api_key or not openai_key:
-            raise HTTPException(status_code=500, detail="API keys not configured")
+        def write():
+            # A unique temp file per write, so workers sharing the cache file never interleave
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile("w", dir=self.path.parent, suffix=".tmp", delete=False) as tmp_file:
+                tmp_file.write(snapshot)
+            try:
+                os.replace(tmp_file.name, self.path)
+            except OSError:
+                os.unlink(tmp_file.name)
+                raise
         
-        # Use default LA coordinates if not provided
-        if not latitude or not longitude:
-            latitude = 34.0522  # Los Angeles
-            longitude = -118.2437
+        async with self.save_lock:
+            try:
+                await asyncio.to_thread(write)
+            except OSError as e:
+                logging.warning(f"Could not persist YouTube cache: {str(e)}")
+    
+    async def get(self, query: str, fetch) -> list:
+        key = self.cache_key(query)
+        entry = self.entries.get(key)
+        if entry is not None:
+            age = time.time() - entry["fetchedAt"]
+            if age < self.ttl:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return entry["videos"]
+            if age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self.entries.move_to_end(key)
+                self.refresh_in_background(key, query, fetch)
+                return entry["videos"]
         
-        # 1. Fetch current weather
-        weather_url = f"https://api.openweathermap.org/data/2.5/weather?lat={latitude}&lon={longitude}&appid={weather_api_key}&units=imperial"
+        self.misses += 1
+        try:
+            return await self.refresh(key, query, fetch)
+        except Exception:
+            if entry is not None:
+                logging.warning(f"YouTube refresh failed, serving expired results for '{key}'")
+                return entry["videos"]
+            raise
+    
+    def refresh_in_background(self, key: str, query: str, fetch):
+        if key in self.flights.in_flight:
+            return
         
-        async with httpx.AsyncClient() as client:
-            weather_response = await client.get(weather_url)
-            weather_data = weather_response.json()
+        async def run():
+            try:
+                await self.refresh(key, query, fetch)
+            except Exception as e:
+                logging.warning(f"Background YouTube refresh failed for '{key}': {str(e)}")
         
-        weather_condition = weather_data.get("weather", [{}])[0].get("main", "Clear")
-        temperature = weather_data.get("main", {}).get("temp", 70)
+        task = asyncio.create_task(run())
+        self.refreshes.add(task)
+        task.add_done_callback(self.refreshes.discard)
+    
+    async def refresh(self, key: str, query: str, fetch) -> list:
+        async def fetch_and_store():
+            self.upstream_calls += 1
+            try:
+                videos = await fetch(query)
+            except Exception:
+                self.upstream_errors += 1
+                raise
+            self.entries[key] = {"fetchedAt": time.time(), "videos": videos}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            await self.save()
+            return videos
         
-        # 2. Get current time info
-        now = datetime.now()
-        day_of_week = now.strftime("%A")
-        hour = now.hour
-        time_of_day = "morning" if 6 <= hour < 12 else "afternoon" if 12 <= hour < 17 else "evening" if 17 <= hour < 21 else "night"
-        is_weekend = now.weekday() >= 5
+        return await self.flights.do(key, fetch_and_store)
+    
+    def stats(self) -> dict:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "staleHits": self.stale_hits,
+            "misses": self.misses,
+            "hitRatio": round((self.hits + self.stale_hits) / lookups, 4) if lookups else None,
+            "upstreamCalls": self.upstream_calls,
+            "upstreamErrors": self.upstream_errors,
+            "coalesced": self.flights.coalesced
+        }
+
+youtube_cache = YouTubeSearchCache(
+    YOUTUBE_CACHE_PATH, YOUTUBE_CACHE_TTL_SECONDS, YOUTUBE_CACHE_STALE_SECONDS, YOUTUBE_CACHE_MAX_QUERIES
+)
+
+@api_router.get("/media/youtube")
+async def get_youtube_videos(query: str = "NBA basketball highlights"):
+    try:
+        return await youtube_cache.get(query, fetch_youtube_videos)
+    except YouTubeUpstreamError as e:
+        logging.error(f"YouTube API error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to fetch YouTube videos")
+    except Exception as e:
+        logging.error(f"YouTube API error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Weather
+# Conditions are effectively the same within a few kilometres and ten minutes, so
+# lookups are cached per geohash cell (precision 5, ~5 x 5 km) and time bucket.
+# Concurrent misses for a cell share one upstream call. At the start of each bucket
+# one worker (the lease holder) fetches the cell at the center of every major city and
+# shares the conditions through `meta`; the other workers load them from there.
+OPENWEATHER_API_URL = os.environ.get('OPENWEATHER_API_URL', 'https://api.openweathermap.org/data/2.5/weather')
+WEATHER_CACHE_PRECISION = 5
+WEATHER_CACHE_BUCKET_SECONDS = float(os.environ.get('WEATHER_CACHE_BUCKET_SECONDS', '600'))
+WEATHER_CACHE_MAX_ENTRIES = 5000
+WEATHER_PREFETCH_CELLS = sorted({
+    encode_geohash(latitude, longitude, WEATHER_CACHE_PRECISION)
+    for latitude, longitude in MAJOR_CITY_CENTERS.values()
+})
+WEATHER_PREFETCH_CONCURRENCY = 5
+WEATHER_PREFETCH_SNAPSHOT_ID = "weatherPrefetch"
+# How long the other workers wait for the lease holder to publish a bucket's conditions
+WEATHER_PREFETCH_SHARE_DELAY_SECONDS = 30
+
+class WeatherUpstreamError(Exception):
+    pass
+
+async def fetch_openweather(latitude: float, longitude: float) -> dict:
+    response = await http_clients.get("weather").request(
+        "GET",
+        OPENWEATHER_API_URL,
+        params={"lat": latitude, "lon": longitude, "appid": os.environ.get('OPENWEATHER_API_KEY'), "units": "imperial"}
+    )
+    if response.status_code != 200:
+        raise WeatherUpstreamError(f"OpenWeather returned {response.status_code}")
+    
+    weather_data = response.json()
+    return {
+        "condition": weather_data.get("weather", [{}])[0].get("main", "Clear"),
+        "temperature": weather_data.get("main", {}).get("temp", 70)
+    }
+
+class WeatherCache:
+    """Current weather per (geohash cell, time bucket), fetched at the cell center"""
+    def __init__(self, precision: int, bucket_seconds: float, max_entries: int):
+        self.precision = precision
+        self.bucket_seconds = bucket_seconds
+        # Entries outlive their bucket by one more, as a fallback when OpenWeather is down
+        self.entries = TTLCache(max_size=max_entries, ttl=2 * bucket_seconds)
+        self.flights = SingleFlight()
+        self.upstream_calls = 0
+        self.upstream_errors = 0
+        self.stale_served = 0
+        self.prefetched = 0
+    
+    def current_bucket(self) -> int:
+        return int(time.time() // self.bucket_seconds)
+    
+    def seconds_until_next_bucket(self) -> float:
+        return self.bucket_seconds - time.time() % self.bucket_seconds
+    
+    async def get(self, latitude: float, longitude: float, fetch) -> dict:
+        cell = encode_geohash(latitude, longitude, self.precision)
+        bucket = self.current_bucket()
+        weather = self.entries.get((cell, bucket))
+        if weather is not None:
+            return weather
         
-        # 3. Get all courts
-        courts = await db.courts.find().to_list(1000)
+        try:
+            return await self.refresh(cell, bucket, fetch)
+        except Exception:
+            previous = self.entries.peek((cell, bucket - 1))
+            if previous is not None:
+                logging.warning(f"Weather refresh failed, serving previous conditions for cell {cell}")
+                self.stale_served += 1
+                return previous
+            raise
+    
+    async def refresh(self, cell: str, bucket: int, fetch) -> dict:
+        async def fetch_and_store():
+            self.upstream_calls += 1
+            try:
+                weather = await fetch(*decode_geohash(cell))
+            except Exception:
+                self.upstream_errors += 1
+                raise
+            self.entries.set((cell, bucket), weather)
+            return weather
         
-        # 4. Add mock social media activity scores (0-100)
-        import random
-        random.seed(now.day)  # Consistent for the day
-        for court in courts:
-            court["socialMediaScore"] = random.randint(20, 95)
-            court["lastPostMinutesAgo"] = random.randint(15, 240)
+        return await self.flights.do((cell, bucket), fetch_and_store)
+    
+    async def prefetch(self, cells: list, fetch, concurrency: int) -> int:
+        """Fetch the current bucket for every cell not cached yet; returns how many were fetched"""
+        bucket = self.current_bucket()
+        missing = [cell for cell in cells if self.entries.peek((cell, bucket)) is None]
+        semaphore = asyncio.Semaphore(concurrency)
         
-        # 5. Prepare data for AI analysis
-        court_data_for_ai = []
-        for court in courts:
-            court_info = {
-                "name": court["name"],
-                "address": court["address"],
-                "currentPlayers": court.get("currentPlayers", 0),
-                "averagePlayers": court.get("averagePlayers", 12),
-                "rating": court["rating"],
-                "socialMediaScore": court["socialMediaScore"],
-                "lastPostMinutesAgo": court["lastPostMinutesAgo"]
-            }
-            court_data_for_ai.append(court_info)
+        async def prefetch_cell(cell):
+            async with semaphore:
+                await self.refresh(cell, bucket, fetch)
         
-        # 6. Use OpenAI GPT-5 to analyze and predict
-        ai_prompt = f"""You are an AI that predicts which basketball court will be most active based on multiple factors.
+        results = await asyncio.gather(*[prefetch_cell(cell) for cell in missing], return_exceptions=True)
+        fetched = sum(1 for result in results if not isinstance(result, Exception))
+        self.prefetched += fetched
+        return fetched
+    
+    def snapshot(self, cells: list, bucket: int) -> dict:
+        """{cell: weather} for the given cells cached in bucket"""
+        conditions = {}
+        for cell in cells:
+            weather = self.entries.peek((cell, bucket))
+            if weather is not None:
+                conditions[cell] = weather
+        return conditions
+    
+    def load(self, conditions: dict, bucket: int) -> int:
+        """Store conditions another worker fetched for bucket; returns how many cells were new"""
+        loaded = 0
+        for cell, weather in conditions.items():
+            if self.entries.peek((cell, bucket)) is None:
+                self.entries.set((cell, bucket), weather)
+                loaded += 1
+        self.prefetched += loaded
+        return loaded
+    
+    def stats(self) -> dict:
+        return {
+            **self.entries.stats(),
+            "upstreamCalls": self.upstream_calls,
+            "upstreamErrors": self.upstream_errors,
+            "staleServed": self.stale_served,
+            "prefetched": self.prefetched,
+            "coalesced": self.flights.coalesced
+        }
+
+weather_cache = WeatherCache(WEATHER_CACHE_PRECISION, WEATHER_CACHE_BUCKET_SECONDS, WEATHER_CACHE_MAX_ENTRIES)
+
+async def fetch_current_weather(latitude: float, longitude: float) -> Optional[dict]:
+    """Current {condition, temperature} near a location, or None when unavailable"""
+    if not os.environ.get('OPENWEATHER_API_KEY'):
+        return None
+    try:
+        return await weather_cache.get(latitude, longitude, fetch_openweather)
+    except Exception as e:
+        logging.warning(f"Weather lookup failed: {str(e)}")
+        return None
+
+async def prefetch_weather() -> int:
+    """
+    Warm the major city cells for the current bucket: the lease holder fetches them and
+    publishes the conditions, every other worker loads what was published. Returns how
+    many cells were fetched or loaded.
+    """
+    bucket = weather_cache.current_bucket()
+    if await acquire_lease(WEATHER_PREFETCH_SNAPSHOT_ID, 2 * weather_cache.bucket_seconds):
+        fetched = await weather_cache.prefetch(
+            WEATHER_PREFETCH_CELLS, fetch_openweather, WEATHER_PREFETCH_CONCURRENCY
+        )
+        await db.meta.update_one(
+            {"_id": WEATHER_PREFETCH_SNAPSHOT_ID},
+            {"$set": {"bucket": bucket, "cells": weather_cache.snapshot(WEATHER_PREFETCH_CELLS, bucket)}},
+            upsert=True
+        )
+        logging.info(f"Prefetched weather for {fetched}/{len(WEATHER_PREFETCH_CELLS)} cells")
+        return fetched
+    
+    await asyncio.sleep(WEATHER_PREFETCH_SHARE_DELAY_SECONDS)
+    snapshot = await db.meta.find_one({"_id": WEATHER_PREFETCH_SNAPSHOT_ID, "bucket": bucket}, {"cells": 1})
+    return weather_cache.load(snapshot["cells"], bucket) if snapshot else 0
+
+async def weather_prefetcher():
+    """Warms the weather cells of the major cities at the start of every time bucket"""
+    while True:
+        if os.environ.get('OPENWEATHER_API_KEY'):
+            try:
+                await prefetch_weather()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Weather prefetch error: {str(e)}")
+        await asyncio.sleep(weather_cache.seconds_until_next_bucket() + 1)
+
+# Court Recommendation Endpoint
+# Courts are ranked locally by the vectorized scoring engine (scoring.py); when an LLM
+# key is configured, the model only re-ranks the top few candidates and falls back to
+# the local ranking on any error.
+RECOMMENDATION_CANDIDATES = int(os.environ.get('RECOMMENDATION_CANDIDATES', '5'))
+# Only courts within this radius of the caller are scored, nearest first, at most
+# RECOMMENDATION_MAX_COURTS of them (the nearest courts anywhere if none is in range)
+RECOMMENDATION_RADIUS_KM = float(os.environ.get('RECOMMENDATION_RADIUS_KM', '50'))
+RECOMMENDATION_MAX_COURTS = int(os.environ.get('RECOMMENDATION_MAX_COURTS', '200'))
+RECOMMENDATION_LLM_RERANK = os.environ.get('RECOMMENDATION_LLM_RERANK', 'on').lower() != 'off'
+RECOMMENDATION_LLM_TIMEOUT_SECONDS = 8.0
+# Weather location when the caller doesn't share theirs
+DEFAULT_WEATHER_LOCATION = (34.0522, -118.2437)  # Los Angeles
+# Responses are cached per region cell (precision 5, ~5 x 5 km), hour and weather
+# condition; a cached response is dropped early once a court it scored gains or
+# loses RECOMMENDATION_INVALIDATE_PLAYERS players
+RECOMMENDATION_CACHE_PRECISION = 5
+RECOMMENDATION_CACHE_TTL_SECONDS = float(os.environ.get('RECOMMENDATION_CACHE_TTL_SECONDS', '120'))
+RECOMMENDATION_CACHE_MAX_ENTRIES = 2000
+RECOMMENDATION_INVALIDATE_PLAYERS = 3
+
+def recommendation_reasoning(candidate: dict, weather: Optional[dict]) -> str:
+    details = []
+    if candidate["distanceKm"] is not None:
+        details.append(f"{candidate['distanceKm']:.1f} km away")
+    if candidate["currentPlayers"]:
+        details.append(f"{candidate['currentPlayers']} checked in now")
+    else:
+        details.append(f"usually about {round(candidate['expectedPlayers'])} players at this hour")
+    details.append(f"rated {candidate['rating']:.1f}")
+    if candidate["indoor"] and weather and weather["condition"] in BAD_WEATHER_CONDITIONS:
+        details.append(f"indoors while there's {weather['condition'].lower()} outside")
+    return f"Best match right now: {', '.join(details)}."
+
+def recommendation_prompt(candidates: list, weather: Optional[dict], time_context: dict) -> str:
+    conditions = f"{weather['condition']}, {weather['temperature']}°F" if weather else "unknown"
+    candidate_data = [{
+        "name": candidate["courtName"],
+        "distanceKm": candidate["distanceKm"],
+        "currentPlayers": candidate["currentPlayers"],
+        "expectedPlayers": candidate["expectedPlayers"],
+        "rating": candidate["rating"],
+        "indoor": candidate["indoor"],
+        "score": candidate["score"]
+    } for candidate in candidates]
+    return f"""Pick the basketball court where the user is most likely to find a good pickup game right now.
 
 Current Conditions:
-- Day: {day_of_week} ({'Weekend' if is_weekend else 'Weekday'})
-- Time: {time_of_day} ({hour}:00)
-- Weather: {weather_condition}, {temperature}°F
-
-Courts Data:
-{court_data_for_ai}
-
-Analysis Factors:
-1. Weather Impact: Good weather ({weather_condition}) increases outdoor activity
-2. Time Patterns: {time_of_day} on {day_of_week}
-3. Current Activity: Current players at each court
-4. Social Media: Recent posts indicate activity (lower minutes = more recent)
-5. Historical Average: Average players per court
-6. Rating: Higher rated courts attract more players
-
-Task: Analyze these factors and select THE SINGLE BEST court that will likely have the most players to play with. 
-Consider that players prefer:
-- Good weather conditions
-- Peak hours (evening/afternoon on weekends, evening on weekdays)
-- Courts with recent social media activity
-- Higher rated courts
-- Courts showing current activity or momentum
+- Day: {time_context['dayOfWeek']} ({'Weekend' if time_context['isWeekend'] else 'Weekday'})
+- Time: {time_context['timeOfDay']}
+- Weather: {conditions}
+
+Candidates (already ranked by a local model; "score" is its 0-1 rating):
+{json.dumps(candidate_data)}
 
 Return ONLY a valid JSON object with this exact structure (no markdown, no code blocks):
 {{
-    "recommendedCourt": "EXACT court name from the list",
+    "recommendedCourt": "EXACT court name from the candidates",
     "confidenceScore": 75,
     "reasoning": "Brief 2-sentence explanation focusing on the top 2-3 factors"
 }}"""
 
-        # Call OpenAI API with Emergent key
-        async with httpx.AsyncClient() as client:
-            ai_response = await client.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {openai_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": "gpt-4",
-                    "messages": [
-                        {"role": "system", "content": "You are a basketball court activity prediction AI. Always respond with valid JSON only."},
-                        {"role": "user", "content": ai_prompt}
-                    ],
-                    "temperature": 0.7,
-                    "max_tokens": 300
-                },
-                timeout=30.0
-            )
-            
-            ai_data = ai_response.json()
-            logging.info(f"OpenAI response: {ai_data}")
-            
-            # Check if response is successful
-            if "choices" not in ai_data or len(ai_data["choices"]) == 0:
-                raise Exception(f"Invalid AI response: {ai_data}")
-            
-            ai_content = ai_data["choices"][0]["message"]["content"].strip()
-            
-            # Parse AI response (remove markdown if present)
-            if ai_content.startswith("```"):
-                ai_content = ai_content.split("```")[1]
-                if ai_content.startswith("json"):
-                    ai_content = ai_content[4:]
-                ai_content = ai_content.strip()
-            
-            import json
-            prediction = json.loads(ai_content)
-        
-        # 7. Find the recommended court
-        recommended_court_name = prediction["recommendedCourt"]
-        recommended_court = None
+async def rerank_with_llm(candidates: list, weather: Optional[dict], time_context: dict) -> Optional[dict]:
+    """Let the LLM pick among the top candidates; returns {candidate, confidenceScore, reasoning} or None"""
+    llm_key = os.environ.get('EMERGENT_LLM_KEY')
+    if not RECOMMENDATION_LLM_RERANK or not llm_key or len(candidates) < 2:
+        return None
+    
+    try:
+        ai_response = await http_clients.get("llm").request(
+            "POST",
+            "https://api.openai.com/v1/chat/completions",
+            headers={
+                "Authorization": f"Bearer {llm_key}",
+                "Content-Type": "application/json"
+            },
+            json={
+                "model": "gpt-4",
+                "messages": [
+                    {"role": "system", "content": "You are a basketball court activity prediction AI. Always respond with valid JSON only."},
+                    {"role": "user", "content": recommendation_prompt(candidates, weather, time_context)}
+                ],
+                "temperature": 0.3,
+                "max_tokens": 200
+            },
+            timeout=RECOMMENDATION_LLM_TIMEOUT_SECONDS
+        )
+        ai_content = ai_response.json()["choices"][0]["message"]["content"].strip()
         
-        for court in courts:
-            if court["name"].lower() == recommended_court_name.lower():
-                recommended_court = court
-                break
+        # Parse AI response (remove markdown if present)
+        if ai_content.startswith("```"):
+            ai_content = ai_content.split("```")[1]
+            if ai_content.startswith("json"):
+                ai_content = ai_content[4:]
+            ai_content = ai_content.strip()
+        prediction = json.loads(ai_content)
+    except Exception as e:
+        logging.warning(f"LLM re-rank failed, using local ranking: {str(e)}")
+        return None
+    
+    picked_name = str(prediction.get("recommendedCourt", "")).lower()
+    for candidate in candidates:
+        if candidate["courtName"].lower() == picked_name:
+            return {
+                "candidate": candidate,
+                "confidenceScore": prediction.get("confidenceScore", 75),
+                "reasoning": prediction.get("reasoning")
+            }
+    logging.warning(f"LLM re-rank picked a court outside the candidates: {picked_name}")
+    return None
+
+class RecommendationCache:
+    """
+    Recommendation responses per (region cell, UTC hour, weather condition). Each
+    entry keeps the player counts it was computed from, so a significant change at
+    one of its courts drops it before the TTL runs out; a reverse index from court to
+    keys means an occupancy change only looks at the results that scored that court.
+    """
+    def __init__(self, ttl: float, max_entries: int, invalidate_players: int):
+        self.results = TTLCache(max_size=max_entries, ttl=ttl)
+        self.flights = SingleFlight()
+        self.compute_latency = LatencyRecorder()
+        self.invalidate_players = invalidate_players
+        self.invalidations = 0
+        self.keys_by_court = {}
+        self.stores_since_rebuild = 0
+    
+    async def get(self, key: tuple, compute) -> dict:
+        entry = self.results.get(key)
+        if entry is not None:
+            return entry["response"]
         
-        if not recommended_court:
-            # Fallback: pick court with highest combined score
-            recommended_court = max(courts, key=lambda c: (c.get("currentPlayers", 0) * 2 + c.get("socialMediaScore", 50) + c.get("rating", 4) * 10))
+        async def compute_and_store():
+            start = time.perf_counter()
+            response, players = await compute()
+            self.compute_latency.record(time.perf_counter() - start)
+            self.results.set(key, {"response": response, "players": players})
+            self.index(key, players)
+            return response
         
+        return await self.flights.do(key, compute_and_store)
+    
+    def index(self, key: tuple, players: dict):
+        for court_id in players:
+            self.keys_by_court.setdefault(court_id, set()).add(key)
+        # Keys of expired or evicted results are pruned lazily; rebuilding from the live
+        # results once per max_size stores keeps the index bounded for idle courts too
+        self.stores_since_rebuild += 1
+        if self.stores_since_rebuild >= self.results.max_size:
+            self.stores_since_rebuild = 0
+            self.keys_by_court = {}
+            for live_key, entry in self.results.items():
+                for court_id in entry["players"]:
+                    self.keys_by_court.setdefault(court_id, set()).add(live_key)
+    
+    def record_occupancy(self, court_id: ObjectId, current_players: int):
+        keys = self.keys_by_court.get(court_id)
+        if not keys:
+            return
+        for key in list(keys):
+            entry = self.results.peek(key)
+            if entry is None or court_id not in entry["players"]:
+                keys.discard(key)  # expired, evicted, or recomputed without this court
+            elif abs(entry["players"][court_id] - current_players) >= self.invalidate_players:
+                self.results.pop(key)
+                keys.discard(key)
+                self.invalidations += 1
+        if not keys:
+            del self.keys_by_court[court_id]
+    
+    def stats(self) -> dict:
         return {
-            "recommendedCourtId": str(recommended_court["_id"]),
-            "courtName": recommended_court["name"],
-            "confidenceScore": prediction.get("confidenceScore", 75),
-            "reasoning": prediction.get("reasoning", "Based on current conditions and activity patterns"),
-            "weather": {
-                "condition": weather_condition,
-                "temperature": temperature
-            },
-            "timeContext": {
-                "dayOfWeek": day_of_week,
-                "timeOfDay": time_of_day,
-                "isWeekend": is_weekend
-            }
+            **self.results.stats(),
+            "coalesced": self.flights.coalesced,
+            "invalidations": self.invalidations,
+            "computeLatency": self.compute_latency.stats()
         }
+
+recommendation_cache = RecommendationCache(
+    RECOMMENDATION_CACHE_TTL_SECONDS, RECOMMENDATION_CACHE_MAX_ENTRIES, RECOMMENDATION_INVALIDATE_PLAYERS
+)
+
+async def compute_recommendation(
+    latitude: Optional[float],
+    longitude: Optional[float],
+    weather: Optional[dict],
+    now: datetime,
+    utc_now: datetime
+) -> tuple:
+    """
+    The recommendation response plus {court id: current players} for the courts it
+    scored; now is the server's local time, utc_now the same moment in UTC
+    """
+    catalog = await get_court_catalog()
+    if not catalog.ids:
+        raise HTTPException(status_code=404, detail="No courts available")
+    occupancy = await get_court_occupancy()
+    profiles = await get_court_profiles()
+    
+    hour = now.hour
+    time_context = {
+        "dayOfWeek": now.strftime("%A"),
+        "timeOfDay": "morning" if 6 <= hour < 12 else "afternoon" if 12 <= hour < 17 else "evening" if 17 <= hour < 21 else "night",
+        "isWeekend": now.weekday() >= 5
+    }
+    
+    index = catalog.scoring
+    if latitude is not None:
+        indices = index.candidates(latitude, longitude, RECOMMENDATION_RADIUS_KM, RECOMMENDATION_MAX_COURTS)
+    else:
+        indices = np.arange(len(index))
+    current_players = np.fromiter(
+        (occupancy.get(index.ids[i], 0) for i in indices), dtype=float, count=len(indices)
+    )
+    expected_players = expected_players_at(
+        [index.ids[i] for i in indices], index.average_players[indices], profiles, now, utc_now
+    )
+    factors = index.score(
+        current_players,
+        expected_players,
+        latitude,
+        longitude,
+        weather["condition"] if weather else None,
+        weather["temperature"] if weather else None,
+        indices
+    )
+    
+    candidates = [{
+        "courtId": str(index.ids[indices[i]]),
+        "courtName": index.names[indices[i]],
+        "score": round(float(factors["score"][i]), 4),
+        "distanceKm": round(float(factors["distanceKm"][i]), 2) if factors["distanceKm"] is not None else None,
+        "currentPlayers": int(current_players[i]),
+        "expectedPlayers": round(float(expected_players[i]), 1),
+        "rating": float(index.ratings[indices[i]]),
+        "indoor": bool(index.indoor[indices[i]])
+    } for i in top_k(factors["score"], RECOMMENDATION_CANDIDATES)]
+    
+    best = candidates[0]
+    confidence = int(round(min(max(best["score"], 0.01), 0.99) * 100))
+    reasoning = recommendation_reasoning(best, weather)
+    ranked_by = "score"
+    reranked = await rerank_with_llm(candidates, weather, time_context)
+    if reranked:
+        best = reranked["candidate"]
+        confidence = reranked["confidenceScore"]
+        reasoning = reranked["reasoning"] or recommendation_reasoning(best, weather)
+        ranked_by = "llm"
+    
+    response = {
+        "recommendedCourtId": best["courtId"],
+        "courtName": best["courtName"],
+        "confidenceScore": confidence,
+        "reasoning": reasoning,
+        "rankedBy": ranked_by,
+        "candidates": candidates,
+        "weather": weather,
+        "timeContext": time_context
+    }
+    players = {index.ids[i]: int(count) for i, count in zip(indices, current_players)}
+    return response, players
+
+@api_router.get("/courts/predict/recommended")
+async def get_recommended_court(
+    latitude: Optional[float] = Query(None, ge=-90, le=90),
+    longitude: Optional[float] = Query(None, ge=-180, le=180)
+):
+    """
+    Court recommendation scored locally, over the courts nearest the user when a
+    location is given, from:
+    - Distance from the user's region cell (geohash precision 5, ~5 x 5 km): the
+      location is snapped to the cell center so nearby users share one result, and
+      distanceKm is measured from that center rather than the exact location
+    - Current players and the usual crowd for this time of day and week
+    - Court rating
+    - Current weather (outdoor vs indoor courts)
+    The top candidates are optionally re-ranked by an LLM. Results are shared by
+    everyone in the same region cell for the same hour and weather.
+    """
+    try:
+        has_location = latitude is not None and longitude is not None
+        weather = await fetch_current_weather(
+            *((latitude, longitude) if has_location else DEFAULT_WEATHER_LOCATION)
+        )
+        now, utc_now = datetime.now(), datetime.utcnow()
         
+        cell = None
+        if has_location:
+            # Distances are measured from the cell center so the result can be shared
+            cell = encode_geohash(latitude, longitude, RECOMMENDATION_CACHE_PRECISION)
+            latitude, longitude = decode_geohash(cell)
+        else:
+            latitude = longitude = None
+        # Keyed on the UTC hour, the clock occupancy buckets and profiles use
+        key = (cell, utc_now.strftime("%Y-%m-%d %H"), weather["condition"] if weather else None)
+        return await recommendation_cache.get(
+            key, lambda: compute_recommendation(latitude, longitude, weather, now, utc_now)
+        )
+    
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Court prediction error: {str(e)}")
         # Fallback: return court with most current players
-        courts = await db.courts.find().to_list(1000)
+        courts = await db.courts.find({}, COURT_PROJECTION).sort("currentPlayers", -1).limit(1).to_list(1)
         if courts:
-            best_court = max(courts, key=lambda c: c.get("currentPlayers", 0))
+            best_court = courts[0]
             return {
                 "recommendedCourtId": str(best_court["_id"]),
                 "courtName": best_court["name"],
@@ -1914,6 +4306,7 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag"],
 )
 
 # Configure logging
@@ -1923,40 +4316,191 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Indexes every query path relies on, per collection. Created in the background at
+# startup by the index manager; indexes that already exist are left untouched.
+INDEXES = {
+    "users": [
+        IndexModel("email", unique=True),
+        IndexModel("username", unique=True)
+    ],
+    "courts": [
+        IndexModel([("location", "2dsphere")]),
+        IndexModel("geohash")
+    ],
+    "messages": [
+        IndexModel([("fromUserId", 1), ("toUserId", 1), ("timestamp", -1)]),
+        IndexModel([("toUserId", 1), ("fromUserId", 1), ("timestamp", -1)])
+    ],
+    "conversations": [
+        IndexModel([("participants", 1), ("timestamp", -1), ("_id", -1)])
+    ],
+    "friend_requests": [
+        IndexModel([("fromUserId", 1), ("toUserId", 1), ("status", 1)]),
+        IndexModel([("toUserId", 1), ("status", 1)])
+    ],
+    "connections": [
+        IndexModel([("userId", 1), ("otherId", 1)], unique=True)
+    ],
+    "court_occupancy": [
+        IndexModel([("courtId", 1), ("hour", 1)], unique=True),
+        IndexModel(
+            "hour", name="court_occupancy_ttl", expireAfterSeconds=(COURT_PROFILE_WEEKS + 1) * 7 * 86400
+        )
+    ],
+    "checkins": [
+        IndexModel([("userId", 1), ("endedAt", 1)]),
+        IndexModel([("endedAt", 1), ("lastSeenAt", 1)]),
+        IndexModel([("courtId", 1), ("startedAt", -1)]),
+        IndexModel("endedAt", name="checkin_history_ttl", expireAfterSeconds=CHECKIN_HISTORY_DAYS * 86400)
+    ]
+}
+
+class IndexManager:
+    """
+    Idempotently creates the declared indexes, one at a time, and tracks the
+    status of each ("pending", "building", "ready" or "failed") for /ready.
+    """
+    def __init__(self, declared: dict):
+        self.declared = declared
+        self.status = {
+            f"{collection}.{model.document['name']}": "pending"
+            for collection, models in declared.items()
+            for model in models
+        }
+        self.errors = {}
+        self.built = asyncio.Event()
+    
+    async def build(self):
+        for collection, models in self.declared.items():
+            try:
+                existing = {index["name"] async for index in db[collection].list_indexes()}
+            except Exception as e:
+                logging.warning(f"Could not list indexes on {collection}: {str(e)}")
+                existing = set()
+            
+            for model in models:
+                key = f"{collection}.{model.document['name']}"
+                if model.document["name"] in existing:
+                    self.status[key] = "ready"
+                    continue
+                
+                self.status[key] = "building"
+                try:
+                    await db[collection].create_indexes([model])
+                    self.status[key] = "ready"
+                    logging.info(f"Created index {key}")
+                except Exception as e:
+                    self.status[key] = "failed"
+                    self.errors[key] = str(e)
+                    logging.error(f"Index {key} failed: {str(e)}")
+        
+        self.built.set()
+    
+    async def wait_until_built(self):
+        await self.built.wait()
+    
+    def report(self) -> dict:
+        ready = [key for key, status in self.status.items() if status == "ready"]
+        missing = [key for key, status in self.status.items() if status != "ready"]
+        if not self.built.is_set():
+            state = "building"
+        else:
+            state = "degraded" if missing else "ready"
+        
+        return {
+            "status": state,
+            "ready": len(ready),
+            "total": len(self.status),
+            "building": [key for key, status in self.status.items() if status == "building"],
+            "missing": missing,
+            "failed": self.errors
+        }
+
+index_manager = IndexManager(INDEXES)
+
 # Health check endpoint for Kubernetes probes
 @app.get("/health")
 async def health_check():
     """Health check endpoint for liveness probe"""
     return {"status": "healthy", "service": "ball-house-api"}
 
+@app.get("/metrics")
+async def metrics():
+    """In-process cache and worker metrics for this API worker"""
+    return {
+        "userCache": {
+            **user_cache.stats(),
+            "requestHits": user_cache_request_hits
+        },
+        "courtCatalog": {
+            "catalog": court_catalog_cache.stats(),
+            "occupancy": court_occupancy_cache.stats()
+        },
+        "youtubeCache": youtube_cache.stats(),
+        "weatherCache": weather_cache.stats(),
+        "recommendationCache": recommendation_cache.stats(),
+        "httpClients": http_clients.stats(),
+        "passwordHashing": {
+            "bcryptRounds": BCRYPT_ROUNDS,
+            "workers": PASSWORD_HASH_WORKERS,
+            "queueLimit": PASSWORD_HASH_QUEUE_LIMIT,
+            "inFlight": password_hash_in_flight,
+            "rejected": password_hash_rejected,
+            "hash": password_hash_latency["hash"].stats(),
+            "verify": password_hash_latency["verify"].stats()
+        }
+    }
+
 @app.get("/ready")
 async def readiness_check():
-    """Readiness check endpoint - verifies database connection"""
+    """Readiness check endpoint - verifies database connection and reports index builds"""
     try:
         # Ping database to check connection
         await db.command('ping')
-        return {"status": "ready", "database": "connected"}
+        return {"status": "ready", "database": "connected", "indexes": index_manager.report()}
     except Exception as e:
         logging.error(f"Readiness check failed: {str(e)}")
         raise HTTPException(status_code=503, detail="Database not ready")
 
+court_change_stream_task = None
+checkin_sweeper_task = None
+index_build_task = None
+weather_prefetch_task = None
+court_profile_task = None
+
 @app.on_event("startup")
 async def startup_event():
     """
     Non-blocking startup - initialize database in background
     This prevents deployment timeouts in Kubernetes
     """
+    # Misconfiguration fails the deployment instead of serving broken image URLs
+    check_image_settings()
     try:
         # Log startup
         logging.info("Ball House API starting up...")
         
+        global court_change_stream_task, checkin_sweeper_task, index_build_task, weather_prefetch_task
+        global court_profile_task
+        await realtime.start()
+        http_clients.start()
+        await youtube_cache.load()
+        weather_prefetch_task = asyncio.create_task(weather_prefetcher())
+        
         # Verify database connection
         await db.command('ping')
         logging.info("Database connection verified")
         
+        index_build_task = asyncio.create_task(index_manager.build())
+        court_change_stream_task = await start_court_change_stream()
+        checkin_sweeper_task = asyncio.create_task(checkin_sweeper())
+        court_profile_task = asyncio.create_task(court_profile_builder())
+        
         # Initialize courts in background (non-blocking)
-        import asyncio
         asyncio.create_task(initialize_courts_background())
+        asyncio.create_task(initialize_messaging_background())
+        asyncio.create_task(initialize_network_background())
+        asyncio.create_task(initialize_users_background())
         
         logging.info("Startup complete - courts initialization running in background")
     except Exception as e:
@@ -1968,14 +4512,55 @@ async def initialize_courts_background():
     """Background task to initialize courts without blocking startup"""
     try:
         await initialize_courts()
+        await backfill_court_geo_fields()
         logging.info("Background courts initialization completed")
     except Exception as e:
         logging.error(f"Background courts initialization error: {str(e)}")
 
+async def initialize_messaging_background():
+    """Background task to build conversation summaries"""
+    try:
+        await backfill_conversations()
+        logging.info("Background messaging initialization completed")
+    except Exception as e:
+        logging.error(f"Background messaging initialization error: {str(e)}")
+
+async def initialize_users_background():
+    """Background task to move inline profile images out of user documents"""
+    try:
+        await migrate_relative_profile_image_urls()
+        await migrate_inline_profile_images()
+        logging.info("Background users initialization completed")
+    except Exception as e:
+        logging.error(f"Background users initialization error: {str(e)}")
+
+async def initialize_network_background():
+    """Background task to build the connections graph"""
+    try:
+        # The $merge in the backfill needs the unique (userId, otherId) index
+        await index_manager.wait_until_built()
+        await backfill_connections()
+        logging.info("Background network initialization completed")
+    except Exception as e:
+        logging.error(f"Background network initialization error: {str(e)}")
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     """Clean shutdown of database connection"""
     try:
+        if court_change_stream_task:
+            court_change_stream_task.cancel()
+        if checkin_sweeper_task:
+            checkin_sweeper_task.cancel()
+        if index_build_task:
+            index_build_task.cancel()
+        if weather_prefetch_task:
+            weather_prefetch_task.cancel()
+        if court_profile_task:
+            court_profile_task.cancel()
+        await realtime.stop()
+        await http_clients.close()
+        password_executor.shutdown(wait=False)
         client.close()
         logging.info("Database connection closed")
     except Exception as e:
@@ -8,6 +8,8 @@ import requests
 import json
 import time
 import base64
+import random
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 # Configuration
@@ -177,6 +179,65 @@ class BackendTester:
         
         return False
     
+    def test_nearby_courts(self):
+        """Test geospatial nearby courts endpoint"""
+        print("🧭 Testing Nearby Courts...")
+        
+        try:
+            # Downtown Houston, 10km radius
+            params = {"lat": 29.7604, "lon": -95.3698, "radius": 10000, "limit": 5}
+            response = self.session.get(f"{BASE_URL}/courts/nearby", params=params)
+            
+            if response.status_code == 200:
+                courts = response.json()
+                distances = [court.get("distance") for court in courts]
+                if not courts:
+                    self.log_result("Nearby Courts", False, "No courts returned near downtown Houston", response)
+                elif len(courts) > 5:
+                    self.log_result("Nearby Courts", False, f"Limit ignored, got {len(courts)} courts", response)
+                elif None in distances or distances != sorted(distances) or distances[-1] > 10000:
+                    self.log_result("Nearby Courts", False, f"Courts not sorted by distance within radius: {distances}", response)
+                else:
+                    self.log_result("Nearby Courts", True, f"Retrieved {len(courts)} courts, closest {distances[0]}m away")
+                    return True
+            else:
+                self.log_result("Nearby Courts", False, f"Failed with status {response.status_code}", response)
+        except Exception as e:
+            self.log_result("Nearby Courts", False, f"Exception: {str(e)}")
+        
+        return False
+    
+    def test_viewport_courts(self):
+        """Test viewport court query with clustering"""
+        print("🗺️ Testing Viewport Courts...")
+        
+        texas = {"minLat": 25.8, "minLon": -106.6, "maxLat": 36.5, "maxLon": -93.5}
+        try:
+            response = self.session.get(f"{BASE_URL}/courts/viewport", params={**texas, "zoom": 5})
+            if response.status_code != 200:
+                self.log_result("Viewport Clusters", False, f"Failed with status {response.status_code}", response)
+                return False
+            
+            data = response.json()
+            clusters = data.get("clusters", [])
+            if not data.get("clustered") or not clusters or not all(c["count"] > 0 for c in clusters):
+                self.log_result("Viewport Clusters", False, "Expected non-empty clusters at low zoom", response)
+                return False
+            self.log_result("Viewport Clusters", True, f"{len(clusters)} clusters covering {sum(c['count'] for c in clusters)} courts")
+            
+            # Zoomed in on downtown Houston returns individual courts
+            houston = {"minLat": 29.70, "minLon": -95.45, "maxLat": 29.80, "maxLon": -95.30, "zoom": 14}
+            response = self.session.get(f"{BASE_URL}/courts/viewport", params=houston)
+            data = response.json() if response.status_code == 200 else {}
+            if data.get("clustered") is False and data.get("courts"):
+                self.log_result("Viewport Courts", True, f"Retrieved {len(data['courts'])} individual courts")
+                return True
+            self.log_result("Viewport Courts", False, "Expected individual courts at high zoom", response)
+        except Exception as e:
+            self.log_result("Viewport Courts", False, f"Exception: {str(e)}")
+        
+        return False
+    
     def test_checkin_checkout_system(self):
         """Test court check-in and check-out system"""
         print("📍 Testing Check-in/Check-out System...")
@@ -223,6 +284,74 @@ class BackendTester:
         
         return False
     
+    def test_concurrent_checkins(self, user_count=8, rounds=15):
+        """Stress check-in/check-out concurrency and verify court counts never drift"""
+        print("🏀 Testing Concurrent Check-ins...")
+        
+        if len(self.court_ids) < 2:
+            self.log_result("Concurrent Check-ins", False, "Need at least two court IDs")
+            return False
+        
+        court_ids = self.court_ids[-2:]
+        
+        try:
+            # Dedicated public users so other tests can't move the numbers
+            headers_list = []
+            for i in range(user_count):
+                stress_user = {
+                    "username": f"stress_{int(time.time())}_{i}",
+                    "email": f"stress_{int(time.time())}_{i}@example.com",
+                    "password": "securepassword123"
+                }
+                response = self.session.post(f"{BASE_URL}/auth/register", json=stress_user)
+                if response.status_code != 200:
+                    self.log_result("Concurrent Check-ins", False, "Failed to register stress users", response)
+                    return False
+                headers_list.append({"Authorization": f"Bearer {response.json()['token']}"})
+            
+            def court_counts():
+                return {court_id: self.session.get(f"{BASE_URL}/courts/{court_id}").json()["currentPlayers"] for court_id in court_ids}
+            
+            initial = court_counts()
+            
+            def hammer(headers):
+                session = requests.Session()
+                for _ in range(rounds):
+                    court_id = random.choice(court_ids)
+                    action = "checkin" if random.random() < 0.7 else "checkout"
+                    session.post(f"{BASE_URL}/courts/{court_id}/{action}", headers=headers, timeout=TIMEOUT)
+            
+            # Two concurrent clients per user to also race a user against themselves
+            with ThreadPoolExecutor(max_workers=user_count * 2) as pool:
+                list(pool.map(hammer, headers_list * 2))
+            
+            # Each court's count must equal the baseline plus our users checked in there
+            expected = dict(initial)
+            for headers in headers_list:
+                current_court = self.session.get(f"{BASE_URL}/auth/me", headers=headers).json().get("currentCourtId")
+                if current_court in expected:
+                    expected[current_court] += 1
+            after_stress = court_counts()
+            
+            if after_stress != expected:
+                self.log_result("Concurrent Check-ins", False, f"Counts drifted: expected {expected}, got {after_stress}")
+                return False
+            
+            # Checking everyone out must restore the original counts
+            for headers in headers_list:
+                for court_id in court_ids:
+                    self.session.post(f"{BASE_URL}/courts/{court_id}/checkout", headers=headers)
+            final = court_counts()
+            
+            if final == initial:
+                self.log_result("Concurrent Check-ins", True, f"{user_count * 2 * rounds} concurrent operations, counts consistent: {after_stress}")
+                return True
+            self.log_result("Concurrent Check-ins", False, f"Counts did not return to baseline: {initial} -> {final}")
+        except Exception as e:
+            self.log_result("Concurrent Check-ins", False, f"Exception: {str(e)}")
+        
+        return False
+    
     def test_privacy_toggle(self):
         """Test privacy toggle functionality"""
         print("🔒 Testing Privacy Toggle...")
@@ -478,7 +607,10 @@ class BackendTester:
         self.test_user_login()
         self.test_auth_me()
         self.test_courts_api()
+        self.test_nearby_courts()
+        self.test_viewport_courts()
         self.test_checkin_checkout_system()
+        self.test_concurrent_checkins()
         self.test_privacy_toggle()
         self.test_messaging_system()
         self.test_youtube_api()
@@ -85,12 +85,13 @@ export default function UserDetailScreen() {
       if (response.data.status === 'success') {
         Alert.alert('Success', `Friend request sent to ${userDetail.username}!`);
         fetchUserDetail(); // Refresh to update connection status
-      } else if (response.data.status === 'already_connected') {
-        Alert.alert('Already Connected', response.data.message);
-      } else {
-        Alert.alert('Info', response.data.message);
       }
-    } catch (error) {
+    } catch (error: any) {
+      if (error.response?.status === 400) {
+        // Already connected, or a request is already pending
+        Alert.alert('Info', error.response.data?.detail);
+        return;
+      }
       console.error('Error sending friend request:', error);
       Alert.alert('Error', 'Failed to send friend request');
     }
@@ -0,0 +1,189 @@
+"""
+Check-in consistency tests against an in-memory MongoDB (mongomock-motor).
+"""
+import asyncio
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+import server  # noqa: E402
+
+
+@pytest.fixture
+def db(monkeypatch):
+    database = AsyncMongoMockClient()["test"]
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server, "suspected_membership_mismatches", set())
+    return database
+
+
+async def add_courts(db, count: int) -> list:
+    result = await db.courts.insert_many([
+        {"name": f"Court {index}", "currentPlayers": 0, "publicUsersAtCourt": []} for index in range(count)
+    ])
+    return result.inserted_ids
+
+
+async def add_user(db, is_public: bool = True) -> dict:
+    result = await db.users.insert_one({"username": "player", "isPublic": is_public, "currentCourtId": None})
+    return {"_id": str(result.inserted_id), "isPublic": is_public}
+
+
+async def membership(db) -> dict:
+    """court id -> (listed user ids, currentPlayers)"""
+    courts = await db.courts.find({}, {"publicUsersAtCourt": 1, "currentPlayers": 1}).to_list(None)
+    return {court["_id"]: (set(court["publicUsersAtCourt"]), court["currentPlayers"]) for court in courts}
+
+
+async def current_court(db, user: dict):
+    found = await db.users.find_one({"_id": ObjectId(user["_id"])}, {"currentCourtId": 1})
+    return found["currentCourtId"]
+
+
+def test_concurrent_checkins_leave_the_user_at_one_court(db):
+    async def run():
+        courts = await add_courts(db, 3)
+        user = await add_user(db)
+        await asyncio.gather(*[server.checkin_user(user, court_id) for court_id in courts * 3])
+        return courts, user, await current_court(db, user), await membership(db)
+
+    courts, user, court_id, members = asyncio.run(run())
+    assert court_id in courts
+    assert members[court_id] == ({user["_id"]}, 1)
+    assert all(members[other] == (set(), 0) for other in courts if other != court_id)
+
+
+def test_checkout_racing_checkins_is_consistent(db):
+    async def run():
+        courts = await add_courts(db, 2)
+        user = await add_user(db)
+        await server.checkin_user(user, courts[0])
+        await asyncio.gather(
+            server.checkout_user(user["_id"], courts[0]),
+            server.checkin_user(user, courts[1]),
+            server.checkout_user(user["_id"], courts[1]),
+        )
+        return await server.find_membership_mismatches()
+
+    assert asyncio.run(run()) == set()
+
+
+def test_checkin_interrupted_after_join_is_repaired_on_the_second_sweep(db):
+    async def run():
+        courts = await add_courts(db, 2)
+        user = await add_user(db)
+        await server.checkin_user(user, courts[0])
+        await server.join_court(courts[1], user["_id"])  # worker died before swapping currentCourtId
+        first = await server.reconcile_court_memberships()
+        second = await server.reconcile_court_memberships()
+        return courts, user, first, second, await membership(db)
+
+    courts, user, first, second, members = asyncio.run(run())
+    assert (first, second) == (0, 1)
+    assert members[courts[0]] == ({user["_id"]}, 1)
+    assert members[courts[1]] == (set(), 0)
+
+
+def test_checkin_interrupted_before_leaving_the_old_court_is_repaired(db):
+    async def run():
+        courts = await add_courts(db, 2)
+        user = await add_user(db)
+        await server.checkin_user(user, courts[0])
+        await server.join_court(courts[1], user["_id"])
+        await db.users.update_one({"_id": ObjectId(user["_id"])}, {"$set": {"currentCourtId": courts[1]}})
+        for _ in range(2):
+            await server.reconcile_court_memberships()
+        return courts, user, await membership(db)
+
+    courts, user, members = asyncio.run(run())
+    assert members[courts[0]] == (set(), 0)
+    assert members[courts[1]] == ({user["_id"]}, 1)
+
+
+def test_transient_mismatch_is_not_repaired(db):
+    async def run():
+        courts = await add_courts(db, 2)
+        user = await add_user(db)
+        await server.checkin_user(user, courts[0])
+        await server.join_court(courts[1], user["_id"])
+        await server.reconcile_court_memberships()
+        await server.checkin_user(user, courts[1])  # the check-in completes before the next sweep
+        repaired = await server.reconcile_court_memberships()
+        return courts, user, repaired, await membership(db)
+
+    courts, user, repaired, members = asyncio.run(run())
+    assert repaired == 0
+    assert members[courts[0]] == (set(), 0)
+    assert members[courts[1]] == ({user["_id"]}, 1)
+
+
+def test_idle_sweep_checks_out_one_batch_per_pass(db, monkeypatch):
+    monkeypatch.setattr(server, "CHECKIN_SWEEP_BATCH_SIZE", 2)
+
+    async def run():
+        [court_id] = await add_courts(db, 1)
+        users = [await add_user(db) for _ in range(3)]
+        for user in users:
+            await server.checkin_user(user, court_id)
+        idle_since = datetime.utcnow() - timedelta(hours=server.CHECKIN_IDLE_HOURS + 1)
+        await db.checkins.update_many({}, {"$set": {"lastSeenAt": idle_since}})
+        swept = [await server.sweep_idle_checkins() for _ in range(3)]
+        return court_id, users, swept, await membership(db)
+
+    court_id, users, swept, members = asyncio.run(run())
+    assert swept == [2, 1, 0]
+    assert members[court_id] == (set(), 0)
+
+
+def test_reconcile_pages_through_courts_and_users(db, monkeypatch):
+    monkeypatch.setattr(server, "MEMBERSHIP_RECONCILE_PAGE_SIZE", 2)
+
+    async def run():
+        courts = await add_courts(db, 5)
+        users = [await add_user(db) for _ in range(5)]
+        for user, court_id in zip(users, courts):
+            await server.checkin_user(user, court_id)
+        # Interrupted check-ins: listed at the next court over, and missing from their own
+        await server.join_court(courts[1], users[0]["_id"])
+        await server.leave_court(courts[4], users[4]["_id"])
+        for _ in range(2):
+            await server.reconcile_court_memberships()
+        return courts, users, await membership(db)
+
+    courts, users, members = asyncio.run(run())
+    assert members == {court_id: ({user["_id"]}, 1) for user, court_id in zip(users, courts)}
+
+
+def test_checkin_again_during_the_idle_sweep_keeps_the_player_checked_in(db, monkeypatch):
+    async def run():
+        [court_id] = await add_courts(db, 1)
+        user = await add_user(db)
+        await server.checkin_user(user, court_id)
+        idle_since = datetime.utcnow() - timedelta(hours=server.CHECKIN_IDLE_HOURS + 1)
+        await db.checkins.update_many({}, {"$set": {"lastSeenAt": idle_since}})
+
+        # The player checks in again right after the sweep closes their session
+        collection_type = type(db.checkins)
+        update_many = collection_type.update_many
+
+        async def close_then_checkin(collection, query, update, *args, **kwargs):
+            result = await update_many(collection, query, update, *args, **kwargs)
+            if "sweepId" in update.get("$set", {}):
+                await server.checkin_user(user, court_id)
+            return result
+
+        monkeypatch.setattr(collection_type, "update_many", close_then_checkin)
+        swept = await server.sweep_idle_checkins()
+        open_sessions = await db.checkins.count_documents({"endedAt": None})
+        return court_id, user, swept, open_sessions, await current_court(db, user), await membership(db)
+
+    court_id, user, swept, open_sessions, current, members = asyncio.run(run())
+    assert (swept, open_sessions) == (1, 1)
+    assert current == court_id
+    assert members[court_id] == ({user["_id"]}, 1)
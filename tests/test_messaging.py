@@ -0,0 +1,61 @@
+"""
+Realtime messaging tests against an in-memory MongoDB (mongomock-motor).
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+import server  # noqa: E402
+
+
+@pytest.fixture
+def db(monkeypatch):
+    database = AsyncMongoMockClient()["test"]
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server, "typing_permissions", server.TTLCache(max_size=100, ttl=60))
+    return database
+
+
+def typing_events_received(db, setup) -> list:
+    """Typing events delivered to the recipient after `setup(db, sender, recipient)` ran"""
+    sender, recipient = ObjectId(), ObjectId()
+
+    async def run():
+        await setup(db, sender, recipient)
+        queue = asyncio.Queue()
+        server.realtime.subscribe(server.user_topic(recipient), queue)
+        try:
+            await server.handle_client_event(str(sender), {"type": "typing", "toUserId": str(recipient)})
+            return [queue.get_nowait() for _ in range(queue.qsize())]
+        finally:
+            server.realtime.unsubscribe(server.user_topic(recipient), queue)
+
+    return asyncio.run(run())
+
+
+async def strangers(db, sender, recipient):
+    pass
+
+
+async def in_conversation(db, sender, recipient):
+    await db.conversations.insert_one({"_id": server.conversation_key(sender, recipient)})
+
+
+async def connected(db, sender, recipient):
+    await db.connections.insert_one({"userId": sender, "otherId": recipient})
+
+
+def test_typing_is_not_forwarded_to_strangers(db):
+    assert typing_events_received(db, strangers) == []
+
+
+@pytest.mark.parametrize("setup", [in_conversation, connected])
+def test_typing_is_forwarded_within_a_conversation_or_connection(db, setup):
+    [event] = typing_events_received(db, setup)
+    assert (event["type"], event["isTyping"]) == ("typing", True)
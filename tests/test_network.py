@@ -0,0 +1,94 @@
+"""
+Network endpoint tests against an in-memory MongoDB (mongomock-motor).
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException, Response
+from mongomock_motor import AsyncMongoMockClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+import server  # noqa: E402
+
+
+@pytest.fixture
+def db(monkeypatch):
+    database = AsyncMongoMockClient()["test"]
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server, "user_cache", server.TTLCache(max_size=100, ttl=60))
+    return database
+
+
+async def add_user(db, username: str) -> str:
+    result = await db.users.insert_one({
+        "username": username, "email": f"{username}@example.com", "isPublic": True, "currentCourtId": None
+    })
+    return str(result.inserted_id)
+
+
+def bearer(user_id: str) -> str:
+    return "Bearer " + server.create_access_token({"user_id": user_id})
+
+
+def test_recent_players_without_history_pages_through_public_users(db):
+    async def run():
+        me = await add_user(db, "me")
+        others = sorted([await add_user(db, f"player{index}") for index in range(3)])
+        first_page = Response()
+        first = await server.get_recent_players(first_page, None, 2, bearer(me))
+        cursor = first_page.headers[server.NEXT_CURSOR_HEADER]
+        second = await server.get_recent_players(Response(), cursor, 2, bearer(me))
+        return others, first, second
+
+    others, first, second = asyncio.run(run())
+    assert first.status_code == second.status_code == 200
+    assert [user_id in first.body.decode() for user_id in others] == [True, True, False]
+    assert others[2] in second.body.decode()
+
+
+@pytest.mark.parametrize("cursor", ["garbage", server.encode_cursor("not-an-object-id")])
+def test_recent_players_rejects_a_bad_cursor(db, cursor):
+    async def run():
+        me = await add_user(db, "me")
+        await server.get_recent_players(Response(), cursor, 2, bearer(me))
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(run())
+    assert error.value.status_code == 400
+
+
+def status_of(coroutine) -> int:
+    try:
+        asyncio.run(coroutine)
+    except HTTPException as error:
+        return error.status_code
+    return 200
+
+
+def test_duplicate_friend_requests_are_rejected(db):
+    async def setup():
+        return await add_user(db, "me"), await add_user(db, "friend")
+
+    me, friend = asyncio.run(setup())
+    request = server.FriendRequest(toUserId=friend)
+    assert status_of(server.send_friend_request(request, bearer(me))) == 200
+    assert status_of(server.send_friend_request(request, bearer(me))) == 400
+    assert status_of(server.send_friend_request(server.FriendRequest(toUserId=me), bearer(friend))) == 400
+
+
+def test_connected_users_cannot_request_or_accept_again(db):
+    async def setup():
+        me, friend = await add_user(db, "me"), await add_user(db, "friend")
+        await server.send_friend_request(server.FriendRequest(toUserId=friend), bearer(me))
+        friend_request = await db.friend_requests.find_one({})
+        await server.accept_friend_request(str(friend_request["_id"]), bearer(friend))
+        return me, friend, str(friend_request["_id"])
+
+    me, friend, request_id = asyncio.run(setup())
+    assert status_of(server.send_friend_request(server.FriendRequest(toUserId=friend), bearer(me))) == 400
+    assert status_of(server.accept_friend_request(request_id, bearer(friend))) == 400
+    assert status_of(server.accept_friend_request(str(ObjectId()), bearer(friend))) == 404
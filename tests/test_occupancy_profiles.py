@@ -0,0 +1,170 @@
+"""
+Occupancy history rollup tests.
+"""
+import asyncio
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pytest
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+import scoring  # noqa: E402
+import server  # noqa: E402
+
+MONDAY = datetime(2026, 10, 12)
+
+
+def bucket(hour, players, changes):
+    """A bucket whose changes are (minute, new count); playerSeconds as the update pipeline accrues it"""
+    player_seconds = 0.0
+    for (minute, count), (next_minute, _) in zip(changes, changes[1:]):
+        player_seconds += count * (next_minute - minute) * 60
+    return {
+        "hour": hour,
+        "players": players,
+        "playerSeconds": player_seconds,
+        "firstAt": hour + timedelta(minutes=changes[0][0]),
+        "updatedAt": hour + timedelta(minutes=changes[-1][0]),
+    }
+
+
+def test_bucket_average_is_time_weighted():
+    hour = MONDAY.replace(hour=18)
+    # 2 players carried in, 4 from :15, 0 from :45
+    average = server.bucket_average_players(bucket(hour, 0, [(15, 4), (45, 0)]), opening_players=2)
+    assert average == pytest.approx((2 * 15 + 4 * 30 + 0 * 15) / 60)
+
+
+def test_profile_carries_counts_through_hours_without_changes():
+    buckets = [
+        bucket(MONDAY.replace(hour=17), 6, [(0, 6)]),
+        bucket(MONDAY.replace(hour=20), 0, [(30, 0)]),
+    ]
+    profile = server.occupancy_profile(buckets, MONDAY + timedelta(days=1))
+    expected = profile["expectedPlayers"]
+    assert len(expected) == server.HOURS_PER_WEEK
+    assert expected[17:22] == [6.0, 6.0, 6.0, 3.0, 0.0]
+    assert profile["weeksObserved"] == pytest.approx(7 / 168, abs=0.01)
+
+
+def test_profile_carries_the_count_from_before_the_window():
+    buckets = [bucket(MONDAY.replace(hour=3), 0, [(30, 0)])]
+    profile = server.occupancy_profile(buckets, MONDAY + timedelta(days=1), MONDAY, opening_players=4)
+    expected = profile["expectedPlayers"]
+    assert expected[0:5] == [4.0, 4.0, 4.0, 2.0, 0.0]
+    assert profile["weeksObserved"] == pytest.approx(24 / 168, abs=0.01)
+
+
+def test_profile_build_seeds_each_court_from_its_last_bucket_before_the_window(monkeypatch):
+    database = AsyncMongoMockClient()["test"]
+    monkeypatch.setattr(server, "db", database)
+    end = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    start = end - timedelta(weeks=server.COURT_PROFILE_WEEKS)
+    carried_court, new_court = ObjectId(), ObjectId()
+
+    async def run():
+        await database.court_occupancy.insert_many([
+            {"courtId": carried_court, **bucket(start - timedelta(hours=5), 2, [(0, 2)])},
+            {"courtId": carried_court, **bucket(start - timedelta(hours=2), 6, [(10, 6)])},
+            {"courtId": carried_court, **bucket(start + timedelta(hours=2), 0, [(0, 0)])},
+            {"courtId": new_court, **bucket(start + timedelta(hours=2), 3, [(0, 3)])},
+        ])
+        assert await server.build_court_profiles() == 2
+        return {
+            profile["_id"]: profile
+            async for profile in database.court_profiles.find({}, server.COURT_PROFILE_PROJECTION)
+        }
+
+    profiles = asyncio.run(run())
+    first_slot = server.weekly_slot(start)
+    carried = profiles[carried_court]["expectedPlayers"]
+    # 6 players in the window's first two hours, averaged with the later weeks' empty court
+    assert carried[first_slot] == pytest.approx(6 / server.COURT_PROFILE_WEEKS, abs=0.01)
+    assert carried[(first_slot + 1) % server.HOURS_PER_WEEK] == pytest.approx(6 / server.COURT_PROFILE_WEEKS, abs=0.01)
+    assert carried[(first_slot + 2) % server.HOURS_PER_WEEK] == 0.0
+    assert profiles[carried_court]["weeksObserved"] == pytest.approx(server.COURT_PROFILE_WEEKS)
+    # A court first seen inside the window is only profiled from its first bucket
+    assert profiles[new_court]["weeksObserved"] < server.COURT_PROFILE_WEEKS
+
+
+def test_profile_averages_the_same_hour_across_weeks():
+    buckets = [
+        bucket(MONDAY.replace(hour=18), 0, [(0, 8), (30, 0)]),
+        bucket(MONDAY.replace(hour=18) + timedelta(weeks=1), 0, [(0, 4), (30, 0)]),
+    ]
+    profile = server.occupancy_profile(buckets, MONDAY + timedelta(weeks=2))
+    assert profile["expectedPlayers"][18] == pytest.approx((4 + 2) / 2)
+    assert profile["expectedPlayers"][19] == 0.0
+
+
+def test_expected_players_read_the_profile_at_the_utc_hour():
+    court_id = ObjectId()
+    expected = [0.0] * server.HOURS_PER_WEEK
+    expected[18] = 9.0  # Monday 18:00 UTC
+    profiles = {court_id: (np.array(expected), scoring.PROFILE_FULL_WEIGHT_WEEKS)}
+    local_now = MONDAY.replace(hour=13)  # the same moment on a UTC-5 server
+
+    players = server.expected_players_at(
+        [court_id], np.array([12.0]), profiles, local_now, MONDAY.replace(hour=18)
+    )
+    assert players[0] == pytest.approx(9.0)
+
+
+def test_occupancy_is_published_when_the_history_write_fails(monkeypatch):
+    court_id = ObjectId()
+    published = []
+
+    async def fail(*args):
+        raise RuntimeError("history write failed")
+
+    async def publish(topic, event):
+        published.append(event)
+
+    monkeypatch.setattr(server, "record_occupancy_history", fail)
+    monkeypatch.setattr(server.realtime, "publish", publish)
+    monkeypatch.setattr(server, "court_events_source", "local")
+    asyncio.run(server.publish_court_occupancy(court_id, 3, 1))
+    assert published == [{"type": "occupancy", "courtId": str(court_id), "currentPlayers": 3}]
+
+
+def test_history_keeps_the_newest_count_when_writes_land_out_of_order(monkeypatch):
+    database = AsyncMongoMockClient()["test"]
+    monkeypatch.setattr(server, "db", database)
+    court_id = ObjectId()
+
+    async def run():
+        await server.record_occupancy_history(court_id, 2, 1)
+        # Two check-ins: the second court update (version 3, 4 players) is recorded first
+        await server.record_occupancy_history(court_id, 4, 3)
+        await server.record_occupancy_history(court_id, 3, 2)
+        return await database.court_occupancy.find_one({"courtId": court_id}, server.COURT_OCCUPANCY_PROJECTION)
+
+    bucket = asyncio.run(run())
+    assert bucket["players"] == 4
+    assert bucket["playerSeconds"] >= 0
+
+
+def test_check_ins_version_the_court_count(monkeypatch):
+    database = AsyncMongoMockClient()["test"]
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server, "court_events_source", "changestream")
+    versions = []
+
+    async def record(court_id, current_players, version):
+        versions.append((current_players, version))
+
+    monkeypatch.setattr(server, "record_occupancy_history", record)
+
+    async def run():
+        court_id = (await database.courts.insert_one({"publicUsersAtCourt": []})).inserted_id
+        await server.join_court(court_id, "a")
+        await server.join_court(court_id, "b")
+        await server.leave_court(court_id, "a")
+
+    asyncio.run(run())
+    assert versions == [(1, 1), (2, 2), (1, 3)]
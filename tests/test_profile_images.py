@@ -0,0 +1,110 @@
+"""
+Profile image tests against an in-memory MongoDB (mongomock-motor) and a filesystem image store.
+"""
+import asyncio
+import base64
+import io
+import sys
+from pathlib import Path
+
+import pytest
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+import server  # noqa: E402
+from images import FileSystemImageStore  # noqa: E402
+
+BASE_URL = "https://api.example.com"
+
+
+@pytest.fixture
+def db(monkeypatch, tmp_path):
+    database = AsyncMongoMockClient()["test"]
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server, "user_cache", server.TTLCache(max_size=100, ttl=60))
+    monkeypatch.setattr(server, "image_store", FileSystemImageStore(str(tmp_path)))
+    monkeypatch.setattr(server, "IMAGE_BASE_URL", BASE_URL)
+    return database
+
+
+def png_data_url() -> str:
+    output = io.BytesIO()
+    Image.new("RGB", (32, 32), (200, 80, 20)).save(output, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(output.getvalue()).decode()
+
+
+async def add_user(db) -> str:
+    result = await db.users.insert_one({"username": "player", "email": "player@example.com", "isPublic": True})
+    return str(result.inserted_id)
+
+
+def bearer(user_id: str) -> str:
+    return "Bearer " + server.create_access_token({"user_id": user_id})
+
+
+async def stored_image(db, user_id: str):
+    user = await db.users.find_one({"_id": ObjectId(user_id)}, {"profilePic": 1, "profileImageId": 1})
+    image_id = user.get("profileImageId")
+    data = await server.image_store.get(f"{image_id}/medium") if image_id else None
+    return user.get("profilePic"), image_id, data is not None
+
+
+def test_uploaded_profile_image_url_is_absolute(db):
+    async def run():
+        user_id = await add_user(db)
+        profile = await server.update_profile(server.UserUpdate(profilePic=png_data_url()), bearer(user_id))
+        return profile, await stored_image(db, user_id)
+
+    profile, (profile_pic, image_id, stored) = asyncio.run(run())
+    assert profile["profilePic"] == profile_pic == f"{BASE_URL}/api/images/{image_id}/medium"
+    assert stored
+
+
+@pytest.mark.parametrize("resubmitted", ["same URL", "other size", "other base URL"])
+def test_resubmitting_the_current_image_url_keeps_the_image(db, resubmitted):
+    async def run():
+        user_id = await add_user(db)
+        profile = await server.update_profile(server.UserUpdate(profilePic=png_data_url()), bearer(user_id))
+        before = await stored_image(db, user_id)
+        url = {
+            "same URL": profile["profilePic"],
+            "other size": profile["profilePic"].replace("/medium", "/small"),
+            "other base URL": profile["profilePic"].replace(BASE_URL, "http://localhost:8001"),
+        }[resubmitted]
+        await server.update_profile(server.UserUpdate(profilePic=url, username="renamed"), bearer(user_id))
+        return before, await stored_image(db, user_id)
+
+    before, after = asyncio.run(run())
+    assert after == before
+    assert after[2]
+
+
+def test_replacing_the_image_deletes_the_previous_one(db):
+    async def run():
+        user_id = await add_user(db)
+        await server.update_profile(server.UserUpdate(profilePic=png_data_url()), bearer(user_id))
+        _, previous_id, _ = await stored_image(db, user_id)
+        await server.update_profile(server.UserUpdate(profilePic="https://cdn.example.com/avatar.png"), bearer(user_id))
+        return await stored_image(db, user_id), await server.image_store.get(f"{previous_id}/medium")
+
+    (profile_pic, image_id, _), previous = asyncio.run(run())
+    assert (profile_pic, image_id, previous) == ("https://cdn.example.com/avatar.png", None, None)
+
+
+def test_relative_profile_image_urls_are_made_absolute(db):
+    async def run():
+        relative, external = ObjectId(), ObjectId()
+        await db.users.insert_many([
+            {"_id": relative, "profilePic": "/api/images/abc/medium"},
+            {"_id": external, "profilePic": "https://cdn.example.com/avatar.png"},
+        ])
+        await server.migrate_relative_profile_image_urls()
+        users = await db.users.find({}, {"profilePic": 1}).to_list(None)
+        return {user["_id"]: user["profilePic"] for user in users}, relative, external
+
+    pictures, relative, external = asyncio.run(run())
+    assert pictures[relative] == f"{BASE_URL}/api/images/abc/medium"
+    assert pictures[external] == "https://cdn.example.com/avatar.png"
@@ -0,0 +1,107 @@
+"""
+Static checks on the MongoDB reads in backend/server.py: every read passes a
+field projection, and only login can read the password hash.
+"""
+import ast
+from pathlib import Path
+
+SERVER_PATH = Path(__file__).resolve().parents[1] / "backend" / "server.py"
+READ_METHODS = {"find", "find_one", "find_one_and_update", "find_one_and_replace", "find_one_and_delete"}
+PASSWORD_READERS = {"login"}
+
+
+def load_module():
+    return ast.parse(SERVER_PATH.read_text())
+
+
+def module_constants(tree) -> dict:
+    constants = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            constants[node.targets[0].id] = node.value
+    return constants
+
+
+def db_reads(tree):
+    """(enclosing function, collection, method, projection node) for each db.<collection>.<read>() call"""
+    reads = []
+
+    def visit(node, function):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            function = node.name
+        if (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Attribute)
+            and node.func.attr in READ_METHODS
+            and isinstance(node.func.value, ast.Attribute)
+            and isinstance(node.func.value.value, ast.Name)
+            and node.func.value.value.id == "db"
+        ):
+            projection = node.args[1] if len(node.args) > 1 else None
+            for keyword in node.keywords:
+                if keyword.arg == "projection":
+                    projection = keyword.value
+            reads.append((function, node.func.value.attr, node.func.attr, projection, node.lineno))
+        for child in ast.iter_child_nodes(node):
+            visit(child, function)
+
+    visit(tree, None)
+    return reads
+
+
+def resolve_projection(node, constants) -> dict:
+    if isinstance(node, ast.Name):
+        return resolve_projection(constants[node.id], constants)
+    assert isinstance(node, ast.Dict), f"Unsupported projection expression at line {node.lineno}"
+    projection = {}
+    for key, value in zip(node.keys, node.values):
+        if key is None:
+            projection.update(resolve_projection(value, constants))
+        else:
+            try:
+                projection[ast.literal_eval(key)] = ast.literal_eval(value)
+            except ValueError:
+                projection[ast.literal_eval(key)] = True
+    return projection
+
+
+def reads_password(projection: dict) -> bool:
+    included = {field for field, value in projection.items() if value}
+    if included:
+        return "password" in included
+    # Exclusion projection: everything not explicitly excluded is returned
+    return projection.get("password", True) not in (0, False)
+
+
+def test_every_read_has_a_projection():
+    missing = [
+        f"line {lineno}: db.{collection}.{method} in {function}"
+        for function, collection, method, projection, lineno in db_reads(load_module())
+        if projection is None
+    ]
+    assert not missing, "Reads without a projection:\n" + "\n".join(missing)
+
+
+def test_password_is_only_read_by_login():
+    tree = load_module()
+    constants = module_constants(tree)
+    offenders = [
+        f"line {lineno}: db.users.{method} in {function}"
+        for function, collection, method, projection, lineno in db_reads(tree)
+        if collection == "users"
+        and function not in PASSWORD_READERS
+        and projection is not None
+        and reads_password(resolve_projection(projection, constants))
+    ]
+    assert not offenders, "Handlers reading the password hash:\n" + "\n".join(offenders)
+
+
+def test_login_reads_password():
+    tree = load_module()
+    constants = module_constants(tree)
+    login_reads = [
+        resolve_projection(projection, constants)
+        for function, collection, method, projection, lineno in db_reads(tree)
+        if function == "login" and collection == "users"
+    ]
+    assert login_reads and all(reads_password(projection) for projection in login_reads)
@@ -0,0 +1,127 @@
+"""
+Recommendation result cache tests (no network or database needed).
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+from bson import ObjectId
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+import server  # noqa: E402
+
+HOUSTON_COURT = ObjectId()
+DALLAS_COURT = ObjectId()
+HOUSTON_KEY = ("9vk1m", "2026-10-18 18", "Clear")
+DALLAS_KEY = ("9vg4m", "2026-10-18 18", "Clear")
+
+
+class FakeComputation:
+    def __init__(self, players: dict, delay: float = 0.0):
+        self.players = players
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return {"recommendedCourtId": str(next(iter(self.players))), "call": self.calls}, dict(self.players)
+
+
+def make_cache():
+    return server.RecommendationCache(ttl=60, max_entries=10, invalidate_players=3)
+
+
+def test_repeated_key_is_computed_once():
+    cache = make_cache()
+    compute = FakeComputation({HOUSTON_COURT: 4})
+
+    async def run():
+        return [await cache.get(HOUSTON_KEY, compute) for _ in range(3)]
+
+    results = asyncio.run(run())
+    assert compute.calls == 1
+    assert all(result == results[0] for result in results)
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 1)
+    assert stats["computeLatency"]["count"] == 1
+
+
+def test_concurrent_requests_for_a_key_share_one_computation():
+    cache = make_cache()
+    compute = FakeComputation({HOUSTON_COURT: 4}, delay=0.05)
+
+    async def run():
+        return await asyncio.gather(*[cache.get(HOUSTON_KEY, compute) for _ in range(10)])
+
+    results = asyncio.run(run())
+    assert compute.calls == 1
+    assert all(result == results[0] for result in results)
+    assert cache.stats()["coalesced"] == 9
+
+
+def test_significant_occupancy_change_invalidates_only_affected_results():
+    cache = make_cache()
+    houston = FakeComputation({HOUSTON_COURT: 4})
+    dallas = FakeComputation({DALLAS_COURT: 2})
+
+    async def run():
+        await cache.get(HOUSTON_KEY, houston)
+        await cache.get(DALLAS_KEY, dallas)
+        cache.record_occupancy(HOUSTON_COURT, 5)  # small change: still cached
+        await cache.get(HOUSTON_KEY, houston)
+        cache.record_occupancy(HOUSTON_COURT, 7)
+        await cache.get(HOUSTON_KEY, houston)
+        await cache.get(DALLAS_KEY, dallas)
+
+    asyncio.run(run())
+    assert houston.calls == 2
+    assert dallas.calls == 1
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_expired_results_are_not_invalidated():
+    cache = server.RecommendationCache(ttl=0.05, max_entries=10, invalidate_players=3)
+    compute = FakeComputation({HOUSTON_COURT: 4})
+
+    async def run():
+        await cache.get(HOUSTON_KEY, compute)
+        await asyncio.sleep(0.1)
+        cache.record_occupancy(HOUSTON_COURT, 9)
+
+    asyncio.run(run())
+    assert cache.stats()["invalidations"] == 0
+
+
+def test_occupancy_change_only_visits_results_that_scored_the_court():
+    cache = make_cache()
+    houston = FakeComputation({HOUSTON_COURT: 4})
+    dallas = FakeComputation({DALLAS_COURT: 2})
+
+    async def run():
+        await cache.get(HOUSTON_KEY, houston)
+        await cache.get(DALLAS_KEY, dallas)
+
+    asyncio.run(run())
+    assert cache.keys_by_court == {HOUSTON_COURT: {HOUSTON_KEY}, DALLAS_COURT: {DALLAS_KEY}}
+    cache.record_occupancy(ObjectId(), 50)  # a court no cached result scored
+    cache.record_occupancy(HOUSTON_COURT, 9)
+    assert HOUSTON_COURT not in cache.keys_by_court
+    assert cache.keys_by_court == {DALLAS_COURT: {DALLAS_KEY}}
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_index_forgets_expired_results():
+    cache = server.RecommendationCache(ttl=0.05, max_entries=3, invalidate_players=3)
+    courts = [ObjectId() for _ in range(3)]
+
+    async def run():
+        for index, court_id in enumerate(courts):
+            if index == 2:
+                await asyncio.sleep(0.1)  # the first two results expire
+            await cache.get((f"cell{index}", "2026-10-18 18", "Clear"), FakeComputation({court_id: 4}))
+
+    asyncio.run(run())
+    # Rebuilt on the max_entries-th store: only the live result is indexed
+    assert cache.keys_by_court == {courts[2]: {("cell2", "2026-10-18 18", "Clear")}}
@@ -0,0 +1,98 @@
+"""
+Court scoring engine tests (pure NumPy, no database needed).
+"""
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+import scoring  # noqa: E402
+
+
+def court(name, latitude, longitude, rating=4.0, average_players=12):
+    return {"_id": name, "name": name, "latitude": latitude, "longitude": longitude,
+            "rating": rating, "averagePlayers": average_players}
+
+
+def score(index, current=None, expected=None, latitude=None, longitude=None, condition=None, temperature=None):
+    current = np.zeros(len(index)) if current is None else np.asarray(current, dtype=float)
+    expected = index.average_players if expected is None else np.asarray(expected, dtype=float)
+    return index.score(current, expected, latitude, longitude, condition, temperature)
+
+
+def test_nearer_court_wins_when_everything_else_is_equal():
+    index = scoring.CourtScoringIndex([court("far", 30.5, -95.3), court("near", 29.76, -95.36)])
+    factors = score(index, latitude=29.76, longitude=-95.36)
+    assert [index.ids[i] for i in scoring.top_k(factors["score"], 2)] == ["near", "far"]
+    assert factors["distanceKm"][1] < 0.01
+    assert 80 < factors["distanceKm"][0] < 90
+
+
+def test_bad_weather_favours_indoor_courts():
+    index = scoring.CourtScoringIndex([court("Emancipation Park", 29.7, -95.3), court("Downtown YMCA", 29.7, -95.3)])
+    assert index.indoor.tolist() == [False, True]
+    clear = score(index, condition="Clear", temperature=75)["score"]
+    rain = score(index, condition="Rain", temperature=60)["score"]
+    assert clear[0] > clear[1]
+    assert rain[1] > rain[0]
+
+
+def test_players_on_court_outweigh_a_small_rating_gap():
+    index = scoring.CourtScoringIndex([court("empty", 29.7, -95.3, rating=4.5), court("busy", 29.7, -95.3, rating=4.0)])
+    factors = score(index, current=[0, 8])
+    assert scoring.top_k(factors["score"], 1).tolist() == [1]
+    assert factors["distanceKm"] is None
+
+
+def test_activity_prior_follows_weekday_and_hour():
+    assert scoring.activity_prior(datetime(2026, 10, 14, 19)) == 1.0  # Wednesday evening peak
+    assert scoring.activity_prior(datetime(2026, 10, 14, 3)) < 0.05
+    assert scoring.activity_prior(datetime(2026, 10, 17, 12)) > scoring.activity_prior(datetime(2026, 10, 14, 12))
+
+
+def test_top_k_is_sorted_and_bounded():
+    scores = np.array([0.1, 0.9, 0.5, 0.7, 0.3])
+    assert scoring.top_k(scores, 3).tolist() == [1, 3, 2]
+    assert scoring.top_k(scores, 10).tolist() == [1, 3, 2, 4, 0]
+    assert scoring.top_k(scores, 0).tolist() == []
+
+
+def test_candidates_are_the_nearest_courts_within_the_radius():
+    index = scoring.CourtScoringIndex([
+        court("downtown", 29.76, -95.37), court("galleria", 29.74, -95.46),
+        court("katy", 29.79, -95.82), court("dallas", 32.78, -96.80), court("seattle", 47.61, -122.33),
+    ])
+    assert [index.ids[i] for i in index.candidates(29.76, -95.37, 50, 10)] == ["downtown", "galleria", "katy"]
+    assert [index.ids[i] for i in index.candidates(29.76, -95.37, 50, 2)] == ["downtown", "galleria"]
+    assert [index.ids[i] for i in index.candidates(29.76, -95.37, 20, 10)] == ["downtown", "galleria"]
+
+
+def test_candidates_fall_back_to_nearest_courts_when_none_in_range():
+    index = scoring.CourtScoringIndex([court("dallas", 32.78, -96.80), court("seattle", 47.61, -122.33)])
+    assert [index.ids[i] for i in index.candidates(39.5, -116.5, 50, 1)] == ["seattle"]
+
+
+def test_candidate_cells_wrap_around_the_antimeridian():
+    index = scoring.CourtScoringIndex([court("east", 0.0, 179.95), court("west", 0.0, -179.95)])
+    assert sorted(index.ids[i] for i in index.candidates(0.0, 179.99, 30, 10)) == ["east", "west"]
+
+
+def test_scoring_a_subset_matches_scoring_everything():
+    index = scoring.CourtScoringIndex([court(f"c{i}", 29.7 + i * 0.05, -95.3, rating=3 + i % 3) for i in range(6)])
+    current = np.arange(6, dtype=float)
+    full = score(index, current=current, latitude=29.7, longitude=-95.3)
+    subset = np.array([4, 1, 2])
+    partial = index.score(current[subset], index.average_players[subset], 29.7, -95.3, None, None, subset)
+    assert np.allclose(partial["score"], full["score"][subset])
+    assert np.allclose(partial["distanceKm"], full["distanceKm"][subset])
+
+
+def test_learned_profile_takes_over_as_history_accumulates():
+    prior = np.array([10.0, 10.0, 10.0])
+    learned = np.array([2.0, 2.0, 2.0])
+    blended = scoring.blend_expected_players(prior, learned, np.array([0.0, 2.0, 12.0]))
+    assert blended.tolist() == [10.0, 6.0, 2.0]
+    assert scoring.weekly_slot(datetime(2026, 10, 18, 13)) == 6 * 24 + 13  # Sunday
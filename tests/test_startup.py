@@ -0,0 +1,66 @@
+"""
+Startup smoke test against an in-memory MongoDB (mongomock-motor).
+"""
+import asyncio
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+import server  # noqa: E402
+
+BACKGROUND_TASKS = ("index_build_task", "checkin_sweeper_task", "weather_prefetch_task", "court_profile_task")
+
+
+@pytest.fixture
+def app_state(monkeypatch, tmp_path):
+    client = AsyncMongoMockClient()
+    database = client["test"]
+
+    async def command(name, *args, **kwargs):
+        return {"ok": 1.0}  # standalone server: no setName, so change streams stay off
+
+    monkeypatch.setattr(database, "command", command, raising=False)
+    monkeypatch.setattr(server, "client", client)
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server, "password_executor", ThreadPoolExecutor(max_workers=1))
+    monkeypatch.setattr(server, "http_clients", server.HttpClientRegistry(server.HTTP_UPSTREAMS))
+    monkeypatch.setattr(server.youtube_cache, "path", tmp_path / "youtube_cache.json")
+    monkeypatch.setattr(server, "IMAGE_BASE_URL", "https://api.example.com")
+    for name in BACKGROUND_TASKS + ("court_change_stream_task",):
+        monkeypatch.setattr(server, name, None)
+    # The seeding tasks started alongside are not under test
+    for name in ("initialize_courts_background", "initialize_messaging_background",
+                 "initialize_network_background", "initialize_users_background"):
+        monkeypatch.setattr(server, name, lambda: asyncio.sleep(0))
+
+
+def test_startup_creates_background_tasks_and_shutdown_cancels_them(app_state, caplog):
+    async def run():
+        await server.startup_event()
+        tasks = {name: getattr(server, name) for name in BACKGROUND_TASKS}
+        running = {name: not task.done() for name, task in tasks.items() if task}
+        await server.shutdown_db_client()
+        await asyncio.sleep(0)
+        return tasks, running
+
+    with caplog.at_level(logging.INFO):
+        tasks, running = asyncio.run(run())
+    assert not [record.message for record in caplog.records if record.levelno >= logging.ERROR]
+    assert all(isinstance(task, asyncio.Task) for task in tasks.values()), tasks
+    assert running == {name: True for name in BACKGROUND_TASKS}
+    assert all(task.cancelled() for task in tasks.values())
+    assert server.court_change_stream_task is None
+
+
+@pytest.mark.parametrize("base_url", ["", "/images", "api.example.com"])
+def test_startup_refuses_a_missing_or_relative_image_base_url(app_state, monkeypatch, base_url):
+    monkeypatch.setattr(server, "IMAGE_BASE_URL", base_url)
+    with pytest.raises(RuntimeError, match="IMAGE_BASE_URL"):
+        asyncio.run(server.startup_event())
+    assert all(getattr(server, name) is None for name in BACKGROUND_TASKS)
@@ -0,0 +1,101 @@
+"""
+Outbound HTTP client circuit breaker tests (no network needed).
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+import server  # noqa: E402
+
+URL = "http://upstream.test/data"
+
+
+class FakeUpstream:
+    """MockTransport handler whose behaviour each test switches between calls"""
+    def __init__(self):
+        self.mode = "ok"
+        self.calls = 0
+
+    async def __call__(self, request):
+        self.calls += 1
+        if self.mode == "down":
+            raise httpx.ConnectError("connection refused", request=request)
+        if self.mode == "broken":
+            raise ValueError("malformed upstream response")
+        if self.mode == "slow":
+            await asyncio.sleep(10)
+        return httpx.Response(200, json={"ok": True})
+
+
+def make_client(fake: FakeUpstream) -> server.UpstreamClient:
+    upstream = server.UpstreamClient("test", timeout=1.0, max_connections=2, retries=0)
+    upstream.client = httpx.AsyncClient(transport=httpx.MockTransport(fake))
+    upstream.breaker = server.CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    return upstream
+
+
+async def open_circuit(upstream: server.UpstreamClient, fake: FakeUpstream):
+    fake.mode = "down"
+    with pytest.raises(httpx.ConnectError):
+        await upstream.request("GET", URL)
+    assert upstream.breaker.state == "open"
+    await asyncio.sleep(0.06)
+
+
+def test_trial_failing_with_a_non_transport_error_releases_the_circuit():
+    fake = FakeUpstream()
+    upstream = make_client(fake)
+
+    async def run():
+        await open_circuit(upstream, fake)
+        fake.mode = "broken"
+        with pytest.raises(ValueError):
+            await upstream.request("GET", URL)
+        fake.mode = "ok"
+        return await upstream.request("GET", URL)
+
+    response = asyncio.run(run())
+    assert response.status_code == 200
+    assert upstream.breaker.state == "closed"
+
+
+def test_cancelled_trial_releases_the_circuit():
+    fake = FakeUpstream()
+    upstream = make_client(fake)
+
+    async def run():
+        await open_circuit(upstream, fake)
+        fake.mode = "slow"
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(upstream.request("GET", URL), timeout=0.05)
+        fake.mode = "ok"
+        return await upstream.request("GET", URL)
+
+    response = asyncio.run(run())
+    assert response.status_code == 200
+    assert upstream.stats()["rejected"] == 0
+
+
+def test_only_one_trial_is_let_through_while_half_open():
+    fake = FakeUpstream()
+    upstream = make_client(fake)
+
+    async def run():
+        await open_circuit(upstream, fake)
+        fake.mode = "slow"
+        trial = asyncio.create_task(upstream.request("GET", URL))
+        await asyncio.sleep(0.01)
+        with pytest.raises(server.UpstreamUnavailable):
+            await upstream.request("GET", URL)
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+
+    asyncio.run(run())
+    assert upstream.stats()["rejected"] == 1
+    assert upstream.breaker.allow()
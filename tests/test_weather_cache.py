@@ -0,0 +1,241 @@
+"""
+Weather cache tests against a local fake OpenWeather (no network or database needed).
+"""
+import asyncio
+import json
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+BACKEND_DIR = Path(__file__).resolve().parents[1] / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+import server  # noqa: E402
+from geo import MAJOR_CITY_CENTERS, decode_geohash, encode_geohash  # noqa: E402
+from initialize_nationwide_courts import MAJOR_CITIES  # noqa: E402
+
+HOUSTON = (29.7604, -95.3698)
+NEARBY_HOUSTON = (29.7610, -95.3690)  # same precision 5 cell
+DALLAS = (32.7767, -96.7970)
+
+
+class FakeWeather:
+    """Serves OpenWeather-shaped current conditions and records every requested coordinate"""
+    def __init__(self):
+        self.calls = []
+        self.delay = 0.0
+        self.status = 200
+        self.condition = "Clear"
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                fake.calls.append((float(query["lat"][0]), float(query["lon"][0])))
+                time.sleep(fake.delay)
+                body = json.dumps({
+                    "weather": [{"main": fake.condition}],
+                    "main": {"temp": 72.5}
+                }).encode()
+                self.send_response(fake.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/data/2.5/weather"
+        threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    fake = FakeWeather()
+    monkeypatch.setattr(server, "OPENWEATHER_API_URL", fake.url)
+    monkeypatch.setenv("OPENWEATHER_API_KEY", "test-key")
+    yield fake
+    fake.close()
+
+
+@pytest.fixture
+def run_async(monkeypatch):
+    """Runs a coroutine function on a fresh event loop with its own outbound HTTP clients"""
+    def run(coroutine_function):
+        async def main():
+            registry = server.HttpClientRegistry(server.HTTP_UPSTREAMS)
+            monkeypatch.setattr(server, "http_clients", registry)
+            try:
+                return await coroutine_function()
+            finally:
+                await registry.close()
+
+        return asyncio.run(main())
+
+    return run
+
+
+def make_cache(bucket_seconds=600.0, max_entries=100):
+    return server.WeatherCache(server.WEATHER_CACHE_PRECISION, bucket_seconds, max_entries)
+
+
+def test_nearby_lookups_share_one_upstream_call_at_the_cell_center(upstream, run_async):
+    async def run():
+        cache = make_cache()
+        first = await cache.get(*HOUSTON, server.fetch_openweather)
+        second = await cache.get(*NEARBY_HOUSTON, server.fetch_openweather)
+        return cache, first, second
+
+    cache, first, second = run_async(run)
+    assert first == second == {"condition": "Clear", "temperature": 72.5}
+    cell = encode_geohash(*HOUSTON, server.WEATHER_CACHE_PRECISION)
+    assert upstream.calls == [pytest.approx(decode_geohash(cell))]
+    assert cache.stats()["hits"] == 1
+
+
+def test_concurrent_misses_for_a_cell_are_coalesced(upstream, run_async):
+    upstream.delay = 0.2
+
+    async def run():
+        cache = make_cache()
+        return cache, await asyncio.gather(*[
+            cache.get(*HOUSTON, server.fetch_openweather) for _ in range(10)
+        ])
+
+    cache, results = run_async(run)
+    assert len(upstream.calls) == 1
+    assert all(result == results[0] for result in results)
+    assert cache.stats()["coalesced"] == 9
+
+
+def test_new_time_bucket_fetches_again(upstream, run_async):
+    async def run():
+        cache = make_cache(bucket_seconds=0.2)
+        before = await cache.get(*HOUSTON, server.fetch_openweather)
+        await asyncio.sleep(cache.seconds_until_next_bucket() + 0.01)
+        upstream.condition = "Rain"
+        after = await cache.get(*HOUSTON, server.fetch_openweather)
+        return before, after
+
+    before, after = run_async(run)
+    assert (before["condition"], after["condition"]) == ("Clear", "Rain")
+    assert len(upstream.calls) == 2
+
+
+def test_previous_bucket_is_served_when_upstream_fails(upstream, run_async):
+    async def run():
+        cache = make_cache(bucket_seconds=0.2)
+        await cache.get(*HOUSTON, server.fetch_openweather)
+        await asyncio.sleep(cache.seconds_until_next_bucket() + 0.01)
+        upstream.status = 500
+        return cache, await cache.get(*HOUSTON, server.fetch_openweather)
+
+    cache, weather = run_async(run)
+    assert weather["condition"] == "Clear"
+    assert cache.stats()["staleServed"] == 1
+    assert cache.stats()["upstreamErrors"] >= 1
+
+
+def test_current_weather_is_none_when_upstream_fails_without_cached_conditions(upstream, run_async, monkeypatch):
+    upstream.status = 500
+    monkeypatch.setattr(server, "weather_cache", make_cache())
+
+    async def run():
+        return await server.fetch_current_weather(*HOUSTON)
+
+    assert run_async(run) is None
+
+
+def test_prefetch_warms_city_cells(upstream, run_async):
+    cells = [encode_geohash(*HOUSTON, server.WEATHER_CACHE_PRECISION), encode_geohash(*DALLAS, server.WEATHER_CACHE_PRECISION)]
+
+    async def run():
+        cache = make_cache()
+        fetched = await cache.prefetch(cells, server.fetch_openweather, concurrency=2)
+        again = await cache.prefetch(cells, server.fetch_openweather, concurrency=2)
+        await cache.get(*NEARBY_HOUSTON, server.fetch_openweather)
+        await cache.get(*DALLAS, server.fetch_openweather)
+        return cache, fetched, again
+
+    cache, fetched, again = run_async(run)
+    assert (fetched, again) == (2, 0)
+    assert len(upstream.calls) == 2
+    assert cache.stats()["hits"] == 2
+
+
+def test_one_cell_is_prefetched_per_major_city():
+    assert len(server.WEATHER_PREFETCH_CELLS) == len(MAJOR_CITIES)
+
+
+def test_city_centers_match_the_seed_data():
+    assert MAJOR_CITY_CENTERS == {name: city["coords"][0] for name, city in MAJOR_CITIES.items()}
+
+
+def test_server_does_not_import_the_seeding_script():
+    code = "import sys, server; assert 'initialize_nationwide_courts' not in sys.modules"
+    subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, check=True)
+
+
+def test_lease_is_held_by_one_worker_until_it_expires(monkeypatch):
+    monkeypatch.setattr(server, "db", AsyncMongoMockClient()["test"])
+
+    async def acquire(worker_id, seconds):
+        monkeypatch.setattr(server, "WORKER_ID", worker_id)
+        return await server.acquire_lease("job", seconds)
+
+    async def run():
+        results = [await acquire("a", 0.2), await acquire("b", 0.2), await acquire("a", 0.2)]
+        await asyncio.sleep(0.25)
+        results += [await acquire("b", 0.2), await acquire("a", 0.2)]
+        return results
+
+    assert asyncio.run(run()) == [True, False, True, True, False]
+
+
+def test_only_the_lease_holder_prefetches_and_the_others_load_its_conditions(upstream, run_async, monkeypatch):
+    cells = [encode_geohash(*HOUSTON, server.WEATHER_CACHE_PRECISION), encode_geohash(*DALLAS, server.WEATHER_CACHE_PRECISION)]
+    monkeypatch.setattr(server, "db", AsyncMongoMockClient()["test"])
+    monkeypatch.setattr(server, "WEATHER_PREFETCH_CELLS", cells)
+    monkeypatch.setattr(server, "WEATHER_PREFETCH_SHARE_DELAY_SECONDS", 0)
+    workers = {"a": make_cache(), "b": make_cache()}
+
+    async def prefetch(worker_id):
+        monkeypatch.setattr(server, "WORKER_ID", worker_id)
+        monkeypatch.setattr(server, "weather_cache", workers[worker_id])
+        return await server.prefetch_weather()
+
+    async def run():
+        counts = (await prefetch("a"), await prefetch("b"))
+        await workers["b"].get(*NEARBY_HOUSTON, server.fetch_openweather)
+        return counts
+
+    assert run_async(run) == (2, 2)
+    assert len(upstream.calls) == 2
+    assert (workers["b"].stats()["upstreamCalls"], workers["b"].stats()["hits"]) == (0, 1)
+
+
+def test_cache_is_bounded(upstream, run_async):
+    async def run():
+        cache = make_cache(max_entries=1)
+        await cache.get(*HOUSTON, server.fetch_openweather)
+        await cache.get(*DALLAS, server.fetch_openweather)
+        await cache.get(*HOUSTON, server.fetch_openweather)
+        return cache
+
+    cache = run_async(run)
+    assert cache.stats()["size"] == 1
+    assert len(upstream.calls) == 3
+
@@ -0,0 +1,190 @@
+"""
+YouTube search cache tests against a local fake upstream (no network or database needed).
+"""
+import asyncio
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+import server  # noqa: E402
+
+
+class FakeYouTube:
+    """Serves YouTube-shaped search results and records every request"""
+    def __init__(self):
+        self.calls = []
+        self.delay = 0.0
+        self.status = 200
+        self.version = 1
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)["q"][0]
+                fake.calls.append(query)
+                time.sleep(fake.delay)
+                body = json.dumps({"items": [{
+                    "id": {"videoId": f"{query}-{fake.version}"},
+                    "snippet": {
+                        "title": f"{query} v{fake.version}",
+                        "description": "",
+                        "thumbnails": {"high": {"url": "http://img/1.jpg"}},
+                        "channelTitle": "NBA",
+                        "publishedAt": "2026-01-01T00:00:00Z"
+                    }
+                }]}).encode()
+                self.send_response(fake.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/youtube/v3/search"
+        threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    fake = FakeYouTube()
+    monkeypatch.setattr(server, "YOUTUBE_API_URL", fake.url)
+    yield fake
+    fake.close()
+
+
+@pytest.fixture
+def run_async(monkeypatch):
+    """Runs a coroutine function on a fresh event loop with its own outbound HTTP clients"""
+    def run(coroutine_function):
+        async def main():
+            registry = server.HttpClientRegistry(server.HTTP_UPSTREAMS)
+            monkeypatch.setattr(server, "http_clients", registry)
+            try:
+                return await coroutine_function()
+            finally:
+                await registry.close()
+
+        return asyncio.run(main())
+
+    return run
+
+
+def make_cache(path=None, ttl=60.0, stale_ttl=60.0):
+    return server.YouTubeSearchCache(str(path) if path else None, ttl, stale_ttl, max_entries=10)
+
+
+def titles(videos):
+    return [video["title"] for video in videos]
+
+
+def test_repeated_query_is_served_from_cache(upstream, run_async):
+    async def run():
+        cache = make_cache()
+        first = await cache.get("NBA highlights", server.fetch_youtube_videos)
+        second = await cache.get("  nba   Highlights ", server.fetch_youtube_videos)
+        return cache, first, second
+
+    cache, first, second = run_async(run)
+    assert first == second
+    assert upstream.calls == ["NBA highlights"]
+    assert cache.stats()["hits"] == 1
+
+
+def test_concurrent_identical_queries_share_one_upstream_call(upstream, run_async):
+    upstream.delay = 0.2
+
+    async def run():
+        cache = make_cache()
+        return cache, await asyncio.gather(*[
+            cache.get("streetball", server.fetch_youtube_videos) for _ in range(10)
+        ])
+
+    cache, results = run_async(run)
+    assert len(upstream.calls) == 1
+    assert all(result == results[0] for result in results)
+    assert cache.stats()["coalesced"] == 9
+
+
+def test_stale_entry_is_served_while_revalidating(upstream, run_async):
+    async def run():
+        cache = make_cache(ttl=0.05, stale_ttl=60)
+        fresh = await cache.get("dunks", server.fetch_youtube_videos)
+        await asyncio.sleep(0.1)
+        upstream.version = 2
+        stale = await cache.get("dunks", server.fetch_youtube_videos)
+        await asyncio.gather(*cache.refreshes)
+        refreshed = await cache.get("dunks", server.fetch_youtube_videos)
+        return fresh, stale, refreshed
+
+    fresh, stale, refreshed = run_async(run)
+    assert titles(stale) == titles(fresh) == ["dunks v1"]
+    assert titles(refreshed) == ["dunks v2"]
+    assert len(upstream.calls) == 2
+
+
+def test_cache_survives_restart(upstream, tmp_path, run_async):
+    path = tmp_path / "youtube.json"
+
+    async def first_process():
+        await make_cache(path).get("crossovers", server.fetch_youtube_videos)
+
+    async def second_process():
+        cache = make_cache(path)
+        await cache.load()
+        return await cache.get("crossovers", server.fetch_youtube_videos)
+
+    run_async(first_process)
+    videos = run_async(second_process)
+    assert titles(videos) == ["crossovers v1"]
+    assert upstream.calls == ["crossovers"]
+
+
+def test_save_does_not_touch_another_workers_temp_file(tmp_path):
+    path = tmp_path / "youtube.json"
+    in_progress = tmp_path / "youtube.tmp"  # another worker's half-written snapshot
+    in_progress.write_text('{"partial"')
+    cache = make_cache(path)
+    cache.entries["dunks"] = {"fetchedAt": time.time(), "videos": []}
+
+    asyncio.run(cache.save())
+    assert json.loads(path.read_text()) == {"dunks": {"fetchedAt": pytest.approx(time.time(), abs=60), "videos": []}}
+    assert in_progress.read_text() == '{"partial"'
+    assert sorted(file.name for file in tmp_path.iterdir()) == ["youtube.json", "youtube.tmp"]
+
+
+def test_expired_entry_is_served_when_upstream_fails(upstream, run_async):
+    async def run():
+        cache = make_cache(ttl=0.01, stale_ttl=0.01)
+        await cache.get("buzzer beaters", server.fetch_youtube_videos)
+        await asyncio.sleep(0.05)
+        upstream.status = 403
+        return cache, await cache.get("buzzer beaters", server.fetch_youtube_videos)
+
+    cache, videos = run_async(run)
+    assert titles(videos) == ["buzzer beaters v1"]
+    assert cache.stats()["upstreamErrors"] == 1
+
+
+def test_upstream_error_without_cached_entry_raises(upstream, run_async):
+    upstream.status = 500
+
+    async def run():
+        await make_cache().get("and ones", server.fetch_youtube_videos)
+
+    with pytest.raises(server.YouTubeUpstreamError):
+        run_async(run)